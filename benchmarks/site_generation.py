@@ -0,0 +1,271 @@
+"""Benchmark the generation of a synthetic site, cold and warm.
+
+A site with the given number of pages, languages and resources is created in a
+temporary directory, and each page links to a number of other pages from its
+navigation menu. The site configuration is created and the site is generated and
+given a manifest, first with an empty temp directory (cold) and then again with the
+caches filled in (warm). The time of each step is printed, and written as JSON with
+--output, so that runs can be compared across commits with --baseline.
+
+Usage: python benchmarks/site_generation.py [options], see --help.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from pomosite import (
+    add_language,
+    add_resources,
+    create_site_config,
+    generate,
+    write_manifest_file,
+)
+from pomosite.translation import extract_translation_units, generate_dummy_translation
+
+STEPS = ["create_site_config", "add_resources", "generate", "write_manifest_file"]
+
+BASE = """<!DOCTYPE html>
+<html lang="sv">
+<head>
+    <meta charset="utf-8" />
+    {%% block title %%}<title>Sida</title>{%% endblock %%}
+    <link rel="stylesheet" href="{{ url_for('style.css') }}" />
+</head>
+<body>
+    <nav>
+        <ul>
+%(nav)s
+        </ul>
+        <a href="{{ url_for_language('sv') }}">Svenska</a>
+    </nav>
+    {%% block content %%}{%% endblock %%}
+</body>
+</html>
+"""
+
+PAGE = """{# id: "P%(n)d", endpoint: "/sida-%(n)d/" #}
+{%% extends "base.html" %%}
+{%% block title %%}<title>Sida %(n)d</title>{%% endblock %%}
+{%% block content %%}
+<h1>Rubrik nummer %(n)d</h1>
+%(paragraphs)s
+<img src="{{ url_for('bild-%(image)d.jpg') }}" alt="Bild nummer %(n)d" />
+{%% endblock %%}
+"""
+
+
+def create_site(work_dir, pages, languages, resources, nav_links):
+    """Create the templates, resources and PO files of a synthetic site.
+
+    Returns the list of (language tag, PO file path) for the translations.
+    """
+    template_dir = Path(work_dir, "templates")
+    template_dir.mkdir()
+    nav = "\n".join(
+        "            <li><a href=\"{{ url_for('P%d') }}\">Länk %d</a></li>" % (i, i)
+        for i in range(min(nav_links, pages))
+    )
+    (template_dir / "base.html").write_text(BASE % {"nav": nav}, encoding="utf-8")
+    for n in range(pages):
+        paragraphs = "\n".join(
+            "<p>Stycke %d på sidan %d, med lite mer text.</p>" % (i, n)
+            for i in range(10)
+        )
+        page = PAGE % {
+            "n": n,
+            "paragraphs": paragraphs,
+            "image": n % resources if resources else 0,
+        }
+        (template_dir / ("page-%d.html" % n)).write_text(page, encoding="utf-8")
+
+    resources_dir = Path(work_dir, "resources")
+    (resources_dir / "img").mkdir(parents=True)
+    (resources_dir / "style.css").write_text("body { margin: 0; }\n")
+    for n in range(max(resources, 1)):
+        (resources_dir / "img" / ("bild-%d.jpg" % n)).write_bytes(
+            bytes([n % 256]) * 8192
+        )
+
+    pot_file_path = str(Path(work_dir, "site.pot"))
+    po_file_path = str(Path(work_dir, "site.po"))
+    extract_translation_units(str(template_dir), pot_file_path)
+    generate_dummy_translation(pot_file_path, po_file_path)
+    po = Path(po_file_path).read_text(encoding="utf-8")
+    translations = []
+    for n in range(languages):
+        language_tag = "l%d" % n
+        # same units, different file content, so that the catalogs aren't shared.
+        path = Path(work_dir, language_tag + ".po")
+        path.write_text("# %s\n%s" % (language_tag, po), encoding="utf-8")
+        translations.append((language_tag, str(path)))
+    return translations
+
+
+def measure(timings, step, function):
+    start = time.perf_counter()
+    result = function()
+    timings[step] = time.perf_counter() - start
+    return result
+
+
+def run(work_dir, translations, output_name, generate_args):
+    """Configure and generate the site once, and return the time of each step."""
+    timings = {}
+    output_dir = str(Path(work_dir, output_name))
+    site_config = measure(
+        timings,
+        "create_site_config",
+        lambda: create_site_config(
+            str(Path(work_dir, "templates")), str(Path(work_dir, "temp"))
+        ),
+    )
+    measure(
+        timings,
+        "add_resources",
+        lambda: add_resources(str(Path(work_dir, "resources")), site_config),
+    )
+    for language_tag, po_file_path in translations:
+        add_language(language_tag, po_file_path, site_config)
+    file_list = []
+    file_digests = {}
+    measure(
+        timings,
+        "generate",
+        lambda: generate(
+            site_config,
+            output_dir,
+            file_list,
+            file_digests=file_digests,
+            **generate_args,
+        ),
+    )
+    measure(
+        timings,
+        "write_manifest_file",
+        lambda: write_manifest_file(
+            file_list,
+            output_dir,
+            str(Path(work_dir, output_name + ".txt")),
+            file_digests,
+        ),
+    )
+    timings["total"] = sum(timings.values())
+    return timings
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=str(Path(__file__).parent),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_timings(label, timings, baseline=None):
+    print(label)
+    for step in STEPS + ["total"]:
+        line = "  %-22s %8.3f s" % (step, timings[step])
+        if baseline is not None and baseline.get(step):
+            line += "  %6.2fx" % (timings[step] / baseline[step])
+        print(line)
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--languages", type=int, default=2)
+    parser.add_argument("--resources", type=int, default=100)
+    parser.add_argument(
+        "--nav-links", type=int, default=20, help="url_for() calls in the menu"
+    )
+    parser.add_argument("--warm-runs", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument(
+        "--translation-engine", choices=["po2html", "fast"], default="po2html"
+    )
+    parser.add_argument("--output", help="write the results to a JSON file")
+    parser.add_argument(
+        "--baseline", help="compare with the results of an earlier run (JSON)"
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_args(sys.argv[1:] if args is None else args)
+    parameters = {
+        "pages": options.pages,
+        "languages": options.languages,
+        "resources": options.resources,
+        "nav_links": options.nav_links,
+        "jobs": options.jobs,
+        "incremental": options.incremental,
+        "translation_engine": options.translation_engine,
+    }
+    generate_args = {
+        "jobs": options.jobs,
+        "incremental": options.incremental,
+        "translation_engine": options.translation_engine,
+    }
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["parameters"] != parameters:
+            print("NOTE: the baseline was run with other parameters.")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        translations = create_site(
+            work_dir,
+            options.pages,
+            options.languages,
+            options.resources,
+            options.nav_links,
+        )
+        print(
+            "%(pages)d pages, %(languages)d languages, %(resources)d resources, "
+            "%(nav_links)d nav links" % parameters
+        )
+        cold = run(work_dir, translations, "output", generate_args)
+        print_timings("cold", cold, baseline and baseline["cold"])
+        warm_runs = [
+            run(work_dir, translations, "output", generate_args)
+            for _ in range(options.warm_runs)
+        ]
+    results = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "cold": cold,
+        "warm_runs": warm_runs,
+    }
+    if warm_runs:
+        # the fastest run is the least disturbed by other activity.
+        results["warm"] = {
+            step: min(timings[step] for timings in warm_runs)
+            for step in STEPS + ["total"]
+        }
+        print_timings(
+            "warm (best of %d)" % len(warm_runs),
+            results["warm"],
+            baseline and baseline.get("warm"),
+        )
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark the po2html and fast translation engines on a synthetic template set.
+
+Usage: python benchmarks/translation_engines.py [number of templates]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+from pomosite.translation import (
+    extract_translation_units,
+    generate_dummy_translation,
+    load_catalog,
+    translate_page_templates,
+)
+
+PAGE = """{%% extends "base.html" %%}
+{%% block content %%}
+<div class="post" id="post-%(n)d">
+    <h2>Rubrik nummer %(n)d</h2>
+%(paragraphs)s
+    <img src="{{ url_for('bild-%(n)d.jpg') }}" alt="Bild nummer %(n)d" />
+    <ul>
+%(items)s
+    </ul>
+</div>
+{%% endblock %%}
+"""
+
+
+def create_templates(template_dir, count):
+    for n in range(count):
+        paragraphs = "\n".join(
+            "    <p>Stycke %d på sidan %d, med <a href=\"{{ url_for('P%d') }}\">"
+            "en länk</a> och lite mer text.</p>" % (i, n, i)
+            for i in range(20)
+        )
+        items = "\n".join("        <li>Punkt %d</li>" % i for i in range(10))
+        page = PAGE % {"n": n, "paragraphs": paragraphs, "items": items}
+        Path(template_dir, "page-%d.html" % n).write_text(page, encoding="utf-8")
+
+
+def measure(label, function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    print("%-40s %8.3f s" % (label, elapsed))
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as work_dir:
+        template_dir = Path(work_dir, "templates")
+        template_dir.mkdir()
+        create_templates(template_dir, count)
+        pot_file_path = str(Path(work_dir, "site.pot"))
+        po_file_path = str(Path(work_dir, "site.po"))
+        extract_translation_units(str(template_dir), pot_file_path)
+        generate_dummy_translation(pot_file_path, po_file_path)
+        # another language: same units, different file content.
+        other_po_file_path = str(Path(work_dir, "other.po"))
+        po = Path(po_file_path).read_text(encoding="utf-8")
+        Path(other_po_file_path).write_text("# other\n" + po, encoding="utf-8")
+
+        # parsing the PO files costs the same for both engines, so keep it out of
+        # the measurements.
+        load_catalog(po_file_path)
+        load_catalog(other_po_file_path)
+
+        print("%d templates" % count)
+        po2html_time = measure(
+            "po2html",
+            lambda: translate_page_templates(
+                str(template_dir), po_file_path, str(Path(work_dir, "po2html"))
+            ),
+        )
+        measure(
+            "fast, planning included",
+            lambda: translate_page_templates(
+                str(template_dir),
+                po_file_path,
+                str(Path(work_dir, "fast-cold")),
+                engine="fast",
+            ),
+        )
+        # another language reuses the plans: only the lookups remain.
+        fast_time = measure(
+            "fast, plans reused",
+            lambda: translate_page_templates(
+                str(template_dir),
+                other_po_file_path,
+                str(Path(work_dir, "fast-warm")),
+                engine="fast",
+            ),
+        )
+        print("speedup with reused plans: %.1fx" % (po2html_time / fast_time))
+
+        for file in Path(work_dir, "po2html").glob("*"):
+            if file.read_bytes() != Path(work_dir, "fast-warm", file.name).read_bytes():
+                print("MISMATCH: " + file.name)
+
+
+if __name__ == "__main__":
+    main()
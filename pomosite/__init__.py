@@ -7,11 +7,26 @@ from .templating import (
     ConfigurationError,
     InvalidReferenceError,
     generate,
+    compile_template_bundle,
     write_manifest_file,
 )
 from .config import (
     create_site_config,
     add_resources,
     add_language,
+    add_image_derivatives,
+    add_collection,
+    add_search_index,
     is_common_media_file,
 )
+from .fingerprint import write_cache_headers
+from .profiling import BuildProfile
+from .sinks import (
+    OutputSink,
+    DirectorySink,
+    StagingSink,
+    MemorySink,
+    TarSink,
+    ZipSink,
+)
+from .watch import watch
@@ -0,0 +1,182 @@
+"""Persisted build state for incremental builds."""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+BUILD_STATE_VERSION = 2
+BUILD_STATE_FILE_NAME = "build-state.json"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Calculate the SHA-256 digest of a file, reading it in fixed-size chunks."""
+    hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+def data_digest(data):
+    """Calculate the SHA-256 digest of a JSON-serializable value."""
+    text = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DigestCache:
+    """SHA-256 digests of files, keyed by path, size and modification time.
+
+    If a path is given, the cache is persisted there as a JSON file between builds.
+    Only the entries used during a build are saved.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.entries = {}
+        self._used = {}
+
+    def load(self):
+        """Load the cache file, if there is one."""
+        if not self.path:
+            return
+        try:
+            with self.path.open(mode="r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        """Save the entries used since the cache was created or loaded."""
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_json_file(self.path, self.used_entries())
+
+    def used_entries(self):
+        return {path: self.entries[path] for path in self._used if path in self.entries}
+
+    def digest(self, path):
+        """Get the SHA-256 digest of a file, or None if it doesn't exist.
+
+        Digests are computed at most once per build, and are reused from earlier
+        builds when the file size and modification time are unchanged.
+        """
+        path = str(path)
+        if path in self._used:
+            return self._used[path]
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._used[path] = None
+            return None
+        cached = self.entries.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            digest = cached[2]
+        else:
+            digest = file_digest(path)
+            self.entries[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._used[path] = digest
+        return digest
+
+    def set(self, path, stat, digest):
+        """Record the digest of a file which has been hashed elsewhere."""
+        path = str(path)
+        self.entries[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._used[path] = digest
+
+
+def write_json_file(path, data):
+    temp_path = Path(path).with_name("%s.%d.tmp" % (Path(path).name, os.getpid()))
+    with temp_path.open(mode="w", encoding="utf-8") as f:
+        # json.dumps() uses the C encoder, unlike json.dump().
+        f.write(json.dumps(data, sort_keys=True))
+    os.replace(str(temp_path), str(path))
+
+
+class BuildState:
+    """The recorded inputs of each output file of a build.
+
+    The state is saved as a JSON file in the temp directory after a build, and loaded
+    on the next build to find out which outputs have to be regenerated. Outputs are
+    identified by their path relative to the output directory.
+
+    The inputs of a page are its template and the templates it extends or includes,
+    the items it references with url_for(), the PO file and the page configuration.
+    Incremental builds regenerate only the outputs with changed inputs, and delete
+    the outputs of items which are no longer in the configuration. With
+    *full_rebuild*, all outputs are regenerated regardless of the recorded state.
+    """
+
+    def __init__(self, temp_dir, output_dir, full_rebuild=False):
+        self.path = Path(temp_dir, BUILD_STATE_FILE_NAME)
+        self.output_dir = str(Path(".").resolve() / output_dir)
+        self.full_rebuild = full_rebuild
+        self.previous = {}
+        self.outputs = {}
+        self.digests = DigestCache()
+
+    def load(self):
+        """Load the state of the previous build, if there is one."""
+        try:
+            with self.path.open(mode="r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (
+            state.get("version") != BUILD_STATE_VERSION
+            or state.get("output_dir") != self.output_dir
+        ):
+            return
+        self.previous = state.get("outputs", {})
+        self.digests.entries = state.get("files", {})
+
+    def save(self):
+        """Save the state of the current build, replacing the previous state."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # the outputs were just written with the recorded digests, so the next build
+        # can check them without reading them.
+        for key, record in self.outputs.items():
+            path = os.path.join(self.output_dir, key)
+            try:
+                self.digests.set(path, os.stat(path), record["digest"])
+            except OSError:
+                pass
+        state = {
+            "version": BUILD_STATE_VERSION,
+            "output_dir": self.output_dir,
+            "outputs": self.outputs,
+            "files": self.digests.used_entries(),
+        }
+        write_json_file(self.path, state)
+
+    def digest(self, path):
+        """Get the SHA-256 digest of an input file, or None if it doesn't exist."""
+        return self.digests.digest(path)
+
+    def get_previous(self, key):
+        """Get the record of an output from the previous build, if it exists on disk
+        with the recorded digest.
+
+        An output which was changed after the previous build, e.g. by a later build
+        which failed, thus doesn't match its record. Always returns None for a full
+        rebuild.
+        """
+        record = self.previous.get(key)
+        if self.full_rebuild or record is None:
+            return None
+        path = os.path.join(self.output_dir, key)
+        if not os.path.isfile(path) or self.digests.digest(path) != record["digest"]:
+            return None
+        return record
+
+    def record(self, key, record):
+        """Record the inputs of an output of the current build."""
+        self.outputs[key] = record
+
+    def remove_stale_outputs(self):
+        """Delete outputs from the previous build which are not part of this build."""
+        for key in self.previous:
+            if key not in self.outputs:
+                path = Path(self.output_dir, key)
+                if path.is_file():
+                    path.unlink()
@@ -0,0 +1,166 @@
+"""Template bundles: templates compiled ahead of time into a zip archive.
+
+A bundle holds one set of compiled templates for the default language and one for
+each translation, along with a manifest of the digests of the template sources they
+were compiled from. See compile_template_bundle().
+"""
+
+from pathlib import Path
+import hashlib
+import json
+import marshal
+import os
+import sys
+import zipfile
+import jinja2
+import jinja2.utils
+
+BUNDLE_VERSION = 1
+BUNDLE_MANIFEST_NAME = "bundle.json"
+DEFAULT_SET_NAME = "_default"
+
+
+def get_bundle_set_name(language_tag):
+    return language_tag or DEFAULT_SET_NAME
+
+
+def get_module_name(template_name):
+    return "%s/%s" % (
+        hashlib.sha1(template_name.encode("utf-8")).hexdigest(),
+        Path(template_name).name,
+    )
+
+
+class BundleWriter:
+    """Write compiled templates to a new bundle, which replaces *path* on close()."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.temp_path = self.path.with_name(
+            "%s.%d.tmp" % (self.path.name, os.getpid())
+        )
+        self.zip = zipfile.ZipFile(str(self.temp_path), "w", zipfile.ZIP_DEFLATED)
+        self.sets = {}
+
+    def add_template(self, language_tag, name, digest, code, dependencies):
+        """Add a template to the set of a language.
+
+        *code* is the module code from jinja's Environment.compile() with
+        defer_init set, or None for files which aren't templates, such as images.
+        """
+        set_name = get_bundle_set_name(language_tag)
+        if code is not None:
+            self.zip.writestr(
+                "%s/%s" % (set_name, get_module_name(name)), marshal.dumps(code)
+            )
+        self.sets.setdefault(set_name, {})[name] = {
+            "digest": digest,
+            "dependencies": dependencies,
+        }
+
+    def abort(self):
+        """Discard the new bundle."""
+        self.zip.close()
+        os.remove(str(self.temp_path))
+
+    def close(self):
+        manifest = {
+            "version": BUNDLE_VERSION,
+            "python": sys.implementation.cache_tag,
+            "jinja": jinja2.__version__,
+            "sets": self.sets,
+        }
+        self.zip.writestr(BUNDLE_MANIFEST_NAME, json.dumps(manifest, sort_keys=True))
+        self.zip.close()
+        os.replace(str(self.temp_path), str(self.path))
+
+
+def load_bundle_manifest(path):
+    """Load the manifest of a bundle.
+
+    Returns None if there is no bundle, or if it was compiled by another version of
+    Python, jinja or this module.
+    """
+    try:
+        with zipfile.ZipFile(str(path)) as zip:
+            manifest = json.loads(zip.read(BUNDLE_MANIFEST_NAME))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+    if (
+        manifest.get("version") != BUNDLE_VERSION
+        or manifest.get("python") != sys.implementation.cache_tag
+        or manifest.get("jinja") != jinja2.__version__
+    ):
+        return None
+    return manifest
+
+
+def find_valid_bundle_sets(path, template_paths, digest):
+    """Find the template sets in a bundle which match the current template sources.
+
+    *template_paths* is a dictionary of language tag to template directory, and
+    *digest* a function which returns the SHA-256 digest of a file. Returns a
+    dictionary of language tag to a dictionary of template name to the names of the
+    templates it depends on, for each language with a valid set.
+    """
+    manifest = load_bundle_manifest(path)
+    if manifest is None:
+        return {}
+    valid_sets = {}
+    for language_tag, template_path in template_paths.items():
+        templates = manifest["sets"].get(get_bundle_set_name(language_tag), None)
+        if templates is None:
+            continue
+        names = set()
+        for file in Path(template_path).glob("**/*"):
+            if file.is_file():
+                names.add(file.relative_to(template_path).as_posix())
+        if names == templates.keys() and all(
+            digest(os.path.join(template_path, name)) == template["digest"]
+            for name, template in templates.items()
+        ):
+            valid_sets[language_tag] = {
+                name: template["dependencies"] for name, template in templates.items()
+            }
+    return valid_sets
+
+
+class BundleLoader(jinja2.BaseLoader):
+    """Load the compiled templates of a language from a bundle, without parsing."""
+
+    has_source_access = False
+
+    def __init__(self, path, language_tag):
+        self.path = str(path)
+        self.set_name = get_bundle_set_name(language_tag)
+        # opened on the first load, and again after close().
+        self.zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the bundle file."""
+        if self.zip is not None:
+            self.zip.close()
+            self.zip = None
+
+    @jinja2.utils.internalcode
+    def load(self, environment, name, globals=None):
+        if self.zip is None:
+            self.zip = zipfile.ZipFile(self.path)
+        try:
+            data = self.zip.read("%s/%s" % (self.set_name, get_module_name(name)))
+        except KeyError:
+            raise jinja2.TemplateNotFound(name)
+        code = marshal.loads(data)
+        namespace = {"environment": environment, "__file__": code.co_filename}
+        exec(code, namespace)
+        if globals is None:
+            globals = {}
+        return environment.template_class.from_module_dict(
+            environment, namespace, globals
+        )
@@ -0,0 +1,104 @@
+"""Pre-compressed gzip sidecars: "page.html.gz" next to "page.html".
+
+Web servers can serve the sidecars to clients which accept gzip, instead of
+compressing the files on every request.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import gzip
+import hashlib
+import json
+import os
+from .buildstate import write_json_file
+
+GZIP_SUFFIXES = (".html", ".htm", ".php", ".css", ".js", ".json", ".svg")
+GZIP_MIN_SIZE = 1024
+GZIP_CACHE_FILE_NAME = "gzip.json"
+
+
+def should_compress(key):
+    return key.lower().endswith(GZIP_SUFFIXES)
+
+
+def write_sidecar(source_path, sidecar_path):
+    """Compress a file into a gzip sidecar and return the SHA-256 digest of it.
+
+    The sidecar doesn't depend on the time of the build, so the same file always
+    gives the same sidecar.
+    """
+    with open(source_path, "rb") as f:
+        data = gzip.compress(f.read(), compresslevel=9, mtime=0)
+    with open(sidecar_path, "wb") as f:
+        f.write(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def load_sidecar_cache(cache_path):
+    if cache_path is None:
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_gzip_sidecars(
+    sink,
+    file_list=[],
+    build_state=None,
+    file_digests=None,
+    min_size=GZIP_MIN_SIZE,
+    cache_path=None,
+):
+    """Write gzip sidecars for the text files in a DirectorySink.
+
+    A sidecar is written for each file in *sink.digests* with one of the
+    GZIP_SUFFIXES and a size of at least *min_size* bytes. The files are compressed
+    in a thread pool. The digest of each file and of its sidecar are kept in a cache
+    file at *cache_path*, and sidecars of files with the same digest as in the
+    previous build are left as they are.
+
+    The sidecars are added to the file list, to *sink.digests* and to
+    *file_digests*, and are recorded in the build state so that stale sidecars are
+    removed by incremental builds.
+    """
+    cache = load_sidecar_cache(cache_path)
+    used = {}
+    sidecars = []
+    compressions = []
+    for key, digest in list(sink.digests.items()):
+        if not should_compress(key):
+            continue
+        source_path = sink.path / key
+        if os.stat(source_path).st_size < min_size:
+            continue
+        sidecar_key = key + ".gz"
+        sidecars.append((key, sidecar_key))
+        cached = cache.get(key, None)
+        if cached and cached[0] == digest and sink.keep(sidecar_key):
+            used[key] = cached
+        else:
+            compressions.append((key, source_path, sink.path / sidecar_key))
+
+    with ThreadPoolExecutor() as executor:
+        sidecar_digests = executor.map(
+            lambda task: write_sidecar(task[1], task[2]), compressions
+        )
+        for (key, _, _), sidecar_digest in zip(compressions, sidecar_digests):
+            used[key] = [sink.digests[key], sidecar_digest]
+
+    for key, sidecar_key in sidecars:
+        sidecar_digest = used[key][1]
+        sink.digests[sidecar_key] = sidecar_digest
+        sidecar_path = sink.get_name(sidecar_key)
+        file_list.append(sidecar_path)
+        if file_digests is not None:
+            file_digests[sidecar_path] = sidecar_digest
+        if build_state is not None:
+            build_state.record(sidecar_key, {"gzip": key, "digest": sidecar_digest})
+    if cache_path is not None:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        write_json_file(cache_path, used)
+    return len(compressions)
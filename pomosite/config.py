@@ -1,8 +1,23 @@
 """Create and edit site configurations."""
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import re
 import ast
+import copy
+import hashlib
+import os
+import pickle
+from .buildstate import data_digest
+from .datasources import get_source_format, read_records
+from .templating import CACHE_DIR_NAME
+from .translation import write_cache_file
+
+# page-config headers are on the first line of a file, which must fit in this many
+# bytes.
+HEADER_READ_SIZE = 4096
+# read the headers in parallel when there are at least this many files to read.
+PARALLEL_SCAN_THRESHOLD = 64
 
 
 def parse_page_config(str):
@@ -15,22 +30,110 @@ def parse_page_config(str):
     return page_config
 
 
-def create_site_config(template_dir, temp_dir):
+def read_page_config_header(path):
+    """Read the page-config header of a template file.
+
+    Returns the page config, or None if the file has no header. Only the first
+    HEADER_READ_SIZE bytes of the file are read.
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(HEADER_READ_SIZE)
+    lines = re.split(rb"\r\n|\r|\n", prefix, maxsplit=1)
+    if len(lines) == 1 and len(prefix) == HEADER_READ_SIZE:
+        # the first line is too long to be a header.
+        return None
+    line = lines[0].decode("utf-8", errors="replace")
+    match = re.fullmatch(r"\{#(.*)#\}", line.rstrip())
+    if match:
+        return parse_page_config(match[1])
+    return None
+
+
+def scan_template_dir(template_dir, recursive=False):
+    """List the files in a template directory.
+
+    Yields (name, path, stat) tuples, where name is the template name: the path
+    relative to the template directory, with forward slashes. Each directory is
+    listed once with os.scandir, and each file is stat'ed once.
+    """
+    pending = [("", str(template_dir))]
+    while pending:
+        prefix, directory = pending.pop(0)
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        pending.append((prefix + entry.name + "/", entry.path))
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield prefix + entry.name, entry.path, stat
+
+
+def get_page_config_cache_path(template_dir, temp_dir):
+    digest = hashlib.sha256(str(Path(template_dir).resolve()).encode("utf-8"))
+    return Path(
+        temp_dir, CACHE_DIR_NAME, "page-configs", digest.hexdigest() + ".pickle"
+    )
+
+
+def create_site_config(template_dir, temp_dir, recursive=False):
     """Create a site configuration dictionary based on a given template directory.
 
     All files in the template directory with valid page-config headers are added as items.
+    If *recursive* is set, files in subdirectories are also added, with template names
+    such as "blog/post.html".
+
+    The headers are cached in the temp directory, keyed by the path, size and
+    modification time of each file, so that only new and modified files are read on
+    the next run. Many files are read in parallel.
     """
+    cache_path = None
+    cache = {}
+    if temp_dir:
+        cache_path = get_page_config_cache_path(template_dir, temp_dir)
+        try:
+            with cache_path.open(mode="rb") as f:
+                cache = pickle.load(f)
+        except Exception:
+            pass
+
+    files = []
+    new_cache = {}
+    misses = []
+    for name, path, stat in scan_template_dir(template_dir, recursive):
+        files.append(name)
+        cached = cache.get(name)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            new_cache[name] = cached
+        else:
+            misses.append((name, path, stat))
+
+    if len(misses) >= PARALLEL_SCAN_THRESHOLD:
+        with ThreadPoolExecutor() as executor:
+            page_configs = list(
+                executor.map(read_page_config_header, [path for _, path, _ in misses])
+            )
+    else:
+        page_configs = [read_page_config_header(path) for _, path, _ in misses]
+    for (name, _, stat), page_config in zip(misses, page_configs):
+        new_cache[name] = (stat.st_size, stat.st_mtime_ns, page_config)
+
+    if cache_path and (misses or len(new_cache) != len(cache)):
+        write_cache_file(
+            cache_path, pickle.dumps(new_cache, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+
     item_config = {}
-    for file in Path(template_dir).glob("*"):
-        if not file.is_dir():
-            with file.open(mode="r", encoding="utf-8") as f:
-                line = f.readline()
-                match = re.fullmatch(r"\{#(.*)#\}", line.rstrip())
-                if match:
-                    page_config = parse_page_config(match[1])
-                    page_config["template"] = file.name
-                    if "id" in page_config:
-                        item_config[page_config["id"]] = page_config
+    for name in files:
+        page_config = new_cache[name][2]
+        if page_config is not None:
+            page_config = copy.deepcopy(page_config)
+            page_config["template"] = name
+            if "id" in page_config:
+                item_config[page_config["id"]] = page_config
 
     return {
         "template_dir": template_dir,
@@ -118,3 +221,107 @@ def add_language(language_tag, po_file_path, site_config):
     site_config["translations"][language_tag] = {
         "po_file_path": po_file_path,
     }
+
+
+def add_image_derivatives(pattern, widths, site_config, formats=None, quality=None):
+    """Declare responsive image derivatives for image resources.
+
+    The pattern is a glob pattern such as "*.jpg", which is matched against the
+    item IDs. Each matching JPEG, PNG or WebP resource gets a resized derivative for
+    each of the widths (in pixels) which is smaller than the image, in each of the
+    formats ("jpeg", "png" or "webp"). The default is the format of the image.
+
+    The first matching declaration applies. Declarations can also be made per
+    image, with a "derivatives" item attribute such as {"widths": [480, 960]}.
+    """
+    if not "image_derivatives" in site_config:
+        site_config["image_derivatives"] = []
+    site_config["image_derivatives"].append(
+        {
+            "pattern": pattern,
+            "widths": list(widths),
+            "formats": list(formats) if formats else None,
+            "quality": quality,
+        }
+    )
+
+
+def add_collection(
+    name,
+    source,
+    template,
+    id_pattern,
+    endpoint_pattern,
+    site_config,
+    format=None,
+    query=None,
+):
+    """Add a page collection: one page per record of a data source, from one template.
+
+    The source is a JSON-lines (.jsonl), CSV (.csv) or SQLite (.db, .sqlite) file,
+    or has the given format ("jsonl", "csv" or "sqlite"). SQLite sources need a
+    query, such as "SELECT * FROM products". The ID and endpoint of each page are
+    made from patterns with the fields of the record, such as "product-{sku}" and
+    "/products/{slug}/". The template gets the record as the *record* variable.
+
+    The records are read one at a time. Only their positions in the source and their
+    digests are kept in the item configuration, and the records are read again when
+    the pages are rendered.
+    """
+    format = get_source_format(source, format)
+    if format == "sqlite" and not query:
+        raise ValueError("A query is required for the SQLite source " + str(source))
+    collection = {
+        "source": str(source),
+        "format": format,
+        "query": query,
+        "template": template,
+    }
+    if not "collections" in site_config:
+        site_config["collections"] = {}
+    site_config["collections"][name] = collection
+
+    item_config = site_config.get("item_config")
+    for position, _, record in read_records(collection):
+        try:
+            id = id_pattern.format(**record)
+            endpoint = endpoint_pattern.format(**record)
+        except KeyError as e:
+            raise ValueError(
+                "A record in the collection %s is missing the field %s" % (name, e)
+            )
+
+        if id in item_config:
+            raise ValueError("An item with the same ID already exists: " + id)
+
+        item_config[id] = {
+            "endpoint": endpoint,
+            "template": template,
+            "collection": name,
+            "position": position,
+            "record_digest": data_digest(record),
+        }
+
+
+def add_search_index(
+    site_config, endpoint="/search/index.json", id="SEARCH_INDEX", prefix_length=2
+):
+    """Add a client-side search index of the pages to the site configuration.
+
+    The index manifest is added as an item with the given ID and endpoint, so
+    templates can refer to it with url_for(). It lists the documents and the index
+    shards of each language, which are published next to it. The terms are split
+    into shards by their first *prefix_length* characters.
+
+    Pages with a "search" attribute set to False are left out of the index.
+    """
+    item_config = site_config.get("item_config")
+    if id in item_config:
+        raise ValueError("An item with the same ID already exists: " + id)
+    item_config[id] = {
+        "endpoint": endpoint,
+    }
+    site_config["search_index"] = {
+        "id": id,
+        "prefix_length": prefix_length,
+    }
@@ -0,0 +1,126 @@
+"""Data sources for page collections: one template rendered once per record.
+
+Records are read from JSON-lines, CSV or SQLite files. Each record has a position in
+its source, which is a byte offset for JSON-lines and CSV files and a row number for
+SQLite queries, so that the records can be read again from any position without
+reading the whole source.
+"""
+
+from pathlib import Path
+import csv
+import json
+import sqlite3
+
+SOURCE_FORMATS = {
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".csv": "csv",
+    ".db": "sqlite",
+    ".sqlite": "sqlite",
+    ".sqlite3": "sqlite",
+}
+
+
+def get_source_format(source, format=None):
+    """Get the format of a data source: "jsonl", "csv" or "sqlite"."""
+    if format is None:
+        format = SOURCE_FORMATS.get(Path(source).suffix.lower(), None)
+    if format not in ("jsonl", "csv", "sqlite"):
+        raise ValueError('Unknown data source format for "%s".' % source)
+    return format
+
+
+def read_jsonl_records(source, position):
+    with open(source, "rb") as f:
+        f.seek(position)
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                yield position, f.tell(), json.loads(line)
+            position = f.tell()
+
+
+def read_csv_records(source, position):
+    with open(source, "rb") as f:
+        # the lines are read one at a time as the reader needs them, so the file
+        # position is always at the start of the next record.
+        lines = (line.decode("utf-8") for line in iter(f.readline, b""))
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return
+        header[0] = header[0].lstrip("\ufeff")
+        if position:
+            f.seek(position)
+        while True:
+            position = f.tell()
+            row = next(reader, None)
+            if row is None:
+                break
+            if row:
+                yield position, f.tell(), dict(zip(header, row))
+
+
+def read_sqlite_records(source, query, position):
+    connection = sqlite3.connect(Path(source).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        connection.row_factory = sqlite3.Row
+        cursor = connection.execute(
+            "SELECT * FROM (%s) LIMIT -1 OFFSET ?" % query, (position,)
+        )
+        for row in cursor:
+            yield position, position + 1, dict(row)
+            position += 1
+    finally:
+        connection.close()
+
+
+def read_records(collection, position=0):
+    """Read the records of a collection lazily, starting at a position.
+
+    *collection* is a collection configuration as added by add_collection(). Yields
+    (position, next_position, record) tuples, where record is a dictionary.
+    """
+    format = collection["format"]
+    if format == "jsonl":
+        return read_jsonl_records(collection["source"], position)
+    if format == "csv":
+        return read_csv_records(collection["source"], position)
+    return read_sqlite_records(collection["source"], collection["query"], position)
+
+
+class RecordReader:
+    """Read the records of the pages in the collections of a site.
+
+    Pages are usually rendered in the order of their records, so each collection is
+    read sequentially, and only read again from a new position when a page is
+    skipped.
+    """
+
+    def __init__(self, collections):
+        self.collections = collections
+        self.readers = {}
+
+    def get(self, name, position):
+        """Get the record at a position in a collection."""
+        reader = self.readers.get(name, None)
+        if reader is None or reader[0] != position:
+            if reader is not None:
+                reader[1].close()
+            records = read_records(self.collections[name], position)
+        else:
+            records = reader[1]
+        _, next_position, record = next(records, (None, None, None))
+        if record is None:
+            raise ValueError(
+                'Collection "%s" has no record at position %d.' % (name, position)
+            )
+        self.readers[name] = (next_position, records)
+        return record
+
+    def close(self):
+        for _, records in self.readers.values():
+            records.close()
+        self.readers = {}
@@ -0,0 +1,161 @@
+"""Delta deploys: sync only the files which changed since the previous deploy.
+
+The manifests written by write_manifest_file() list the path and SHA-256 digest of
+each file of a site. The manifest of the deployed site is kept in the target
+directory, so the next deploy can compare it with the manifest of a new build.
+
+Usage: python -m pomosite.deploy OUTPUT_DIR MANIFEST TARGET_DIR [--delete] [--dry-run]
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse
+import os
+import shutil
+import sys
+from .sinks import MANIFEST_FILE_NAME, format_manifest
+from .translation import write_cache_file
+
+ManifestDiff = namedtuple("ManifestDiff", ["added", "changed", "deleted"])
+
+
+def read_manifest(path):
+    """Read a manifest file into a dictionary of path to digest.
+
+    The paths are relative to the root of the site, with forward slashes and no
+    leading slash. Returns an empty dictionary if the file doesn't exist.
+    """
+    manifest = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                if not line:
+                    continue
+                name, _, digest = line.rpartition(";")
+                manifest[name.lstrip("/")] = digest
+    except FileNotFoundError:
+        pass
+    return manifest
+
+
+def diff_manifests(old, new):
+    """Compare two manifests and return a ManifestDiff of sorted lists of paths."""
+    return ManifestDiff(
+        added=sorted(name for name in new if name not in old),
+        changed=sorted(name for name in new if name in old and old[name] != new[name]),
+        deleted=sorted(name for name in old if name not in new),
+    )
+
+
+def copy_into_place(source, destination):
+    """Copy a file via a temporary file, so that the destination is never partial."""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = destination.with_name("%s.%d.tmp" % (destination.name, os.getpid()))
+    shutil.copyfile(str(source), str(temp_path))
+    os.replace(str(temp_path), str(destination))
+
+
+def remove_file(path, root):
+    """Remove a file, and the directories up to *root* which become empty."""
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+    directory = path.parent
+    while directory != root:
+        try:
+            directory.rmdir()
+        except OSError:
+            break
+        directory = directory.parent
+
+
+def deploy(
+    output_dir,
+    manifest_path,
+    target_dir,
+    delete=False,
+    dry_run=False,
+    previous_manifest_path=None,
+):
+    """Sync the changes of a site into a target directory, according to manifests.
+
+    The manifest at *manifest_path* describes the site in *output_dir*, and the
+    manifest of the previous deploy is read from *previous_manifest_path*, which
+    defaults to the manifest file in the target directory. Added and changed files
+    are copied in a thread pool. Files which are no longer part of the site are
+    deleted if *delete* is set, and left in place otherwise. Finally, a manifest of
+    the target directory is written to it: the new manifest, plus the files which
+    were left in place, so that a later deploy with *delete* removes them. Nothing
+    is changed if *dry_run* is set.
+
+    Files in the target directory which were modified after the previous deploy
+    are not detected. Returns the ManifestDiff.
+    """
+    output_dir = Path(output_dir)
+    target_dir = Path(target_dir)
+    if previous_manifest_path is None:
+        previous_manifest_path = target_dir / MANIFEST_FILE_NAME
+    previous = read_manifest(previous_manifest_path)
+    new = read_manifest(manifest_path)
+    diff = diff_manifests(previous, new)
+    if dry_run:
+        return diff
+    with ThreadPoolExecutor() as executor:
+        for _ in executor.map(
+            lambda name: copy_into_place(output_dir / name, target_dir / name),
+            diff.added + diff.changed,
+        ):
+            pass
+    deployed = dict(new)
+    for name in diff.deleted:
+        if delete:
+            remove_file(target_dir / name, target_dir)
+        else:
+            deployed[name] = previous[name]
+    # the manifest goes last, so that an interrupted deploy is redone next time.
+    write_cache_file(
+        target_dir / MANIFEST_FILE_NAME, format_manifest(deployed).encode("utf-8")
+    )
+    return diff
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Sync the changes of a generated site into a target directory."
+    )
+    parser.add_argument("output_dir", help="the output directory of the build")
+    parser.add_argument("manifest", help="the manifest file of the build")
+    parser.add_argument("target_dir", help="the directory to deploy to")
+    parser.add_argument(
+        "--delete", action="store_true", help="delete files which were removed"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only report what would change"
+    )
+    options = parser.parse_args(sys.argv[1:] if args is None else args)
+    diff = deploy(
+        options.output_dir,
+        options.manifest,
+        options.target_dir,
+        options.delete,
+        options.dry_run,
+    )
+    for label, names in zip(["added", "changed", "deleted"], diff):
+        for name in names:
+            print("%-8s /%s" % (label, name))
+    print(
+        "%d added, %d changed, %d deleted%s"
+        % (
+            len(diff.added),
+            len(diff.changed),
+            len(diff.deleted),
+            "" if options.delete or not diff.deleted else " (kept)",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Content-fingerprinted resource URLs, for caching resources as immutable.
+
+A fingerprinted resource is published with a part of the digest of its content in
+the file name, such as "/css/site.3f2a9c1b7e.css", so that a changed resource gets a
+new URL and the old one can be cached by browsers forever.
+"""
+
+import posixpath
+import re
+
+FINGERPRINT_LENGTH = 10
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def fingerprint_endpoint(endpoint, digest):
+    """Insert a fingerprint before the suffix of the file name of an endpoint."""
+    directory, name = posixpath.split(endpoint)
+    stem, suffix = posixpath.splitext(name)
+    if not stem:
+        # hidden files such as ".htaccess" have no suffix.
+        stem, suffix = name, ""
+    return posixpath.join(
+        directory, "%s.%s%s" % (stem, digest[:FINGERPRINT_LENGTH], suffix)
+    )
+
+
+def is_fingerprinted(item_id, item):
+    """Tests whether a resource should be fingerprinted.
+
+    Referable resources are fingerprinted, that is, the ones which add_resources()
+    names by their file name. Others, such as ".htaccess", keep their endpoint, as do
+    items with "fingerprint": False.
+    """
+    return (
+        "source" in item
+        and not item_id.startswith("_")
+        and item.get("fingerprint", True)
+    )
+
+
+def fingerprint_resources(site_config, digest):
+    """Get a copy of a site configuration with fingerprinted resource endpoints.
+
+    *digest* is a function which returns the SHA-256 digest of a file. Returns a
+    tuple (site_config, fingerprints), where fingerprints is a dictionary of item ID
+    to fingerprinted endpoint, which generate() adds to its *fingerprints* argument
+    for write_cache_headers(). The given configuration is left unchanged.
+    """
+    item_config = {}
+    fingerprints = {}
+    for item_id, item in site_config["item_config"].items():
+        if is_fingerprinted(item_id, item):
+            endpoint = fingerprint_endpoint(item["endpoint"], digest(item["source"]))
+            item = {**item, "endpoint": endpoint}
+            fingerprints[item_id] = endpoint
+        item_config[item_id] = item
+    return {**site_config, "item_config": item_config}, fingerprints
+
+
+def format_cache_headers(endpoints, server="apache"):
+    """Format a web server configuration snippet which marks endpoints as immutable.
+
+    For "apache", the snippet is a FilesMatch section on the file names, for a
+    .htaccess file in the root of the site. For "nginx", it is one exact-match
+    location block per endpoint, for the server block of the site.
+    """
+    endpoints = sorted(endpoints)
+    if server == "apache":
+        if not endpoints:
+            return ""
+        names = "|".join(
+            re.escape(posixpath.basename(endpoint)) for endpoint in endpoints
+        )
+        return (
+            '<FilesMatch "^(%s)$">\n' % names
+            + '    Header set Cache-Control "%s"\n' % IMMUTABLE_CACHE_CONTROL
+            + "</FilesMatch>\n"
+        )
+    if server == "nginx":
+        return "".join(
+            'location = %s {\n    add_header Cache-Control "%s";\n}\n'
+            % (endpoint, IMMUTABLE_CACHE_CONTROL)
+            for endpoint in endpoints
+        )
+    raise ValueError('Invalid server "%s".' % server)
+
+
+def write_cache_headers(fingerprints, path, server="apache"):
+    """Write a cache header configuration snippet for fingerprinted resources.
+
+    *fingerprints* is the dictionary filled in by generate(). *server* is "apache"
+    or "nginx". See format_cache_headers().
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(format_cache_headers(fingerprints.values(), server))
@@ -0,0 +1,175 @@
+"""Responsive image derivatives: resized and converted variants of image resources.
+
+Derivatives are declared with add_image_derivatives() or with a "derivatives" item
+attribute, and are made by generate() with Pillow, which is an optional dependency.
+Each derivative is added to the site configuration as a resource of its own, with
+the cached image file as source, and the original gets a "srcset" attribute which
+the srcset_for() template function uses.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from pathlib import Path
+import hashlib
+import json
+import posixpath
+from .translation import write_cache_file
+
+# bump to invalidate the cached derivatives when the way they are made changes.
+DERIVATIVE_VERSION = 1
+DEFAULT_QUALITY = 85
+
+# format name to (file suffix, Pillow format).
+IMAGE_FORMATS = {
+    "jpeg": (".jpg", "JPEG"),
+    "png": (".png", "PNG"),
+    "webp": (".webp", "WEBP"),
+}
+SUFFIX_FORMATS = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".webp": "webp"}
+
+
+def get_image_format(path):
+    """Get the format name of an image from its suffix, or None."""
+    return SUFFIX_FORMATS.get(Path(path).suffix.lower(), None)
+
+
+def find_derivatives(item_id, item, rules):
+    """Find the derivative declaration of an image resource, or None.
+
+    The "derivatives" attribute of the item takes precedence over the first of the
+    *rules* from add_image_derivatives() with a pattern which matches the item ID.
+    """
+    if "source" not in item or "derivative_of" in item:
+        return None
+    if get_image_format(item["source"]) is None:
+        return None
+    if "derivatives" in item:
+        return item["derivatives"]
+    for rule in rules:
+        if fnmatch(item_id, rule["pattern"]):
+            return rule
+    return None
+
+
+def get_derivative_suffix(source, format):
+    if get_image_format(source) == format:
+        # keep ".jpeg" rather than ".jpg" for a ".jpeg" original.
+        return Path(source).suffix.lower()
+    return IMAGE_FORMATS[format][0]
+
+
+def get_derivative_endpoint(endpoint, width, suffix):
+    stem = posixpath.splitext(endpoint)[0]
+    return "%s-%dw%s" % (stem, width, suffix)
+
+
+def get_cache_key(source_digest, width, format, quality):
+    text = json.dumps([DERIVATIVE_VERSION, source_digest, width, format, quality])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def resize_image(source, destination, width, format, quality):
+    """Resize an image to a width, keeping the aspect ratio, and save it.
+
+    Returns the (width, height) of the derivative, or None if the original is
+    narrower than the width, since images are never scaled up.
+    """
+    from PIL import Image
+
+    with Image.open(source) as image:
+        if width > image.width:
+            return None
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        if format == "jpeg" and resized.mode not in ("RGB", "L"):
+            resized = resized.convert("RGB")
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        resized.save(str(destination), IMAGE_FORMATS[format][1], quality=quality)
+    return width, height
+
+
+def make_derivative(source, cache_path, width, format, quality):
+    """Make a derivative in the cache, unless it is already there.
+
+    Returns the size of the derivative, or None if there is none. Raises ImportError
+    if Pillow isn't installed.
+    """
+    meta_path = cache_path.with_name(cache_path.name + ".json")
+    try:
+        with meta_path.open(mode="r", encoding="utf-8") as f:
+            return json.load(f)["size"]
+    except (OSError, ValueError, KeyError):
+        pass
+    size = resize_image(source, cache_path, width, format, quality)
+    write_cache_file(meta_path, json.dumps({"size": size}).encode("utf-8"))
+    return size
+
+
+def add_derivative_items(site_config, digest, cache_dir):
+    """Make the image derivatives of a site and add them to a copy of its config.
+
+    *digest* is a function which returns the SHA-256 digest of a file. The
+    derivatives are made in a thread pool and cached in *cache_dir* by the digest of
+    the source and the parameters, so only derivatives of new or changed images are
+    made. Returns the new site configuration, or the given one if no images have
+    derivatives.
+    """
+    rules = site_config.get("image_derivatives", [])
+    item_config = site_config["item_config"]
+    tasks = []
+    for item_id, item in item_config.items():
+        derivatives = find_derivatives(item_id, item, rules)
+        if derivatives is None:
+            continue
+        source = item["source"]
+        source_digest = digest(source)
+        quality = derivatives.get("quality", None) or DEFAULT_QUALITY
+        for format in derivatives.get("formats", None) or [get_image_format(source)]:
+            for width in sorted(derivatives["widths"]):
+                key = get_cache_key(source_digest, width, format, quality)
+                suffix = get_derivative_suffix(source, format)
+                cache_path = Path(cache_dir, key[:2], key + suffix)
+                tasks.append(
+                    (item_id, width, format, suffix, source, cache_path, quality)
+                )
+    if not tasks:
+        return site_config
+
+    # images with the same content share their derivatives, which are made once.
+    unique_tasks = {task[5]: task for task in tasks}
+    with ThreadPoolExecutor() as executor:
+        unique_sizes = dict(
+            zip(
+                unique_tasks,
+                executor.map(
+                    lambda task: make_derivative(
+                        task[4], task[5], task[1], task[2], task[6]
+                    ),
+                    unique_tasks.values(),
+                ),
+            )
+        )
+    sizes = [unique_sizes[task[5]] for task in tasks]
+
+    item_config = dict(item_config)
+    srcsets = {}
+    for task, size in zip(tasks, sizes):
+        item_id, width, format, suffix, _, cache_path, _ = task
+        if size is None:
+            continue
+        derivative_id = "%s@%dw%s" % (item_id, width, suffix)
+        item_config[derivative_id] = {
+            "endpoint": get_derivative_endpoint(
+                item_config[item_id]["endpoint"], width, suffix
+            ),
+            "source": str(cache_path),
+            "derivative_of": item_id,
+            "width": size[0],
+            "height": size[1],
+        }
+        srcsets.setdefault(item_id, {}).setdefault(format, []).append(
+            [derivative_id, size[0]]
+        )
+    for item_id, srcset in srcsets.items():
+        item_config[item_id] = {**item_config[item_id], "srcset": srcset}
+    return {**site_config, "item_config": item_config}
@@ -0,0 +1,328 @@
+"""Link checker: find broken links in a generated site.
+
+url_for() only checks the item IDs of a site. The link checker also catches
+hard-coded links and links to pages which don't exist in some language, by parsing
+every generated HTML and PHP file and resolving the href and src attributes against
+the set of output files.
+
+Usage: python -m pomosite.linkcheck OUTPUT_DIR [--languages en,sv] [--cache DIR]
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote
+import argparse
+import json
+import os
+import posixpath
+import re
+import sys
+from .buildstate import DigestCache, data_digest, write_json_file
+from .deploy import read_manifest
+
+# bump to invalidate the cached links when the way they are found changes.
+LINKCHECK_VERSION = 1
+LINK_CACHE_FILE_NAME = "links.json"
+DIGEST_CACHE_FILE_NAME = "link-digests.json"
+CHECKED_SUFFIXES = (".html", ".htm", ".php")
+# check the files in a process pool when there are at least this many to parse.
+PARALLEL_CHECK_THRESHOLD = 256
+
+TAG = re.compile(r"<\?.*?(?:\?>|\Z)|<!--.*?-->|<[A-Za-z][^>]*>", re.S)
+LINK_ATTRIBUTE = re.compile(
+    r"""\s(href|src|srcset)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.I
+)
+# links with a scheme, such as "https:" or "mailto:", and protocol-relative links.
+EXTERNAL_LINK = re.compile(r"[A-Za-z][A-Za-z0-9+.\-]*:|//")
+
+OUTSIDE_SITE = ".."
+
+BrokenLink = namedtuple("BrokenLink", ["source", "link", "target"])
+
+
+def find_links(text):
+    """Find the links in the tags of an HTML or PHP document.
+
+    Returns a sorted list of the distinct values of the href, src and srcset
+    attributes, with one link per srcset candidate. PHP blocks and comments are
+    skipped.
+    """
+    links = set()
+    for tag in TAG.finditer(text):
+        tag = tag.group()
+        if not tag[1].isalpha():
+            continue
+        for match in LINK_ATTRIBUTE.finditer(tag):
+            value = match.group(2) or match.group(3) or match.group(4) or ""
+            if match.group(1).lower() == "srcset":
+                links.update(
+                    candidate.split()[0]
+                    for candidate in value.split(",")
+                    if candidate.strip()
+                )
+            else:
+                links.add(value.strip())
+    return sorted(links)
+
+
+def find_links_in_file(path):
+    with open(path, "rb") as f:
+        return find_links(f.read().decode("utf-8", errors="replace"))
+
+
+def resolve_link(source_key, link):
+    """Resolve a link in an output file to the key of its target.
+
+    Links to directories resolve to keys ending with a slash, or "" for the root.
+    Returns None for links which aren't checked: external links, links to fragments
+    of the same page, and links with template or PHP code. Returns OUTSIDE_SITE for
+    links which point above the root of the site.
+    """
+    if "#" in link:
+        link = link.split("#", 1)[0]
+    if "?" in link:
+        link = link.split("?", 1)[0]
+    if not link or "<?" in link or "{" in link or EXTERNAL_LINK.match(link):
+        return None
+    if "%" in link:
+        link = unquote(link)
+    parts = [] if link.startswith("/") else source_key.split("/")[:-1]
+    atoms = link.split("/")
+    for atom in atoms:
+        if atom == "..":
+            if not parts:
+                return OUTSIDE_SITE
+            parts.pop()
+        elif atom and atom != ".":
+            parts.append(atom)
+    key = "/".join(parts)
+    if parts and atoms[-1] in ("", ".", ".."):
+        key += "/"
+    return key
+
+
+class SiteFiles:
+    """The set of files of a site, to resolve links against."""
+
+    def __init__(self, keys):
+        self.files = set(keys)
+        # the endpoints of directories with an index file, such as "blog/", or ""
+        # for the root.
+        self.index_directories = {
+            key[: -len(posixpath.basename(key))]
+            for key in keys
+            if posixpath.basename(key).startswith("index.")
+        }
+
+    def find_broken_links(self, source_key, links):
+        """Get a list of (link, target) tuples for the broken links of a file."""
+        broken = []
+        for link in links:
+            target = resolve_link(source_key, link)
+            if (
+                target is None
+                or target in self.files
+                or target in self.index_directories
+                # a server redirects "blog" to "blog/".
+                or target + "/" in self.index_directories
+            ):
+                continue
+            broken.append((link, target))
+        return broken
+
+
+# the site files of a worker process, set by init_worker().
+_site_files = None
+
+
+def init_worker(site_files):
+    global _site_files
+    _site_files = site_files
+
+
+def check_file(key, path, site_files=None):
+    """Find the links in a file and check them.
+
+    Returns a tuple (links, broken), where broken is as from find_broken_links().
+    """
+    links = find_links_in_file(path)
+    return links, (site_files or _site_files).find_broken_links(key, links)
+
+
+def list_output_files(output_dir):
+    """List the files in an output directory, as keys."""
+    keys = []
+    pending = [("", str(output_dir))]
+    while pending:
+        prefix, directory = pending.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    pending.append((prefix + entry.name + "/", entry.path))
+                elif entry.is_file():
+                    keys.append(prefix + entry.name)
+    return keys
+
+
+def get_language(key, languages):
+    """Get the language of an output file, from the layout of localize_endpoint()."""
+    parts = key.split("/")
+    if len(parts) > 1 and parts[-2] in languages:
+        return parts[-2]
+    return None
+
+
+def check_links(
+    output_dir, languages=(), manifest_path=None, cache_dir=None, jobs=None
+):
+    """Check the links in the HTML and PHP files of a generated site.
+
+    The files are listed from the manifest at *manifest_path* if it is given, and
+    from the output directory otherwise. A link is valid if it points to a file of
+    the site, or to a directory with an index file. Files which aren't in a
+    directory named after one of the *languages* belong to the default language,
+    None.
+
+    The files are parsed in a pool of *jobs* processes. If *cache_dir* is given, the
+    links found in each file are cached there by the SHA-256 digest of the file, so
+    only new and changed files are parsed the next time. The digests are taken
+    from the manifest, if there is one. The broken links of unchanged files are
+    also reused, as long as no files were added or removed.
+
+    Returns a dictionary with a sorted list of BrokenLink tuples for each language,
+    with the keys of the source and target files, as resolved by resolve_link().
+    """
+    output_dir = Path(output_dir)
+    if manifest_path is not None:
+        digests = read_manifest(manifest_path)
+        keys = list(digests)
+    else:
+        digests = None
+        keys = list_output_files(output_dir)
+    site_files = SiteFiles(keys)
+    checked_keys = [key for key in keys if key.lower().endswith(CHECKED_SUFFIXES)]
+
+    cache = {}
+    digest_cache = None
+    if cache_dir is not None:
+        cache_dir = Path(cache_dir)
+        try:
+            with (cache_dir / LINK_CACHE_FILE_NAME).open(
+                mode="r", encoding="utf-8"
+            ) as f:
+                cache = json.load(f)
+            if cache.get("version") != LINKCHECK_VERSION:
+                cache = {}
+        except (OSError, ValueError):
+            cache = {}
+        if digests is None:
+            digest_cache = DigestCache(cache_dir / DIGEST_CACHE_FILE_NAME)
+            digest_cache.load()
+    cached_links = cache.get("links", {})
+    # the broken links of a file only change with its content and the set of files.
+    files_digest = data_digest(sorted(keys))
+    cached_broken = {}
+    if cache.get("files") == files_digest:
+        cached_broken = cache.get("broken", {})
+
+    def get_digest(key):
+        if digests is not None:
+            return digests[key]
+        if digest_cache is not None:
+            return digest_cache.digest(output_dir / key)
+        return None
+
+    file_digests = {key: get_digest(key) for key in checked_keys}
+    misses = [key for key in checked_keys if file_digests[key] not in cached_links]
+    paths = [str(output_dir / key) for key in misses]
+    # the links of the new and changed files are checked by the workers which
+    # parse them, the cached ones here.
+    if len(paths) >= PARALLEL_CHECK_THRESHOLD and jobs != 1:
+        with ProcessPoolExecutor(
+            jobs, initializer=init_worker, initargs=(site_files,)
+        ) as executor:
+            checked = list(executor.map(check_file, misses, paths, chunksize=64))
+    else:
+        checked = [
+            check_file(key, path, site_files) for key, path in zip(misses, paths)
+        ]
+    links = {}
+    broken_links = {}
+    for key, (file_links, broken) in zip(misses, checked):
+        links[key] = file_links
+        broken_links[key] = broken
+    for key in checked_keys:
+        if key not in links:
+            links[key] = cached_links[file_digests[key]]
+            cached = cached_broken.get(key, None)
+            if cached and cached[0] == file_digests[key]:
+                broken_links[key] = [tuple(broken) for broken in cached[1]]
+            else:
+                broken_links[key] = site_files.find_broken_links(key, links[key])
+
+    report = {}
+    for key in checked_keys:
+        broken = report.setdefault(get_language(key, languages), [])
+        for link, target in broken_links[key]:
+            broken.append(BrokenLink(key, link, target))
+    for broken in report.values():
+        broken.sort()
+
+    if cache_dir is not None:
+        used = {file_digests[key]: links[key] for key in checked_keys}
+        used.pop(None, None)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        write_json_file(
+            cache_dir / LINK_CACHE_FILE_NAME,
+            {
+                "version": LINKCHECK_VERSION,
+                "links": used,
+                "files": files_digest,
+                "broken": {
+                    key: [file_digests[key], broken_links[key]]
+                    for key in checked_keys
+                    if file_digests[key] is not None
+                },
+            },
+        )
+        if digest_cache is not None:
+            digest_cache.save()
+    return report
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Check the links in a generated site.")
+    parser.add_argument("output_dir", help="the output directory of the build")
+    parser.add_argument(
+        "--languages", default="", help="comma-separated language tags of the site"
+    )
+    parser.add_argument("--manifest", help="the manifest file of the build")
+    parser.add_argument("--cache", help="a directory to cache the results in")
+    parser.add_argument(
+        "--jobs", type=int, default=None, help="the number of worker processes"
+    )
+    options = parser.parse_args(sys.argv[1:] if args is None else args)
+    languages = [tag for tag in options.languages.split(",") if tag]
+    report = check_links(
+        options.output_dir,
+        languages,
+        options.manifest,
+        options.cache,
+        options.jobs,
+    )
+    count = 0
+    for language in sorted(report, key=lambda tag: tag or ""):
+        broken = report[language]
+        if not broken:
+            continue
+        print("%s: %d broken links" % (language or "default", len(broken)))
+        for source, link, target in broken:
+            print('  /%s: "%s"' % (source, link))
+        count += len(broken)
+    print("%d broken links" % count)
+    return 1 if count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
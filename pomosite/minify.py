@@ -0,0 +1,172 @@
+"""Minification of rendered pages and text resources.
+
+The minifiers are conservative: they remove comments and collapse whitespace where
+it can't change how a page is rendered, and leave everything else alone. PHP blocks,
+tags with their attributes, and the content of pre, textarea, script and style
+elements are kept intact in HTML and PHP files.
+"""
+
+from pathlib import Path
+import hashlib
+import re
+from .translation import write_cache_file
+
+# bump to invalidate the cached output when the minifiers change.
+MINIFY_VERSION = 1
+
+HTML_TOKEN = re.compile(
+    r"(?P<keep><\?.*?(?:\?>|\Z)"  # PHP blocks, also unterminated ones.
+    r"|<!--\[if.*?<!\[endif\]-->"  # conditional comments.
+    r"|<(?P<raw>pre|textarea|script|style)\b.*?</(?P=raw)\s*>"
+    r"|<!DOCTYPE[^>]*>"
+    r"|</?[A-Za-z][^\s>/]*(?:\s+[^\s\"'>/=]+(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'>]+))?)*\s*/?>)"
+    r"|(?P<comment><!--.*?-->)",
+    re.S | re.I,
+)
+CSS_TOKEN = re.compile(
+    r"(?P<keep>\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|/\*!.*?\*/)"
+    r"|(?P<comment>/\*.*?\*/)",
+    re.S,
+)
+WHITESPACE = re.compile(r"\s+")
+CSS_PUNCTUATION = re.compile(r"\s*([{};,>])\s*")
+# a space before a colon is a descendant combinator in a selector, as in "a :hover",
+# but a space after it never matters.
+CSS_COLON = re.compile(r":\s+")
+
+
+def collapse_whitespace(text):
+    # a run of whitespace renders as a single space; keep line breaks for
+    # readability of the output.
+    return WHITESPACE.sub(lambda m: "\n" if "\n" in m.group() else " ", text)
+
+
+def minify_tokens(token_pattern, minify_text, text):
+    """Minify the text between the tokens, keep "keep" tokens and drop comments."""
+    parts = []
+    pending = []
+    position = 0
+    for match in token_pattern.finditer(text):
+        pending.append(text[position : match.start()])
+        if match.group("keep") is not None:
+            # the text around a dropped comment is minified as one.
+            parts.append(minify_text("".join(pending)))
+            parts.append(match.group())
+            pending = []
+        position = match.end()
+    pending.append(text[position:])
+    parts.append(minify_text("".join(pending)))
+    return "".join(parts)
+
+
+def minify_html(text):
+    """Minify HTML, or PHP with HTML."""
+    return minify_tokens(HTML_TOKEN, collapse_whitespace, text).strip() + "\n"
+
+
+def minify_css_text(text):
+    text = CSS_PUNCTUATION.sub(r"\1", WHITESPACE.sub(" ", text))
+    text = CSS_COLON.sub(":", text)
+    return text.replace(";}", "}")
+
+
+def minify_css(text):
+    """Minify CSS. Comments starting with "/*!" are kept."""
+    return minify_tokens(CSS_TOKEN, minify_css_text, text).strip() + "\n"
+
+
+def minify_js(text):
+    """Minify JavaScript by removing indentation, trailing whitespace and empty lines.
+
+    Indentation is kept in files with template literals, and after lines continued
+    with a backslash, where it may be part of a string.
+    """
+    keep_indentation = "`" in text
+    lines = []
+    continued = False
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not keep_indentation and not continued:
+            line = line.lstrip()
+        if line or continued:
+            lines.append(line)
+        continued = line.endswith("\\")
+    return "\n".join(lines) + "\n"
+
+
+DEFAULT_MINIFIERS = {
+    ".html": minify_html,
+    ".htm": minify_html,
+    ".php": minify_html,
+    ".css": minify_css,
+    ".js": minify_js,
+}
+
+
+def get_minifiers(minify):
+    """Get the minifiers for the *minify* argument of generate().
+
+    If *minify* is True, rendered pages and resources are minified with the default
+    minifiers: HTML and PHP files, CSS and JS files. It can also be a dictionary of
+    file suffix, such as ".css", to a function which takes the content of a file as
+    a string and returns it minified. With *jobs*, such functions must be defined at
+    module level. The minified output is cached in the temp directory by the digest
+    of the input.
+
+    Returns a dictionary of lower-case file suffix to minifier function.
+    """
+    if not minify:
+        return {}
+    if minify is True:
+        return dict(DEFAULT_MINIFIERS)
+    return {suffix.lower(): function for suffix, function in minify.items()}
+
+
+def get_minifier(minifiers, key):
+    """Get the minifier for an output file, or None."""
+    if not minifiers:
+        return None
+    return minifiers.get(Path(key).suffix.lower(), None)
+
+
+def get_minifier_name(function):
+    return "%s.%s" % (function.__module__, function.__qualname__)
+
+
+def describe_minifier(function):
+    """Describe a minifier as a JSON-serializable value, for the build state."""
+    if function is None:
+        return None
+    return [get_minifier_name(function), MINIFY_VERSION]
+
+
+class MinifyCache:
+    """Minified output, cached by minifier and the SHA-256 digest of the input.
+
+    If a cache directory is given, the output is kept there between builds.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+
+    def minify(self, function, data):
+        """Minify UTF-8 encoded *data* with a minifier function, returning bytes."""
+        if self.cache_dir is None:
+            return function(data.decode("utf-8")).encode("utf-8")
+        hash = hashlib.sha256()
+        hash.update(b"%d\0" % MINIFY_VERSION)
+        hash.update(get_minifier_name(function).encode("utf-8") + b"\0")
+        hash.update(data)
+        key = hash.hexdigest()
+        path = self.cache_dir / key[:2] / key
+        try:
+            return path.read_bytes()
+        except OSError:
+            pass
+        minified = function(data.decode("utf-8")).encode("utf-8")
+        try:
+            write_cache_file(path, minified)
+        except OSError:
+            # another thread got there first; the cache is only an optimization.
+            pass
+        return minified
@@ -0,0 +1,176 @@
+"""Build profiling: timings of build phases and page renders, and counters.
+
+Pass a BuildProfile to generate() to record a profile of a build, then write it as
+a JSON summary or as a Chrome trace event file, which can be viewed in
+chrome://tracing or https://ui.perfetto.dev.
+"""
+
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# tracemalloc.reset_peak() was added in Python 3.9.
+RESET_PEAK = hasattr(tracemalloc, "reset_peak")
+
+
+class BuildProfile:
+    """A profile of one or more builds.
+
+    A span is a timed section of the build, with a name, a category such as "phase"
+    or "render" and optional arguments. Spans can be recorded in worker processes
+    and added with add_spans(), as the timestamps are taken from a system-wide
+    monotonic clock.
+
+    If *trace_memory* is set, the peak memory allocated by Python in the main process
+    is recorded for each phase with tracemalloc, which slows down the build.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.start_ns = time.perf_counter_ns()
+        self.spans = []
+        self.counters = {}
+        self.memory_peaks = {}
+        # the peak memory so far of each open phase, innermost last.
+        self.memory_stack = []
+        self.started_tracing = False
+
+    @contextmanager
+    def span(self, name, category="phase", **args):
+        """Time the enclosed code as a span."""
+        trace_memory = self.trace_memory and category == "phase"
+        if trace_memory:
+            self.enter_memory_span()
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end_ns = time.perf_counter_ns()
+            self.spans.append(
+                make_span(name, category, start_ns, end_ns - start_ns, args)
+            )
+            if trace_memory:
+                peak = self.exit_memory_span()
+                self.memory_peaks[name] = max(self.memory_peaks.get(name, 0), peak)
+
+    def enter_memory_span(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        if not RESET_PEAK:
+            # the peak can't be reset before Python 3.9. a phase which raises the
+            # peak reached it, otherwise it is estimated from the traced memory.
+            self.memory_stack.append(tracemalloc.get_traced_memory())
+            return
+        # resetting the peak would lose it for the enclosing phases, so it is
+        # folded into theirs first.
+        if self.memory_stack:
+            peak = tracemalloc.get_traced_memory()[1]
+            self.memory_stack[-1] = max(self.memory_stack[-1], peak)
+        tracemalloc.reset_peak()
+        self.memory_stack.append(0)
+
+    def exit_memory_span(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if RESET_PEAK:
+            peak = max(self.memory_stack.pop(), peak)
+            if self.memory_stack:
+                self.memory_stack[-1] = max(self.memory_stack[-1], peak)
+        else:
+            start_current, start_peak = self.memory_stack.pop()
+            if peak <= start_peak:
+                peak = max(start_current, current)
+        if not self.memory_stack and self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        return peak
+
+    def add_spans(self, spans):
+        """Add spans made by make_span(), e.g. in a worker process."""
+        self.spans.extend(spans)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Summarize the profile as a dictionary.
+
+        The summary has the total time of each phase, the count, total and maximum
+        time of the renders of each template, the counters and the memory peaks.
+        """
+        phases = {}
+        templates = {}
+        for span in self.spans:
+            seconds = span["duration_ns"] / 1e9
+            if span["category"] == "phase":
+                phases[span["name"]] = phases.get(span["name"], 0) + seconds
+            elif span["category"] == "render":
+                template = templates.setdefault(
+                    span["args"]["template"],
+                    {"count": 0, "total_seconds": 0, "max_seconds": 0},
+                )
+                template["count"] += 1
+                template["total_seconds"] += seconds
+                template["max_seconds"] = max(template["max_seconds"], seconds)
+        return {
+            "phases": phases,
+            "templates": templates,
+            "counters": dict(self.counters),
+            "memory_peaks": dict(self.memory_peaks),
+        }
+
+    def write_summary(self, path):
+        """Write the summary as a JSON file."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
+
+    def write_chrome_trace(self, path):
+        """Write the spans as a Chrome trace event file."""
+        events = [
+            {
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": (span["start_ns"] - self.start_ns) / 1000,
+                "dur": span["duration_ns"] / 1000,
+                "pid": span["pid"],
+                "tid": span["tid"],
+                "args": span["args"],
+            }
+            for span in self.spans
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def make_span(name, category, start_ns, duration_ns, args=None):
+    return {
+        "name": name,
+        "category": category,
+        "start_ns": start_ns,
+        "duration_ns": duration_ns,
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "args": args or {},
+    }
+
+
+class NullProfile:
+    """A profile which records nothing, used when profiling is turned off."""
+
+    trace_memory = False
+
+    def span(self, name, category="phase", **args):
+        return nullcontext()
+
+    def add_spans(self, spans):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+
+NULL_PROFILE = NullProfile()
@@ -0,0 +1,217 @@
+"""Client-side search: an inverted index of the rendered pages, split into shards.
+
+The index is declared with add_search_index(), which adds an item for the index
+manifest to the site configuration, so that templates can refer to it with
+url_for(). generate() builds the index from the rendered pages, with the pages of
+each language in an index of their own. The manifest lists the shards of each
+language, and each shard holds the terms with the same prefix, so a browser only
+loads the shards of the terms it searches for.
+
+Each language has a directory next to the manifest, named after the language tag or
+DEFAULT_LANGUAGE_DIR, with the documents in "_docs.json", as [url, title] pairs,
+and the shards in "<prefix>.json", as {term: [[document, count], ...]}.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from html import unescape
+from pathlib import Path
+import hashlib
+import json
+import posixpath
+import re
+from .buildstate import write_json_file
+from .sinks import DirectorySink
+
+# bump to invalidate the cached terms when the way pages are tokenized changes.
+SEARCH_VERSION = 1
+SEARCH_CACHE_FILE_NAME = "search.json"
+DEFAULT_LANGUAGE_DIR = "default"
+# shard names never start with an underscore followed by a letter other than a-f.
+DOCS_FILE_NAME = "_docs.json"
+DEFAULT_PREFIX_LENGTH = 2
+MIN_TERM_LENGTH = 2
+SEARCHED_SUFFIXES = (".html", ".htm")
+# tokenize the pages in a process pool when there are at least this many.
+PARALLEL_INDEX_THRESHOLD = 256
+
+SKIPPED = re.compile(
+    r"<\?.*?(?:\?>|\Z)|<!--.*?-->|<(head|script|style|template)\b.*?</\1\s*>",
+    re.S | re.I,
+)
+TITLE = re.compile(r"<title\b[^>]*>(.*?)</title\s*>", re.S | re.I)
+TAG = re.compile(r"<[^>]*>")
+TERM = re.compile(r"\w+")
+SAFE_SHARD_NAME = re.compile(r"[a-z0-9]+")
+
+
+def extract_text(html):
+    """Extract the title and the text of an HTML page.
+
+    The text of the head, script and style elements, comments and PHP blocks is
+    left out.
+    """
+    title = TITLE.search(html)
+    title = unescape(TAG.sub("", title.group(1))).strip() if title else ""
+    text = unescape(TAG.sub(" ", SKIPPED.sub(" ", html)))
+    return title, text
+
+
+def tokenize(text):
+    """Split a text into lower-case terms, and count them."""
+    terms = {}
+    for term in TERM.findall(text.casefold()):
+        if len(term) >= MIN_TERM_LENGTH:
+            terms[term] = terms.get(term, 0) + 1
+    return terms
+
+
+def index_page(data):
+    """Get the title and the term counts of a page, from its UTF-8 content."""
+    title, text = extract_text(data.decode("utf-8", errors="replace"))
+    return title, tokenize(title + " " + text)
+
+
+def index_page_file(path):
+    with open(path, "rb") as f:
+        return index_page(f.read())
+
+
+def get_shard_name(term, prefix_length):
+    """Get the name of the shard of a term: its prefix, or its hex-encoded prefix
+    if that isn't made of lower-case ASCII letters and digits."""
+    prefix = term[:prefix_length]
+    if SAFE_SHARD_NAME.fullmatch(prefix):
+        return prefix
+    return "_" + prefix.encode("utf-8").hex()
+
+
+def build_index(pages, prefix_length=DEFAULT_PREFIX_LENGTH):
+    """Build an inverted index of pages, split into shards by term prefix.
+
+    *pages* is a list of (url, title, terms) tuples. Returns a tuple (docs, shards)
+    where docs is a list of [url, title] pairs, and shards is a dictionary of shard
+    name to {term: [[document, count], ...]}, with the documents as indices into
+    docs.
+    """
+    docs = []
+    shards = {}
+    for document, (url, title, terms) in enumerate(pages):
+        docs.append([url, title])
+        for term, count in terms.items():
+            shard = shards.setdefault(get_shard_name(term, prefix_length), {})
+            shard.setdefault(term, []).append([document, count])
+    return docs, shards
+
+
+def encode_index_file(data):
+    return json.dumps(
+        data, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def load_search_cache(cache_path):
+    if cache_path is None:
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != SEARCH_VERSION:
+        return {}
+    return cache.get("pages", {})
+
+
+def write_search_index(
+    sink,
+    pages,
+    manifest_key,
+    prefix_length=DEFAULT_PREFIX_LENGTH,
+    file_list=[],
+    build_state=None,
+    file_digests=None,
+    cache_path=None,
+    jobs=1,
+):
+    """Build the search index of the rendered pages of a site, and write it to a sink.
+
+    *pages* is a dictionary with a list of (url, output_key) tuples for each
+    language tag, and the manifest is written to *manifest_key*, with the language
+    directories next to it. The pages are read back from the sink, which must
+    support read(). The title and term counts of each page are cached in a file at
+    *cache_path* by the SHA-256 digest of the page, so only new and changed pages
+    are tokenized, in a pool of *jobs* processes if there are many.
+
+    The index files are added to the file list, to *sink.digests* and to
+    *file_digests*, and are recorded in the build state. Index files with the same
+    content as in the previous build are kept as they are. Returns the number of
+    pages which were tokenized.
+    """
+    cache = load_search_cache(cache_path)
+    misses = {}
+    for language_pages in pages.values():
+        for _, output_key in language_pages:
+            digest = sink.digests[output_key]
+            if digest not in cache and digest not in misses:
+                misses[digest] = output_key
+    if (
+        len(misses) >= PARALLEL_INDEX_THRESHOLD
+        and jobs > 1
+        and isinstance(sink, DirectorySink)
+    ):
+        with ProcessPoolExecutor(jobs) as executor:
+            indexed = executor.map(
+                index_page_file,
+                [str(sink.path / key) for key in misses.values()],
+                chunksize=64,
+            )
+            for digest, (title, terms) in zip(list(misses), indexed):
+                cache[digest] = [title, terms]
+    else:
+        for digest, output_key in misses.items():
+            cache[digest] = list(index_page(sink.read(output_key)))
+
+    used = {}
+    manifest = {"prefix_length": prefix_length, "languages": {}}
+    base_dir = posixpath.dirname(manifest_key)
+    index_files = {}
+    for language_tag, language_pages in pages.items():
+        index_pages = []
+        for url, output_key in language_pages:
+            digest = sink.digests[output_key]
+            used[digest] = cache[digest]
+            title, terms = cache[digest]
+            index_pages.append((url, title, terms))
+        docs, shards = build_index(index_pages, prefix_length)
+        language_dir = language_tag or DEFAULT_LANGUAGE_DIR
+        index_files[posixpath.join(language_dir, DOCS_FILE_NAME)] = docs
+        for name, shard in shards.items():
+            index_files[posixpath.join(language_dir, name + ".json")] = shard
+        manifest["languages"][language_tag or ""] = {
+            "docs": posixpath.join(language_dir, DOCS_FILE_NAME),
+            "shards": sorted(shards),
+            "documents": len(docs),
+        }
+
+    def write_index_file(key, data):
+        data = encode_index_file(data)
+        digest = hashlib.sha256(data).hexdigest()
+        previous = build_state.get_previous(key) if build_state is not None else None
+        if not (previous and previous["digest"] == digest and sink.keep(key)):
+            sink.write(key, data)
+        output_path = sink.get_name(key)
+        file_list.append(output_path)
+        sink.digests[key] = digest
+        if file_digests is not None:
+            file_digests[output_path] = digest
+        if build_state is not None:
+            build_state.record(key, {"search": manifest_key, "digest": digest})
+
+    for name, data in index_files.items():
+        write_index_file(posixpath.join(base_dir, name), data)
+    write_index_file(manifest_key, manifest)
+
+    if cache_path is not None:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        write_json_file(cache_path, {"version": SEARCH_VERSION, "pages": used})
+    return len(misses)
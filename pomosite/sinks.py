@@ -0,0 +1,398 @@
+"""Output sinks: the destinations where generated sites are written.
+
+Files are identified by keys, which are paths relative to the root of the site with
+forward slashes, such as "en/index.html".
+"""
+
+from pathlib import Path
+import ctypes
+import ctypes.util
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tarfile
+import time
+import zipfile
+from .buildstate import DigestCache
+
+MANIFEST_FILE_NAME = ".site.txt"
+STREAM_BUFFER_SIZE = 1 << 16
+STAGING_SUFFIX = ".staging"
+# renameat2() constants, from <linux/fs.h> and <fcntl.h>.
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+
+def copy_stream(fsrc, fdst, chunk_size=1 << 20):
+    """Copy a file object in fixed-size chunks and return the SHA-256 digest."""
+    hash = hashlib.sha256()
+    for chunk in iter(lambda: fsrc.read(chunk_size), b""):
+        hash.update(chunk)
+        fdst.write(chunk)
+    return hash.hexdigest()
+
+
+def write_chunks(chunks, fdst):
+    """Write an iterable of bytes chunks to a file object.
+
+    Returns a tuple (digest, size) with the SHA-256 digest and the size of the data.
+    """
+    hash = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        hash.update(chunk)
+        fdst.write(chunk)
+        size += len(chunk)
+    return hash.hexdigest(), size
+
+
+def format_manifest(digests):
+    """Format a manifest with one "/path;digest" line per file, sorted by path."""
+    return "".join("/%s;%s\n" % (key, digests[key]) for key in sorted(digests))
+
+
+class HashingReader:
+    """File object wrapper which computes the SHA-256 digest of the data read."""
+
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.hash.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+class OutputSink:
+    """Base class for output sinks.
+
+    The SHA-256 digest of each file written by generate() is added to *digests*,
+    with the key as key, so that a manifest can be written without reading the
+    files back.
+    """
+
+    def __init__(self):
+        self.digests = {}
+
+    def get_name(self, key):
+        """Get the name of a file for the file list of generate()."""
+        return key
+
+    def write(self, key, data):
+        """Write a file with the given content (bytes)."""
+        raise NotImplementedError()
+
+    def copy_file(self, key, source):
+        """Copy a file into the sink and return the SHA-256 digest of it."""
+        raise NotImplementedError()
+
+    def read(self, key):
+        """Read back a file which was written to the sink.
+
+        Sinks which stream the files elsewhere can't, and raise NotImplementedError.
+        """
+        raise NotImplementedError()
+
+    def write_stream(self, key, chunks):
+        """Write a file from an iterable of bytes chunks.
+
+        Returns a tuple (digest, size) with the SHA-256 digest and the size of the
+        file. Sinks which can't write a file in pieces join the chunks first.
+        """
+        data = b"".join(chunks)
+        self.write(key, data)
+        return hashlib.sha256(data).hexdigest(), len(data)
+
+    def write_manifest(self, key=MANIFEST_FILE_NAME):
+        """Write a manifest of the files in *digests* to the sink.
+
+        The format is the same as for write_manifest_file().
+        """
+        self.write(key, format_manifest(self.digests).encode("utf-8"))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DirectorySink(OutputSink):
+    """Write the files to a directory, which is created if it doesn't exist."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = Path(".").resolve() / path
+
+    def get_name(self, key):
+        """Get the absolute path of a file."""
+        return str(self.path / key)
+
+    def unlink(self, key):
+        # never write through a hard link, to a resource source of an earlier build
+        # or to the previous output of a staged build.
+        try:
+            (self.path / key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def write(self, key, data):
+        path = self.path / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.unlink(key)
+        with path.open(mode="wb") as f:
+            f.write(data)
+
+    def copy_file(self, key, source):
+        path = self.path / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.unlink(key)
+        with open(source, "rb") as fsrc, path.open(mode="wb") as fdst:
+            return copy_stream(fsrc, fdst)
+
+    def read(self, key):
+        return (self.path / key).read_bytes()
+
+    def write_stream(self, key, chunks):
+        # the chunks may come from a render which fails halfway, so they are written
+        # to a temporary file which only replaces the previous file once complete.
+        path = self.path / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name("%s.%d.tmp" % (path.name, os.getpid()))
+        try:
+            with temp_path.open(mode="wb", buffering=STREAM_BUFFER_SIZE) as f:
+                result = write_chunks(chunks, f)
+            os.replace(str(temp_path), str(path))
+        except BaseException:
+            try:
+                temp_path.unlink()
+            except FileNotFoundError:
+                pass
+            raise
+        return result
+
+    def keep(self, key):
+        """Keep a file from the previous build. Returns False if there is none."""
+        return (self.path / key).is_file()
+
+
+def exchange_directories(a, b):
+    """Swap two directories atomically, where the platform supports it.
+
+    Uses renameat2() with RENAME_EXCHANGE on Linux. Returns False if that isn't
+    available, and the caller has to fall back to two renames.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):
+        return False
+    result = renameat2(
+        AT_FDCWD, os.fsencode(str(a)), AT_FDCWD, os.fsencode(str(b)), RENAME_EXCHANGE
+    )
+    return result == 0
+
+
+class StagingSink(DirectorySink):
+    """Build into a staging directory, then swap it with the output directory.
+
+    The staging directory is a sibling of the output directory, named with
+    STAGING_SUFFIX. Files with the same content as in the output directory are hard
+    linked from there instead of being written again. commit() replaces the output
+    directory with the staging directory, atomically on Linux. Until then, the
+    output directory is left as it is.
+
+    The digests of the files in the output directory are taken from *digest_cache*,
+    which is keyed by size and modification time, so they are only read once.
+    """
+
+    def __init__(self, path, digest_cache=None):
+        self.final_path = Path(".").resolve() / path
+        super().__init__(
+            self.final_path.with_name(self.final_path.name + STAGING_SUFFIX)
+        )
+        self.digest_cache = digest_cache if digest_cache is not None else DigestCache()
+        if self.path.exists():
+            # left behind by a failed build.
+            shutil.rmtree(str(self.path))
+        self.path.mkdir(parents=True)
+
+    def get_name(self, key):
+        """Get the absolute path of a file in the output directory."""
+        return str(self.final_path / key)
+
+    def link_previous(self, key, digest=None):
+        """Link a file from the output directory into the staging directory.
+
+        If a *digest* is given, the file is only linked if it has that digest.
+        Falls back to copying on file systems without hard links. Returns False if
+        there is no such file.
+        """
+        previous = self.final_path / key
+        if digest is None:
+            if not previous.is_file():
+                return False
+        elif self.digest_cache.digest(previous) != digest:
+            return False
+        path = self.path / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(str(previous), str(path))
+        except FileExistsError:
+            return False
+        except OSError:
+            shutil.copyfile(str(previous), str(path))
+        return True
+
+    def write(self, key, data):
+        if not self.link_previous(key, hashlib.sha256(data).hexdigest()):
+            super().write(key, data)
+
+    def copy_file(self, key, source):
+        digest = self.digest_cache.digest(source)
+        if self.link_previous(key, digest):
+            return digest
+        return super().copy_file(key, source)
+
+    def write_stream(self, key, chunks):
+        # the digest is only known once the file is written, so an unchanged file
+        # is replaced with a link afterwards.
+        digest, size = super().write_stream(key, chunks)
+        if self.digest_cache.digest(self.final_path / key) == digest:
+            self.unlink(key)
+            self.link_previous(key, digest)
+        return digest, size
+
+    def keep(self, key):
+        return self.link_previous(key)
+
+    def commit(self):
+        """Replace the output directory with the staging directory."""
+        if not self.final_path.exists():
+            os.rename(str(self.path), str(self.final_path))
+            return
+        if not exchange_directories(self.path, self.final_path):
+            old_path = self.final_path.with_name(self.final_path.name + ".old")
+            if old_path.exists():
+                shutil.rmtree(str(old_path))
+            os.rename(str(self.final_path), str(old_path))
+            os.rename(str(self.path), str(self.final_path))
+            self.path = old_path
+        # the previous output is now where the staging directory was.
+        shutil.rmtree(str(self.path))
+        self.path = self.final_path
+
+    def abort(self):
+        """Discard the staging directory, leaving the output directory as it is."""
+        shutil.rmtree(str(self.path), ignore_errors=True)
+
+
+class MemorySink(OutputSink):
+    """Keep the files in memory, in the *files* dictionary of key to content."""
+
+    def __init__(self):
+        super().__init__()
+        self.files = {}
+
+    def write(self, key, data):
+        self.files[key] = bytes(data)
+
+    def read(self, key):
+        return self.files[key]
+
+    def copy_file(self, key, source):
+        with open(source, "rb") as f:
+            data = f.read()
+        self.files[key] = data
+        return hashlib.sha256(data).hexdigest()
+
+
+class TarSink(OutputSink):
+    """Stream the files into a tar archive.
+
+    *file* is a path or a writable file object, which doesn't need to be seekable.
+    *compression* is "gz", "bz2", "xz" or "" for none. All files get the
+    modification time *mtime*, which defaults to the time the sink is created.
+
+    write_stream() joins the chunks in memory, since the size of a file goes before
+    its data in a tar archive.
+    """
+
+    def __init__(self, file, compression="gz", mtime=None):
+        super().__init__()
+        mode = "w|" + compression
+        if isinstance(file, (str, os.PathLike)):
+            self.tar = tarfile.open(str(file), mode)
+        else:
+            self.tar = tarfile.open(fileobj=file, mode=mode)
+        self.mtime = int(time.time() if mtime is None else mtime)
+
+    def create_tarinfo(self, key, size):
+        tarinfo = tarfile.TarInfo(key)
+        tarinfo.size = size
+        tarinfo.mtime = self.mtime
+        tarinfo.mode = 0o644
+        return tarinfo
+
+    def write(self, key, data):
+        self.tar.addfile(self.create_tarinfo(key, len(data)), io.BytesIO(data))
+
+    def copy_file(self, key, source):
+        with open(source, "rb") as f:
+            reader = HashingReader(f)
+            size = os.fstat(f.fileno()).st_size
+            self.tar.addfile(self.create_tarinfo(key, size), reader)
+        return reader.hexdigest()
+
+    def close(self):
+        self.tar.close()
+
+
+class ZipSink(OutputSink):
+    """Stream the files into a zip archive.
+
+    *file* is a path or a writable file object, which doesn't need to be seekable.
+    All files get the modification time *mtime*, which defaults to the time the sink
+    is created.
+    """
+
+    def __init__(self, file, compression=zipfile.ZIP_DEFLATED, mtime=None):
+        super().__init__()
+        if isinstance(file, os.PathLike):
+            file = str(file)
+        self.zip = zipfile.ZipFile(file, "w", compression)
+        self.date_time = time.localtime(time.time() if mtime is None else mtime)[:6]
+
+    def create_zipinfo(self, key):
+        zipinfo = zipfile.ZipInfo(key, self.date_time)
+        zipinfo.compress_type = self.zip.compression
+        zipinfo.external_attr = 0o644 << 16
+        return zipinfo
+
+    def write(self, key, data):
+        self.zip.writestr(self.create_zipinfo(key), data)
+
+    def copy_file(self, key, source):
+        with open(source, "rb") as fsrc:
+            zipinfo = self.create_zipinfo(key)
+            zipinfo.file_size = os.fstat(fsrc.fileno()).st_size
+            with self.zip.open(zipinfo, "w") as fdst:
+                return copy_stream(fsrc, fdst)
+
+    def write_stream(self, key, chunks):
+        with self.zip.open(self.create_zipinfo(key), "w") as fdst:
+            return write_chunks(chunks, fdst)
+
+    def close(self):
+        self.zip.close()
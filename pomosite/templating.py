@@ -4,11 +4,48 @@ Isolation layer for the jinja2 package.
 """
 
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
 import jinja2
-import shutil
+import jinja2.bccache
+import jinja2.meta
 import re
 import hashlib
-from .translation import translate_page_templates
+import time
+from collections import OrderedDict
+from .translation import (
+    translate_page_templates,
+    write_if_changed,
+    TRANSLATION_ENGINES,
+)
+from .buildstate import BuildState, DigestCache, data_digest, file_digest
+from .datasources import RecordReader
+from .sinks import (
+    OutputSink,
+    DirectorySink,
+    StagingSink,
+    MemorySink,
+    STREAM_BUFFER_SIZE,
+    copy_stream,
+)
+from .bundle import BundleLoader, BundleWriter, find_valid_bundle_sets
+from .profiling import NULL_PROFILE, make_span
+from .compression import GZIP_CACHE_FILE_NAME, GZIP_MIN_SIZE, write_gzip_sidecars
+from .fingerprint import fingerprint_resources as apply_fingerprints
+from .minify import MinifyCache, describe_minifier, get_minifier, get_minifiers
+from .images import add_derivative_items, get_image_format
+from .search import SEARCH_CACHE_FILE_NAME, SEARCHED_SUFFIXES, write_search_index
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CACHE_DIR_NAME = ".cache"
+RELATIVE_URL_CACHE_SIZE = 4096
+COPY_STRATEGIES = ("copy", "skip-unchanged", "hardlink", "reflink")
+# ioctl request code for cloning a file on Linux, from <linux/fs.h>.
+FICLONE = 0x40049409
 
 
 class ConfigurationError(Exception):
@@ -62,6 +99,14 @@ def validate_config(site_config):
                 "Template directory is missing in the site configuration."
             )
 
+        if "collection" in page and not page["collection"] in site_config.get(
+            "collections", {}
+        ):
+            raise ConfigurationError(
+                "Item with id %s is in the unknown collection %s."
+                % (page_id, page["collection"])
+            )
+
         if "template" in page and "source" in page:
             raise ConfigurationError(
                 "Item with id %s has both 'template' and 'source' attributes. It may only have one."
@@ -69,6 +114,22 @@ def validate_config(site_config):
             )
 
 
+def check_unique_endpoints(item_config):
+    """Check that no two items have the same endpoint.
+
+    validate_config() checks the configured items; this also covers the image
+    derivatives and fingerprinted endpoints which are added by generate().
+    """
+    item_ids = {}
+    for item_id, item in item_config.items():
+        other_id = item_ids.setdefault(item["endpoint"], item_id)
+        if other_id != item_id:
+            raise ConfigurationError(
+                'Items %s and %s have the same endpoint "%s".'
+                % (other_id, item_id, item["endpoint"])
+            )
+
+
 def make_relative_url(from_endpoint, to_endpoint):
     # split both paths. they should always start with a slash.
     f = from_endpoint.split("/")
@@ -107,7 +168,73 @@ def localize_endpoint(endpoint, language_tag):
     return "/".join(atoms)
 
 
-def get_output_path(item, output_dir, language_tag):
+def build_endpoint_table(item_config, language_tags):
+    """Precompute the localized endpoint of every item for every language.
+
+    Returns a dictionary with a dictionary of item IDs to endpoints for each language
+    tag. The endpoints of templated pages are localized, the others are not.
+    """
+    return {
+        language_tag: {
+            id: (
+                localize_endpoint(item["endpoint"], language_tag)
+                if "template" in item
+                else item["endpoint"]
+            )
+            for id, item in item_config.items()
+        }
+        for language_tag in language_tags
+    }
+
+
+class RelativeUrlCache:
+    """Bounded LRU cache for make_relative_url(), with hit and miss counters."""
+
+    def __init__(self, size=RELATIVE_URL_CACHE_SIZE):
+        self.size = size
+        self.urls = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, from_endpoint, to_endpoint):
+        key = (from_endpoint, to_endpoint)
+        url = self.urls.get(key, None)
+        if url is not None:
+            self.hits += 1
+            self.urls.move_to_end(key)
+            return url
+        self.misses += 1
+        url = make_relative_url(from_endpoint, to_endpoint)
+        self.urls[key] = url
+        if len(self.urls) > self.size:
+            self.urls.popitem(last=False)
+        return url
+
+
+def get_item_reference(item, srcset=False):
+    """Get what a page depends on of an item it references, for the build state.
+
+    That is the endpoint, whether the item is a page and, for srcset_for(), the
+    derivatives of the image.
+    """
+    reference = [item["endpoint"], "template" in item]
+    if srcset:
+        reference.append(item.get("srcset", {}))
+    return reference
+
+
+def get_page_config_digest(page):
+    """Get the digest of a page config for the build state.
+
+    The position of a collection record is left out, since the record digest covers
+    the content, so inserting a record doesn't make the following pages outdated.
+    """
+    if "collection" in page:
+        page = {name: value for name, value in page.items() if name != "position"}
+    return data_digest(page)
+
+
+def get_output_key(item, language_tag):
     endpoint = item["endpoint"]
     if endpoint.endswith("/"):
         if "template" in item:
@@ -118,28 +245,226 @@ def get_output_path(item, output_dir, language_tag):
 
     endpoint = localize_endpoint(endpoint, language_tag)
 
-    return Path(".").resolve() / output_dir / strip_leading_slash(endpoint)
+    return strip_leading_slash(endpoint)
 
 
 def ensure_parent_dir_exists(path):
-    if not path.parent.exists():
-        path.parent.mkdir(parents=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
 
 
-def generate_pages_from_templates(site_config, output_dir, file_list=[]):
-    @jinja2.pass_context
-    def url_for(context, id, rooted=None):
-        item = site_config["item_config"].get(id, None)
-        if not item:
-            raise InvalidReferenceError('Invalid page id "%s".' % id)
+def find_template_dependencies(jinja_env, template_name):
+    """Find the templates that a template depends on, including the template itself.
 
-        to_endpoint = item["endpoint"]
-        if "template" in item:
-            localized_to_endpoint = localize_endpoint(
-                to_endpoint, context["language_tag"]
+    References through extends, include and import are followed recursively. A
+    dynamic reference which can't be resolved statically makes the template depend
+    on all templates.
+    """
+    dependencies = set()
+    pending = [template_name]
+    while pending:
+        name = pending.pop()
+        if name in dependencies:
+            continue
+        dependencies.add(name)
+        try:
+            source, _, _ = jinja_env.loader.get_source(jinja_env, name)
+        except jinja2.TemplateNotFound:
+            continue
+        ast = jinja_env.parse(source)
+        for reference in jinja2.meta.find_referenced_templates(ast):
+            if reference is None:
+                return set(jinja_env.list_templates())
+            pending.append(reference)
+    return dependencies
+
+
+class SourceHashBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """Bytecode cache keyed by the name and source of each template.
+
+    Unlike the jinja default, the key doesn't depend on the file name, so a template
+    with the same name and source in several template directories, e.g. for
+    different languages, is compiled only once. The compiled templates are kept in
+    memory for the lifetime of the process, in front of the cache files.
+    """
+
+    def __init__(self, directory):
+        super().__init__(directory, "%s.jinja")
+        self.code = {}
+
+    def get_bucket(self, environment, name, filename, source):
+        hash = hashlib.sha256(name.encode("utf-8"))
+        hash.update(b"\0")
+        hash.update(source.encode("utf-8"))
+        bucket = jinja2.bccache.Bucket(environment, hash.hexdigest(), "")
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(self, bucket):
+        code = self.code.get(bucket.key, None)
+        if code is None:
+            super().load_bytecode(bucket)
+            if bucket.code is not None:
+                self.code[bucket.key] = bucket.code
+        else:
+            bucket.code = code
+
+    def dump_bytecode(self, bucket):
+        self.code[bucket.key] = bucket.code
+        os.makedirs(self.directory, exist_ok=True)
+        super().dump_bytecode(bucket)
+
+
+# jinja environments by template directory, and bytecode caches by cache directory,
+# kept for the lifetime of the process so that long-running processes such as watch
+# mode don't compile the templates again on every build. the loader reloads
+# templates whose files have been modified.
+_jinja_environments = {}
+_bytecode_caches = {}
+
+
+def get_bytecode_cache(cache_dir):
+    bytecode_cache = _bytecode_caches.get(cache_dir, None)
+    if bytecode_cache is None:
+        bytecode_cache = SourceHashBytecodeCache(cache_dir)
+        _bytecode_caches[cache_dir] = bytecode_cache
+    return bytecode_cache
+
+
+def create_jinja_environment(loader, bytecode_cache=None):
+    jinja_env = jinja2.Environment(
+        loader=loader,
+        autoescape=jinja2.select_autoescape([]),
+        bytecode_cache=bytecode_cache,
+    )
+    # jinja_env.trim_blocks = True
+    # jinja_env.lstrip_blocks = True
+    return jinja_env
+
+
+def get_jinja_environment(
+    template_path, bytecode_cache_dir=None, bundle_path=None, language_tag=None
+):
+    """Get the jinja environment for a template directory.
+
+    If *bytecode_cache_dir* is given, compiled templates are cached there, and
+    shared between all environments with the same cache directory. If *bundle_path*
+    is given, the templates are loaded from the template bundle instead, from the
+    set of *language_tag*.
+    """
+    if bundle_path:
+        stat = os.stat(bundle_path)
+        key = (bundle_path, stat.st_size, stat.st_mtime_ns, language_tag)
+    else:
+        key = (template_path, bytecode_cache_dir)
+    jinja_env = _jinja_environments.get(key, None)
+    if jinja_env is None:
+        if bundle_path:
+            jinja_env = create_jinja_environment(
+                BundleLoader(bundle_path, language_tag)
             )
         else:
-            localized_to_endpoint = to_endpoint
+            jinja_env = create_jinja_environment(
+                jinja2.FileSystemLoader(template_path),
+                get_bytecode_cache(bytecode_cache_dir) if bytecode_cache_dir else None,
+            )
+        _jinja_environments[key] = jinja_env
+    return jinja_env
+
+
+def encode_chunks(strings, buffer_size=STREAM_BUFFER_SIZE):
+    """Encode the strings from a template stream as UTF-8, in chunks of about
+    *buffer_size* bytes.
+
+    Jinja yields many small strings; joining them into larger chunks keeps the cost
+    of hashing and writing them down, without holding a whole page in memory.
+    """
+    buffer = []
+    length = 0
+    for string in strings:
+        buffer.append(string)
+        length += len(string)
+        if length >= buffer_size:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            length = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def render_pages(
+    site_config,
+    template_path,
+    sink,
+    page_ids,
+    language_tag=None,
+    track=False,
+    endpoint_table=None,
+    bundle=None,
+    profile=False,
+    minifiers=None,
+):
+    """Render the given pages from the templates in a directory, for one language.
+
+    Returns a tuple (rendered, url_stats, profile_data). Rendered is a dictionary with the page IDs
+    as keys and (digest, dependencies, data) tuples as values, where digest is the
+    SHA-256 digest of the output file. If *track* is set, the dependencies are the
+    names of the templates used, the items referenced with url_for() and the
+    languages referenced with url_for_language(). Otherwise they are None. The pages
+    are written to the output *sink*, and data is None. If *sink* is None, the pages
+    are returned as data instead. Url_stats is a dictionary with the number of
+    url_for() calls and the hits and misses of the relative URL cache.
+
+    The *endpoint_table* is the result of build_endpoint_table(), which is computed
+    here if it isn't given.
+
+    If *bundle* is given, it is a tuple (bundle_path, dependencies) for a template
+    bundle with a valid set of templates for the language, as found by
+    find_valid_bundle_sets(). The templates are then loaded from the bundle.
+
+    If *profile* is set, profile_data is a dictionary with a span for the render of
+    each page, as made by make_span(), and the number of bytes rendered. Otherwise it
+    is None.
+
+    *minifiers* is a dictionary of file suffix to minifier function, as returned by
+    get_minifiers(). The pages with a minifier are minified before they are written.
+
+    Pages without a minifier are streamed to the sink in chunks of about
+    STREAM_BUFFER_SIZE bytes as they are rendered, so a large page is never held in
+    memory as a whole.
+    """
+    item_config = site_config["item_config"]
+    translations = site_config.get("translations", {})
+    if endpoint_table is None:
+        endpoint_table = build_endpoint_table(item_config, [language_tag])
+    relative_urls = RelativeUrlCache()
+    localized_endpoints = {}
+    url_for_calls = 0
+    dependencies = None
+
+    def get_endpoints(language_tag):
+        endpoints = endpoint_table.get(language_tag, None)
+        if endpoints is None:
+            endpoints = build_endpoint_table(item_config, [language_tag])[language_tag]
+            endpoint_table[language_tag] = endpoints
+        return endpoints
+
+    def get_localized_endpoint(endpoint, language_tag):
+        key = (endpoint, language_tag)
+        localized_endpoint = localized_endpoints.get(key, None)
+        if localized_endpoint is None:
+            localized_endpoint = localize_endpoint(endpoint, language_tag)
+            localized_endpoints[key] = localized_endpoint
+        return localized_endpoint
+
+    @jinja2.pass_context
+    def url_for(context, id, rooted=None):
+        nonlocal url_for_calls
+        url_for_calls += 1
+        localized_to_endpoint = get_endpoints(context["language_tag"]).get(id, None)
+        if localized_to_endpoint is None:
+            raise InvalidReferenceError('Invalid page id "%s".' % id)
+        if dependencies is not None and id not in dependencies["refs"]:
+            dependencies["refs"][id] = get_item_reference(item_config[id])
 
         if rooted is None:
             rooted = context.get("rooted_urls", False)
@@ -147,93 +472,843 @@ def generate_pages_from_templates(site_config, output_dir, file_list=[]):
         if rooted:
             return localized_to_endpoint
         else:
-            from_endpoint = context["endpoint"]
-            return make_relative_url(
-                localize_endpoint(from_endpoint, context["language_tag"]),
-                localized_to_endpoint,
+            from_endpoint = get_localized_endpoint(
+                context["endpoint"], context["language_tag"]
             )
+            return relative_urls.get(from_endpoint, localized_to_endpoint)
+
+    @jinja2.pass_context
+    def srcset_for(context, id, format=None, rooted=None):
+        item = item_config.get(id, None)
+        if item is None:
+            raise InvalidReferenceError('Invalid page id "%s".' % id)
+        if dependencies is not None:
+            dependencies["refs"][id] = get_item_reference(item, srcset=True)
+        if format is None:
+            format = get_image_format(item.get("source", ""))
+        return ", ".join(
+            "%s %dw" % (url_for(context, derivative_id, rooted), width)
+            for derivative_id, width in item.get("srcset", {}).get(format, [])
+        )
 
     @jinja2.pass_context
     def url_for_language(context, language_tag):
         page_endpoint = context["endpoint"]
-        from_endpoint = localize_endpoint(page_endpoint, context["language_tag"])
+        from_endpoint = get_localized_endpoint(page_endpoint, context["language_tag"])
         to_language_tag = None
-        if (
-            "translations" in site_config
-            and language_tag in site_config["translations"]
-        ):
+        if language_tag in translations:
             to_language_tag = language_tag
-        to_endpoint = localize_endpoint(page_endpoint, to_language_tag)
-        return make_relative_url(from_endpoint, to_endpoint)
+        if dependencies is not None:
+            dependencies["languages"][language_tag] = to_language_tag is not None
+        to_endpoint = get_localized_endpoint(page_endpoint, to_language_tag)
+        return relative_urls.get(from_endpoint, to_endpoint)
 
-    def create_jinja_environment(template_path):
-        jinja_env = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(template_path),
-            autoescape=jinja2.select_autoescape([]),
+    if bundle is not None:
+        bundle_path, bundle_dependencies = bundle
+        jinja_env = get_jinja_environment(
+            template_path, bundle_path=bundle_path, language_tag=language_tag
         )
-        # jinja_env.trim_blocks = True
-        # jinja_env.lstrip_blocks = True
-        jinja_env.globals["url_for"] = url_for
-        jinja_env.globals["url_for_language"] = url_for_language
-        return jinja_env
-
-    def render_pages(template_path, language_tag=None):
-        jinja_env = create_jinja_environment(template_path)
-        for page_id, page in site_config["item_config"].items():
-            template = page.get("template", None)
-            if not template:
-                continue
-            jinja_template = jinja_env.get_template(template)
+    else:
+        bytecode_cache_dir = None
+        if "temp_dir" in site_config:
+            bytecode_cache_dir = str(
+                Path(site_config["temp_dir"], CACHE_DIR_NAME, "jinja")
+            )
+        jinja_env = get_jinja_environment(template_path, bytecode_cache_dir)
+    minify_cache = get_minify_cache(site_config)
+    jinja_env.globals["url_for"] = url_for
+    jinja_env.globals["url_for_language"] = url_for_language
+    jinja_env.globals["srcset_for"] = srcset_for
+    # look up each template once, rather than checking if it is up to date for
+    # every page.
+    jinja_templates = {}
+    records = RecordReader(site_config.get("collections", {}))
+    template_dependencies = {}
+    rendered = {}
+    spans = []
+    bytes_written = 0
+    try:
+        for page_id in page_ids:
+            if profile:
+                start_ns = time.perf_counter_ns()
+            page = item_config[page_id]
+            template = page["template"]
+            jinja_template = jinja_templates.get(template, None)
+            if jinja_template is None:
+                jinja_template = jinja_env.get_template(template)
+                jinja_templates[template] = jinja_template
             context = {
                 **page,
                 "page_id": page_id,
                 "language_tag": language_tag,
             }
-            rendered_page = jinja_template.render(context).encode("utf-8")
-            output_path = get_output_path(page, output_dir, language_tag)
-            ensure_parent_dir_exists(output_path)
-            with output_path.open(mode="wb") as fh:
-                fh.write(rendered_page)
-            file_list.append(str(output_path))
+            if "collection" in page:
+                context["record"] = records.get(page["collection"], page["position"])
+            if track:
+                dependencies = {"refs": {}, "languages": {}}
+            chunks = encode_chunks(jinja_template.generate(context))
+            output_key = get_output_key(page, language_tag)
+            minifier = get_minifier(minifiers, output_key)
+            if sink is not None and minifier is None:
+                digest, size = sink.write_stream(output_key, chunks)
+                rendered_page = None
+            else:
+                rendered_page = b"".join(chunks)
+                if minifier is not None:
+                    rendered_page = minify_cache.minify(minifier, rendered_page)
+                if sink is not None:
+                    sink.write(output_key, rendered_page)
+                digest = hashlib.sha256(rendered_page).hexdigest()
+                size = len(rendered_page)
+            if track:
+                if template not in template_dependencies:
+                    if bundle is not None:
+                        template_dependencies[template] = bundle_dependencies[template]
+                    else:
+                        template_dependencies[template] = find_template_dependencies(
+                            jinja_env, template
+                        )
+                dependencies["templates"] = sorted(template_dependencies[template])
+            rendered[page_id] = (
+                digest,
+                dependencies,
+                rendered_page if sink is None else None,
+            )
+            if profile:
+                bytes_written += size
+                spans.append(
+                    make_span(
+                        page_id,
+                        "render",
+                        start_ns,
+                        time.perf_counter_ns() - start_ns,
+                        {"template": template, "language": language_tag},
+                    )
+                )
+    finally:
+        records.close()
+        if bundle is not None:
+            # the environment is cached, and its loader reopens the bundle as needed.
+            jinja_env.loader.close()
+    url_stats = {
+        "url_for_calls": url_for_calls,
+        "relative_url_hits": relative_urls.hits,
+        "relative_url_misses": relative_urls.misses,
+    }
+    profile_data = None
+    if profile:
+        profile_data = {"spans": spans, "bytes_written": bytes_written}
+    return rendered, url_stats, profile_data
+
 
+def find_searched_pages(site_config):
+    """Find the pages for the search index.
+
+    Returns a dictionary with a list of (url, output_key) tuples for each language
+    tag. Pages which aren't HTML, and pages with a "search" attribute set to False,
+    are left out.
+    """
+    item_config = site_config["item_config"]
+    pages = {}
+    for language_tag in [None, *site_config.get("translations", {})]:
+        pages[language_tag] = []
+        for page in item_config.values():
+            if not "template" in page or page.get("search", True) is False:
+                continue
+            output_key = get_output_key(page, language_tag)
+            if output_key.lower().endswith(SEARCHED_SUFFIXES):
+                url = localize_endpoint(page["endpoint"], language_tag)
+                pages[language_tag].append((url, output_key))
+    return pages
+
+
+def get_minify_cache(site_config):
+    if "temp_dir" in site_config:
+        return MinifyCache(Path(site_config["temp_dir"], CACHE_DIR_NAME, "minify"))
+    return MinifyCache()
+
+
+def split_into_chunks(items, count):
+    size = max(1, -(-len(items) // count))
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def run_tasks(executor, function, tasks):
+    """Run a function once for each argument tuple in *tasks* and return the results.
+
+    The tasks are submitted to the executor if there is one, and are otherwise run
+    one after another. Either way, the results are returned in the order of the tasks.
+    """
+    if executor is None:
+        return [function(*args) for args in tasks]
+    futures = [executor.submit(function, *args) for args in tasks]
+    return [future.result() for future in futures]
+
+
+def get_template_paths(site_config):
+    """Get the template directory of each language, with None for the default."""
     template_dir = site_config.get("template_dir", "#invalid#")
     temp_dir = site_config.get("temp_dir", "#invalid#")
-    render_pages(template_dir)
+    return {
+        language_tag: (
+            str(Path(temp_dir, language_tag)) if language_tag else template_dir
+        )
+        for language_tag in [None, *site_config.get("translations", {})]
+    }
+
+
+def generate_pages_from_templates(
+    site_config,
+    sink,
+    file_list=[],
+    build_state=None,
+    jobs=1,
+    translation_engine="po2html",
+    file_digests=None,
+    url_stats=None,
+    template_bundle=None,
+    digest_cache=None,
+    profile=None,
+    minifiers=None,
+):
+    """Translate the templates of a site and render its pages to a sink.
+
+    With *jobs* greater than one, templates are translated and pages rendered in a
+    pool of that many worker processes. The output is the same as for a serial
+    build, and the file list is in the same order. On platforms which spawn new
+    processes rather than forking, such as Windows, the calling script must guard
+    its top-level code with `if __name__ == "__main__":`.
+
+    The *translation_engine* is either "po2html" or "fast". See
+    translate_page_templates() for details.
+
+    If *url_stats* is given, it should be a dictionary. The number of url_for()
+    calls and the number of hits and misses in the relative URL cache are then added
+    to it, as "url_for_calls", "relative_url_hits" and "relative_url_misses".
+
+    If *template_bundle* is given, it is the path of a template bundle made by
+    compile_template_bundle(). Templates are then loaded from the bundle without
+    being parsed, for each language where the templates in the bundle were compiled
+    from the same sources as the current ones. The templates of other languages are
+    loaded from their sources as usual, so a bundle never makes the output stale.
+    """
+    if profile is None:
+        profile = NULL_PROFILE
+    item_config = site_config["item_config"]
     translations = site_config.get("translations", {})
-    for language_tag, language_config in translations.items():
-        translated_template_dir = str(Path(temp_dir, language_tag))
-        translate_page_templates(
-            template_dir, language_config["po_file_path"], translated_template_dir
+    template_dir = site_config.get("template_dir", "#invalid#")
+    temp_dir = site_config.get("temp_dir", "#invalid#")
+    language_tags = [None, *translations]
+    template_paths = get_template_paths(site_config)
+
+    def get_po_digest(language_tag):
+        if not language_tag:
+            return None
+        return build_state.digest(translations[language_tag]["po_file_path"])
+
+    def is_up_to_date(page_id, page, language_tag):
+        output_key = get_output_key(page, language_tag)
+        record = build_state.get_previous(output_key)
+        if (
+            not record
+            or record["item"] != page_id
+            or record["language"] != language_tag
+            or record["config"] != get_page_config_digest(page)
+            or record["po"] != get_po_digest(language_tag)
+            or record.get("minify")
+            != describe_minifier(get_minifier(minifiers, output_key))
+        ):
+            return False
+        for name, digest in record["templates"].items():
+            if build_state.digest(os.path.join(template_dir, name)) != digest:
+                return False
+        for id, reference in record["refs"].items():
+            item = item_config.get(id, None)
+            if not item or get_item_reference(item, len(reference) > 2) != reference:
+                return False
+        for language_tag, exists in record["languages"].items():
+            if (language_tag in translations) != exists:
+                return False
+        return True
+
+    outdated_pages = {
+        language_tag: [
+            page_id
+            for page_id, page in item_config.items()
+            if "template" in page
+            and (build_state is None or not is_up_to_date(page_id, page, language_tag))
+        ]
+        for language_tag in language_tags
+    }
+
+    translation_tasks = [
+        (
+            template_dir,
+            translations[language_tag]["po_file_path"],
+            template_path,
+            str(Path(temp_dir, CACHE_DIR_NAME)),
+            False,
+            translation_engine,
         )
-        render_pages(translated_template_dir, language_tag)
+        for language_tag, template_path in template_paths.items()
+        if language_tag and outdated_pages[language_tag]
+    ]
+    # worker processes can only write to directories, and return the pages otherwise.
+    if jobs > 1 and not isinstance(sink, DirectorySink):
+        render_sink = None
+    else:
+        render_sink = sink
+    endpoint_table = build_endpoint_table(item_config, language_tags)
+    executor = ProcessPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        with profile.span("translate"):
+            run_tasks(executor, translate_page_templates, translation_tasks)
+        bundle_sets = {}
+        if template_bundle:
+            if digest_cache is None:
+                digest_cache = DigestCache()
+            bundle_sets = find_valid_bundle_sets(
+                template_bundle,
+                {
+                    language_tag: template_paths[language_tag]
+                    for language_tag in language_tags
+                    if outdated_pages[language_tag]
+                },
+                digest_cache.digest,
+            )
+        render_tasks = [
+            (
+                site_config,
+                template_paths[language_tag],
+                render_sink,
+                page_ids,
+                language_tag,
+                build_state is not None,
+                {language_tag: endpoint_table[language_tag]},
+                (
+                    (str(template_bundle), bundle_sets[language_tag])
+                    if language_tag in bundle_sets
+                    else None
+                ),
+                profile is not NULL_PROFILE,
+                minifiers,
+            )
+            for language_tag in language_tags
+            for page_ids in split_into_chunks(outdated_pages[language_tag], jobs)
+        ]
+        with profile.span("render"):
+            results = run_tasks(executor, render_pages, render_tasks)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    rendered = {language_tag: {} for language_tag in language_tags}
+    for task, (result, task_url_stats, profile_data) in zip(render_tasks, results):
+        rendered[task[4]].update(result)
+        if url_stats is not None:
+            for name, count in task_url_stats.items():
+                url_stats[name] = url_stats.get(name, 0) + count
+        if profile_data is not None:
+            profile.add_spans(profile_data["spans"])
+            profile.count("pages_rendered", len(result))
+            profile.count("page_bytes_written", profile_data["bytes_written"])
+            for name, count in task_url_stats.items():
+                profile.count(name, count)
+
+    for language_tag in language_tags:
+        for page_id, page in item_config.items():
+            if not "template" in page:
+                continue
+            output_key = get_output_key(page, language_tag)
+            output_path = sink.get_name(output_key)
+            file_list.append(output_path)
+            if not page_id in rendered[language_tag]:
+                record = build_state.previous[output_key]
+                sink.keep(output_key)
+                build_state.record(output_key, record)
+                sink.digests[output_key] = record["digest"]
+                if file_digests is not None:
+                    file_digests[output_path] = record["digest"]
+                continue
+            digest, dependencies, data = rendered[language_tag][page_id]
+            if data is not None:
+                sink.write(output_key, data)
+            sink.digests[output_key] = digest
+            if file_digests is not None:
+                file_digests[output_path] = digest
+            if build_state is None:
+                continue
+            record = {
+                "item": page_id,
+                "language": language_tag,
+                "digest": digest,
+                "config": get_page_config_digest(page),
+                "po": get_po_digest(language_tag),
+                "templates": {
+                    name: build_state.digest(os.path.join(template_dir, name))
+                    for name in dependencies["templates"]
+                },
+                "refs": dependencies["refs"],
+                "languages": dependencies["languages"],
+            }
+            minifier = get_minifier(minifiers, output_key)
+            if minifier is not None:
+                record["minify"] = describe_minifier(minifier)
+            build_state.record(output_key, record)
+
+
+def unlink_if_exists(path):
+    # a file from an earlier build may be a hard link to its source, which must
+    # never be written through.
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def copy_file(source, destination, chunk_size=1 << 20):
+    """Copy a file in fixed-size chunks and return the SHA-256 digest of its content."""
+    unlink_if_exists(destination)
+    with open(source, "rb") as fsrc, open(destination, "wb") as fdst:
+        return copy_stream(fsrc, fdst, chunk_size)
+
 
+def reflink_file(source, destination):
+    """Clone a file with copy-on-write, or raise OSError if it isn't supported."""
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this platform.")
+    unlink_if_exists(destination)
+    with open(source, "rb") as fsrc, open(destination, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
 
-def copy_resources(site_config, output_dir, file_list=[]):
-    for _, item in site_config["item_config"].items():
+
+def copy_resource(source, destination, copy_strategy, digest_cache):
+    """Copy a resource file to the output and return the SHA-256 digest of it.
+
+    The *copy_strategy* is one of:
+    - "copy", which copies the file.
+    - "skip-unchanged", which skips files whose size and modification time are the
+      same as those of the source. Copied files get the modification time of the
+      source.
+    - "hardlink", which creates a hard link to the source file, so the output file
+      must not be modified in place. Falls back to copying, e.g. across file
+      systems.
+    - "reflink", which creates a copy-on-write clone on file systems which support
+      it, such as Btrfs and XFS. Falls back to copying.
+    The digests of files which aren't copied are kept in *digest_cache*, so that
+    they don't have to be read again on every build.
+    """
+    source_stat = os.stat(source)
+    if copy_strategy == "skip-unchanged":
+        try:
+            destination_stat = os.stat(destination)
+        except OSError:
+            destination_stat = None
+        if (
+            destination_stat
+            and destination_stat.st_size == source_stat.st_size
+            and destination_stat.st_mtime_ns == source_stat.st_mtime_ns
+        ):
+            return digest_cache.digest(source)
+        digest = copy_file(source, destination)
+        os.utime(destination, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+    elif copy_strategy == "hardlink":
+        if os.path.exists(destination) and os.path.samefile(source, destination):
+            return digest_cache.digest(source)
+        unlink_if_exists(destination)
+        try:
+            os.link(source, destination)
+        except OSError:
+            digest = copy_file(source, destination)
+        else:
+            return digest_cache.digest(source)
+    elif copy_strategy == "reflink":
+        try:
+            reflink_file(source, destination)
+        except OSError:
+            digest = copy_file(source, destination)
+        else:
+            return digest_cache.digest(source)
+    else:
+        digest = copy_file(source, destination)
+    digest_cache.set(source, source_stat, digest)
+    return digest
+
+
+def copy_resources(
+    site_config,
+    sink,
+    file_list=[],
+    build_state=None,
+    file_digests=None,
+    copy_strategy="copy",
+    digest_cache=None,
+    profile=None,
+    minifiers=None,
+):
+    """Copy the resources of a site to a sink, in a thread pool.
+
+    Files are copied to an output directory with copy_resource() and the given
+    *copy_strategy*. If *file_digests* is given, it should be a dictionary. The
+    SHA-256 digest of each output file is then added to it, with the same path as in
+    the file list as key. The digests are computed while the files are written, and
+    can be passed on to write_manifest_file().
+    """
+    if profile is None:
+        profile = NULL_PROFILE
+    if digest_cache is None:
+        digest_cache = DigestCache()
+    minify_cache = get_minify_cache(site_config)
+    copies = []
+    for id, item in site_config["item_config"].items():
         if "source" in item:
-            output_path = get_output_path(item, output_dir, None)
-            ensure_parent_dir_exists(output_path)
-            shutil.copyfile(item["source"], output_path)
-            file_list.append(str(output_path))
+            output_key = get_output_key(item, None)
+            output_path = sink.get_name(output_key)
+            file_list.append(output_path)
+            record = None
+            if build_state is not None:
+                stat = os.stat(item["source"])
+                record = {
+                    "item": id,
+                    "source": str(item["source"]),
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                }
+                minifier = get_minifier(minifiers, output_key)
+                if minifier is not None:
+                    record["minify"] = describe_minifier(minifier)
+                previous = build_state.get_previous(output_key)
+                if previous and previous == {**record, "digest": previous["digest"]}:
+                    sink.keep(output_key)
+                    build_state.record(output_key, previous)
+                    sink.digests[output_key] = previous["digest"]
+                    if file_digests is not None:
+                        file_digests[output_path] = previous["digest"]
+                    continue
+            copies.append((item["source"], output_path, output_key, record))
 
+    def minify_resource(source, output_key):
+        minifier = get_minifier(minifiers, output_key)
+        if minifier is None:
+            return None
+        with open(source, "rb") as f:
+            return minify_cache.minify(minifier, f.read())
 
-def write_manifest_file(file_list, output_dir, manifest_file_path):
+    def copy_to_directory(source, output_path, output_key):
+        # the output path is where the file ends up, which isn't where it is
+        # written for a staged build.
+        output_path = sink.path / output_key
+        ensure_parent_dir_exists(output_path)
+        data = minify_resource(source, output_key)
+        digest = None
+        if data is not None:
+            digest = hashlib.sha256(data).hexdigest()
+        elif isinstance(sink, StagingSink):
+            digest = digest_cache.digest(source)
+        if isinstance(sink, StagingSink) and sink.link_previous(output_key, digest):
+            return digest
+        if data is not None:
+            write_if_changed(output_path, data)
+            return digest
+        return copy_resource(source, output_path, copy_strategy, digest_cache)
+
+    def copy_to_sink(source, output_path, output_key):
+        data = minify_resource(source, output_key)
+        if data is not None:
+            sink.write(output_key, data)
+            return hashlib.sha256(data).hexdigest()
+        return sink.copy_file(output_key, source)
+
+    # archives are written one file at a time.
+    if isinstance(sink, DirectorySink):
+        executor = ThreadPoolExecutor()
+        copy = copy_to_directory
+    else:
+        executor = None
+        copy = copy_to_sink
+    try:
+        digests = run_tasks(executor, copy, [task[:3] for task in copies])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    for (_, output_path, output_key, record), digest in zip(copies, digests):
+        sink.digests[output_key] = digest
+        if file_digests is not None:
+            file_digests[output_path] = digest
+        if record is not None:
+            build_state.record(output_key, {**record, "digest": digest})
+    if profile is not NULL_PROFILE:
+        profile.count("resources_copied", len(copies))
+        profile.count(
+            "resource_bytes_written",
+            sum(os.path.getsize(source) for source, *_ in copies),
+        )
+
+
+def compile_template_bundle(site_config, bundle_path, translation_engine="po2html"):
+    """Compile the templates of a site ahead of time into a template bundle.
+
+    The templates are translated for each language, as by generate(), and all the
+    template sets are compiled into a zip archive at *bundle_path*, which can then be
+    passed to generate(). The bundle records the digests of the template sources, so
+    that generate() can tell whether it still matches the templates.
+    """
+    validate_config(site_config)
+    translations = site_config.get("translations", {})
+    template_paths = get_template_paths(site_config)
+    for language_tag, template_path in template_paths.items():
+        if language_tag:
+            translate_page_templates(
+                site_config["template_dir"],
+                translations[language_tag]["po_file_path"],
+                template_path,
+                str(Path(site_config["temp_dir"], CACHE_DIR_NAME)),
+                False,
+                translation_engine,
+            )
+
+    writer = BundleWriter(bundle_path)
+    try:
+        for language_tag, template_path in template_paths.items():
+            jinja_env = create_jinja_environment(jinja2.FileSystemLoader(template_path))
+            for name in jinja_env.list_templates():
+                path = os.path.join(template_path, name)
+                try:
+                    source, filename, _ = jinja_env.loader.get_source(jinja_env, name)
+                except UnicodeDecodeError:
+                    # not a template.
+                    writer.add_template(
+                        language_tag, name, file_digest(path), None, None
+                    )
+                    continue
+                code = compile(
+                    jinja_env.compile(
+                        source, name, filename, raw=True, defer_init=True
+                    ),
+                    filename,
+                    "exec",
+                )
+                writer.add_template(
+                    language_tag,
+                    name,
+                    file_digest(path),
+                    code,
+                    sorted(find_template_dependencies(jinja_env, name)),
+                )
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+def write_manifest_file(
+    file_list, output_dir, manifest_file_path, file_digests=None, profile=None
+):
+    """Write a manifest file with the path and SHA-256 digest of each output file.
+
+    Digests are taken from *file_digests* when available, as filled in by generate().
+    Other files are hashed in fixed-size chunks in a thread pool. If *profile* is
+    given, the time it takes is recorded in the BuildProfile.
+    """
+    if profile is None:
+        profile = NULL_PROFILE
+    file_digests = file_digests or {}
     base_path = str(Path(".").resolve() / output_dir)
-    with open(manifest_file_path, "w") as manifest_file:
-        for file_name in sorted(file_list):
-            short_name = file_name[len(base_path) :].replace("\\", "/")
-            with open(file_name, "rb") as f:
-                hash = hashlib.sha256()
-                hash.update(f.read())
-                digest = hash.hexdigest()
-            manifest_file.write(f"{short_name};{digest}\n")
+    file_names = sorted(file_list)
+    with profile.span("write_manifest_file"), ThreadPoolExecutor() as executor:
+        digests = executor.map(
+            lambda file_name: file_digests.get(file_name) or file_digest(file_name),
+            file_names,
+        )
+        with open(manifest_file_path, "w") as manifest_file:
+            for file_name, digest in zip(file_names, digests):
+                short_name = file_name[len(base_path) :].replace("\\", "/")
+                manifest_file.write(f"{short_name};{digest}\n")
 
 
-def generate(site_config, output_dir, file_list=[]):
+def generate(
+    site_config,
+    output_dir,
+    file_list=[],
+    incremental=False,
+    full_rebuild=False,
+    jobs=1,
+    translation_engine="po2html",
+    file_digests=None,
+    copy_strategy="copy",
+    url_stats=None,
+    template_bundle=None,
+    profile=None,
+    gzip_sidecars=False,
+    gzip_min_size=GZIP_MIN_SIZE,
+    fingerprint_resources=False,
+    fingerprints=None,
+    minify=False,
+    staged=False,
+):
     """Generate a static web site according to the given configuration.
 
+    *output_dir* is a directory path or an output sink, such as a MemorySink, which
+    the caller closes. The other options are described where they are implemented:
+    *incremental* and *full_rebuild* in BuildState, *jobs*, *translation_engine*,
+    *url_stats* and *template_bundle* in generate_pages_from_templates(),
+    *file_digests* and *copy_strategy* in copy_resources(), *profile* in
+    BuildProfile, *gzip_sidecars* and *gzip_min_size* in write_gzip_sidecars(),
+    *fingerprint_resources* and *fingerprints* in fingerprint_resources(), *minify*
+    in get_minifiers() and *staged* in StagingSink.
+
     NOTE The output directory is created if it doesn't already exist.
     """
-    validate_config(site_config)
-    copy_resources(site_config, output_dir, file_list)
-    generate_pages_from_templates(site_config, output_dir, file_list)
+    if profile is None:
+        profile = NULL_PROFILE
+    minifiers = get_minifiers(minify)
+    with profile.span("validate_config"):
+        validate_config(site_config)
+    if translation_engine not in TRANSLATION_ENGINES:
+        raise ConfigurationError(
+            'Invalid translation engine "%s".' % translation_engine
+        )
+    if copy_strategy not in COPY_STRATEGIES:
+        raise ConfigurationError('Invalid copy strategy "%s".' % copy_strategy)
+    if isinstance(output_dir, OutputSink):
+        sink = output_dir
+    else:
+        sink = DirectorySink(output_dir)
+    if not isinstance(sink, DirectorySink):
+        if incremental:
+            raise ConfigurationError("Incremental builds require an output directory.")
+        if copy_strategy != "copy":
+            raise ConfigurationError(
+                'The copy strategy "%s" requires an output directory.' % copy_strategy
+            )
+        if gzip_sidecars:
+            raise ConfigurationError("Gzip sidecars require an output directory.")
+        if staged:
+            raise ConfigurationError("Staged output requires an output directory.")
+        if "search_index" in site_config and not isinstance(sink, MemorySink):
+            raise ConfigurationError(
+                "The search index requires an output directory or a memory sink."
+            )
+    build_state = None
+    if incremental:
+        if not "temp_dir" in site_config:
+            raise ConfigurationError(
+                "Temp directory is missing in the site configuration."
+            )
+        build_state = BuildState(site_config["temp_dir"], sink.path, full_rebuild)
+        build_state.load()
+        digest_cache = build_state.digests
+    elif "temp_dir" in site_config:
+        digest_cache = DigestCache(
+            Path(site_config["temp_dir"], CACHE_DIR_NAME, "digests.json")
+        )
+        digest_cache.load()
+    else:
+        digest_cache = DigestCache()
+    if "temp_dir" in site_config:
+        with profile.span("image_derivatives"):
+            try:
+                site_config = add_derivative_items(
+                    site_config,
+                    digest_cache.digest,
+                    Path(site_config["temp_dir"], CACHE_DIR_NAME, "images"),
+                )
+            except ImportError:
+                raise ConfigurationError("Image derivatives require Pillow.")
+    elif site_config.get("image_derivatives"):
+        raise ConfigurationError("Temp directory is missing in the site configuration.")
+    if fingerprint_resources:
+        with profile.span("fingerprint_resources"):
+            site_config, resource_fingerprints = apply_fingerprints(
+                site_config, digest_cache.digest
+            )
+        if fingerprints is not None:
+            fingerprints.update(resource_fingerprints)
+    check_unique_endpoints(site_config["item_config"])
+    if staged:
+        sink = StagingSink(sink.path, digest_cache)
+    try:
+        with profile.span("copy_resources"):
+            copy_resources(
+                site_config,
+                sink,
+                file_list,
+                build_state,
+                file_digests,
+                copy_strategy,
+                digest_cache,
+                profile,
+                minifiers,
+            )
+        with profile.span("generate_pages"):
+            generate_pages_from_templates(
+                site_config,
+                sink,
+                file_list,
+                build_state,
+                jobs,
+                translation_engine,
+                file_digests,
+                url_stats,
+                template_bundle,
+                digest_cache,
+                profile,
+                minifiers,
+            )
+        if "search_index" in site_config:
+            cache_path = None
+            if "temp_dir" in site_config:
+                cache_path = Path(
+                    site_config["temp_dir"], CACHE_DIR_NAME, SEARCH_CACHE_FILE_NAME
+                )
+            search_index = site_config["search_index"]
+            with profile.span("write_search_index"):
+                profile.count(
+                    "search_pages_indexed",
+                    write_search_index(
+                        sink,
+                        find_searched_pages(site_config),
+                        get_output_key(
+                            site_config["item_config"][search_index["id"]], None
+                        ),
+                        search_index["prefix_length"],
+                        file_list,
+                        build_state,
+                        file_digests,
+                        cache_path,
+                        jobs,
+                    ),
+                )
+        if gzip_sidecars:
+            cache_path = None
+            if "temp_dir" in site_config:
+                cache_path = Path(
+                    site_config["temp_dir"], CACHE_DIR_NAME, GZIP_CACHE_FILE_NAME
+                )
+            with profile.span("write_gzip_sidecars"):
+                profile.count(
+                    "gzip_sidecars_written",
+                    write_gzip_sidecars(
+                        sink,
+                        file_list,
+                        build_state,
+                        file_digests,
+                        gzip_min_size,
+                        cache_path,
+                    ),
+                )
+    except BaseException:
+        if staged:
+            sink.abort()
+        raise
+    if staged:
+        with profile.span("commit_staged_output"):
+            sink.commit()
+    with profile.span("save_build_state"):
+        if build_state is not None:
+            # stale outputs aren't carried over to a staging directory.
+            if not staged:
+                build_state.remove_stale_outputs()
+            build_state.save()
+        else:
+            digest_cache.save()
@@ -3,47 +3,503 @@
 Isolation layer for the translate-toolkit package.
 """
 
+import io
 import os
-import shutil
+import re
+import hashlib
+import pickle
+from collections import OrderedDict
 from pathlib import Path
+from translate.__version__ import sver as translate_toolkit_version
+from translate.lang.data import is_rtl
 from translate.storage import po, html
 from translate.convert.po2html import po2html
 from translate.tools.podebug import convertpo
 
+CATALOG_CACHE_SIZE = 16
+TEMPLATE_PLAN_CACHE_SIZE = 1024
 
-def translate_page_templates(source_dir, po_file_path, destination_dir):
+_catalogs = OrderedDict()
+_po_file_digests = {}
+
+
+def get_po_file_digest(po_file_path):
+    """Get the SHA-256 digest of a PO file.
+
+    The digest is remembered for as long as the size and modification time of the
+    file are unchanged.
+    """
+    stat = os.stat(po_file_path)
+    key = (str(po_file_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _po_file_digests:
+        with open(po_file_path, "rb") as f:
+            _po_file_digests[key] = hashlib.sha256(f.read()).hexdigest()
+    return _po_file_digests[key]
+
+
+def write_cache_file(path, data):
+    """Write a cache file atomically, so that concurrent builds never see partial files."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name("%s.%d.tmp" % (path.name, os.getpid()))
+    temp_path.write_bytes(data)
+    os.replace(str(temp_path), str(path))
+
+
+class CatalogUnit:
+    """A read-only translation unit in a Catalog."""
+
+    __slots__ = ("source", "target", "_context", "_locations", "_translated", "_fuzzy")
+
+    def __init__(self, source, target, context, locations, translated, fuzzy):
+        self.source = source
+        self.target = target
+        self._context = context
+        self._locations = locations
+        self._translated = translated
+        self._fuzzy = fuzzy
+
+    def getcontext(self):
+        return self._context
+
+    def getlocations(self):
+        return list(self._locations)
+
+    def istranslated(self):
+        return self._translated
+
+    def isfuzzy(self):
+        return self._fuzzy
+
+
+class _SourceIndex(dict):
+    def get(self, key, default=None):
+        entries = dict.get(self, key)
+        if entries is None:
+            return default
+        return [CatalogUnit(*entry) for entry in entries]
+
+
+class Catalog:
+    """A read-only translation catalog, indexed by source string.
+
+    Implements the part of the translate-toolkit store interface which is used by
+    po2html. The index consists of plain tuples, so that it can be pickled and
+    loaded much faster than the PO file can be parsed.
+    """
+
+    def __init__(self, sourceindex):
+        self.sourceindex = _SourceIndex(sourceindex)
+        self._lookups = {}
+
+    @classmethod
+    def from_store(cls, store):
+        """Create a catalog from a translate-toolkit store."""
+        store.require_index()
+        sourceindex = {}
+        for source, units in store.sourceindex.items():
+            sourceindex[str(source)] = [
+                (
+                    str(unit.source),
+                    str(unit.target),
+                    unit.getcontext(),
+                    tuple(unit.getlocations()),
+                    unit.istranslated(),
+                    unit.isfuzzy(),
+                )
+                for unit in units
+            ]
+        return cls(sourceindex)
+
+    def require_index(self):
+        pass
+
+    def lookup(self, string, context=None, location=None, includefuzzy=False):
+        """Translate a string, selecting among units the same way as po2html.
+
+        Results are memoized, so each distinct string is resolved once per catalog.
+        """
+        key = (string, context, location, includefuzzy)
+        if key in self._lookups:
+            return self._lookups[key]
+        result = string
+        for candidate in po2html.lookup_candidates(string):
+            entries = dict.get(self.sourceindex, candidate)
+            if entries is not None:
+                entry = select_catalog_entry(entries, context, location)
+                source, target, _, _, translated, fuzzy = entry
+                result = target if translated or (includefuzzy and fuzzy) else source
+                break
+        self._lookups[key] = result
+        return result
+
+
+def select_catalog_entry(entries, context, location):
+    for reference in (context, location):
+        if not reference:
+            continue
+        for entry in entries:
+            if entry[2] == reference or reference in entry[3]:
+                return entry
+    return entries[0]
+
+
+def load_catalog(po_file_path, cache_dir=None):
+    """Load the translation catalog of a PO file.
+
+    Catalogs are kept in an in-process LRU cache keyed by the content hash of the PO
+    file. If *cache_dir* is given, they are also pickled to that directory so that
+    later builds can load them without parsing the PO file.
+    """
+    digest = get_po_file_digest(po_file_path)
+    if digest in _catalogs:
+        _catalogs.move_to_end(digest)
+        return _catalogs[digest]
+
+    catalog = None
+    cache_path = None
+    if cache_dir:
+        cache_path = Path(cache_dir, "catalogs", digest + ".pickle")
+        try:
+            with cache_path.open(mode="rb") as f:
+                version, sourceindex = pickle.load(f)
+            if version == translate_toolkit_version:
+                catalog = Catalog(sourceindex)
+        except Exception:
+            pass
+
+    if catalog is None:
+        with open(po_file_path, "rb") as f:
+            catalog = Catalog.from_store(po.pofile(f))
+        if cache_path:
+            write_cache_file(
+                cache_path,
+                pickle.dumps(
+                    (translate_toolkit_version, dict(catalog.sourceindex)),
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                ),
+            )
+
+    _catalogs[digest] = catalog
+    if len(_catalogs) > CATALOG_CACHE_SIZE:
+        _catalogs.popitem(last=False)
+    return catalog
+
+
+TRANSLATION_ENGINES = ("po2html", "fast")
+
+PLACEHOLDER_RE = re.compile("\ue000([0-9]+)\ue001")
+
+
+class TemplatePlanner(html.htmlfile):
+    """Splits an HTML template into literal text and translatable units.
+
+    The template is parsed once by the translate-toolkit HTML parser, with each
+    string to translate replaced by a placeholder. The result is a plan: a list of
+    literal strings and unit tuples, from which render_template_plan() produces the
+    same output as po2html for any catalog, without parsing the template again.
+
+    Only the placeholders are touched when rendering, so Jinja syntax and all other
+    markup outside the units is copied as is. Templates with constructs which
+    can't be represented in a plan are marked as not plannable.
+    """
+
+    def __init__(self, templatefile):
+        self.plan_units = []
+        self.plannable = True
+        self._attributes = None
+        super().__init__(inputfile=templatefile)
+
+    def placeholder(self, unit):
+        self.plan_units.append(unit)
+        return "\ue000%d\ue001" % (len(self.plan_units) - 1)
+
+    def translate_value(self, string, **kwargs):
+        location = kwargs.get("location")
+        if self._attributes is None:
+            return self.placeholder(("text", string, kwargs.get("context"), location))
+
+        # attribute locations end with "[attrname]:line-col".
+        attrname = location.rpartition("[")[2].partition("]")[0]
+        values = [value for name, value in self._attributes if name == attrname]
+        if len(values) != 1:
+            self.plannable = False
+            return string
+        return self.placeholder(("attr", string, location, values[0]))
+
+    def translate_attributes(self, tag, attrs):
+        names = [name for name, _ in attrs]
+        if tag == "meta" and "og:locale" in [
+            (value or "").lower()
+            for name, value in attrs
+            if name in ["name", "property"]
+        ]:
+            # og:locale follows the translation of the html lang attribute.
+            self.plannable = False
+        if tag == "html" and "lang" in names:
+            return self.plan_html_attributes(attrs)
+        self._attributes = attrs
+        try:
+            return super().translate_attributes(tag, attrs)
+        finally:
+            self._attributes = None
+
+    def plan_html_attributes(self, attrs):
+        # translating the lang attribute also replaces the dir attribute, so the
+        # attributes of the html element are planned as a single unit.
+        names = [name for name, _ in attrs]
+        lang = dict(attrs)["lang"]
+        if (
+            not lang
+            or len(set(names)) != len(names)
+            or any(
+                name in self.TRANSLATABLE_ATTRIBUTES and name != "lang"
+                for name in names
+            )
+        ):
+            self.plannable = False
+            return attrs
+        normalized_value = self.WHITESPACE_RE.sub(" ", lang).strip()
+        location = self.get_attribute_location("lang")
+        return [(self.placeholder(("html", normalized_value, location, attrs)), None)]
+
+
+def has_planner_support():
+    """Check that the translate-toolkit internals used by the fast engine exist.
+
+    TemplatePlanner and Catalog.lookup() build on internals of the translate-toolkit
+    HTML parser and po2html converter, which may change between releases. Without
+    them, the fast engine falls back to po2html.
+    """
+    return all(
+        hasattr(html.htmlfile, name)
+        for name in [
+            "translate_value",
+            "translate_attributes",
+            "get_attribute_location",
+            "escape_attribute_value",
+            "TRANSLATABLE_ATTRIBUTES",
+            "WHITESPACE_RE",
+        ]
+    ) and hasattr(po2html, "lookup_candidates")
+
+
+PLANNER_SUPPORTED = has_planner_support()
+
+_template_plans = OrderedDict()
+
+
+def plan_template(template_path, template):
+    """Create a translation plan for an HTML template, or None if it isn't plannable."""
+    if "\ue000".encode("utf-8") in template or "\ue001".encode("utf-8") in template:
+        return None
+    templatefile = io.BytesIO(template)
+    templatefile.name = str(template_path)
+    try:
+        planner = TemplatePlanner(templatefile)
+    except TypeError:
+        # the internals of the HTML parser have another signature in this release.
+        return None
+    if not planner.plannable:
+        return None
+    plan = []
+    for index, part in enumerate(PLACEHOLDER_RE.split(planner.filesrc)):
+        if index % 2 == 0:
+            if part:
+                plan.append(part)
+        else:
+            plan.append(planner.plan_units[int(part)])
+    return plan
+
+
+def load_template_plan(template_path, template, cache_dir=None):
+    """Get the translation plan for an HTML template.
+
+    Plans are kept in an in-process LRU cache and, if *cache_dir* is given, pickled
+    to that directory. Both are keyed by the path and content of the template.
+    """
+    hash = hashlib.sha256()
+    hash.update(translate_toolkit_version.encode("utf-8") + b"\0")
+    hash.update(str(template_path).encode("utf-8") + b"\0")
+    hash.update(template)
+    digest = hash.hexdigest()
+    if digest in _template_plans:
+        _template_plans.move_to_end(digest)
+        return _template_plans[digest]
+
+    if cache_dir:
+        cache_path = Path(cache_dir, "plans", digest[:2], digest + ".pickle")
+        try:
+            with cache_path.open(mode="rb") as f:
+                plan = pickle.load(f)
+        except Exception:
+            plan = plan_template(template_path, template)
+            write_cache_file(
+                cache_path, pickle.dumps(plan, protocol=pickle.HIGHEST_PROTOCOL)
+            )
+    else:
+        plan = plan_template(template_path, template)
+
+    _template_plans[digest] = plan
+    if len(_template_plans) > TEMPLATE_PLAN_CACHE_SIZE:
+        _template_plans.popitem(last=False)
+    return plan
+
+
+def render_template_plan(plan, catalog, includefuzzy=False):
+    """Produce the translated template described by a plan, using a given catalog."""
+    escape = html.htmlfile.escape_attribute_value
+    output = []
+    for segment in plan:
+        if isinstance(segment, str):
+            output.append(segment)
+        elif segment[0] == "text":
+            _, string, context, location = segment
+            output.append(catalog.lookup(string, context, location, includefuzzy))
+        elif segment[0] == "attr":
+            _, string, location, original = segment
+            translation = catalog.lookup(string, None, location, includefuzzy)
+            output.append(escape(translation) if translation != string else original)
+        else:
+            _, string, location, attrs = segment
+            translation = catalog.lookup(string, None, location, includefuzzy)
+            if translation != string:
+                attrs = [
+                    (name, escape(translation) if name == "lang" else value)
+                    for name, value in attrs
+                    if name != "dir"
+                ]
+                attrs.append(("dir", "rtl" if is_rtl(translation) else "ltr"))
+            output.append(
+                "".join(
+                    " %s" % name if value is None else ' %s="%s"' % (name, value)
+                    for name, value in attrs
+                )[1:]
+            )
+    return "".join(output)
+
+
+def write_if_changed(path, data):
+    """Write data to a file, unless the file already has exactly that content.
+
+    Leaving unchanged files untouched preserves their modification times.
+    """
+    path = Path(path)
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # replace the file rather than writing into it, in case it is a hard link.
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+    with path.open(mode="wb") as f:
+        f.write(data)
+    return True
+
+
+def get_translation_cache_path(
+    cache_dir, template_path, template, catalog_digest, includefuzzy, engine
+):
+    hash = hashlib.sha256()
+    hash.update(translate_toolkit_version.encode("utf-8") + b"\0")
+    hash.update(engine.encode("utf-8") + b"\0")
+    hash.update(str(template_path).encode("utf-8") + b"\0")
+    hash.update(catalog_digest.encode("utf-8") + b"\0")
+    hash.update(b"1\0" if includefuzzy else b"0\0")
+    hash.update(template)
+    digest = hash.hexdigest()
+    return Path(cache_dir, "translations", digest[:2], digest)
+
+
+def iter_template_files(source_dir):
+    """Iterate over the files in a template directory and its subdirectories."""
+    for file in Path(source_dir).glob("**/*"):
+        if file.is_file():
+            yield file
+
+
+def translate_page_templates(
+    source_dir,
+    po_file_path,
+    destination_dir,
+    cache_dir=None,
+    includefuzzy=False,
+    engine="po2html",
+):
     """Translate template files in a directory using a specified PO file.
 
     The output is written to *destination_dir*. The output directory is created if it
-    doesn't already exist.
+    doesn't already exist. Files in the output directory which already have the right
+    content are left untouched.
 
     Currently only HTML template files are translated. Other files are copied
-    verbatim to the destination directory.
+    verbatim to the destination directory. Subdirectories are processed recursively.
+
+    If *cache_dir* is given, the parsed PO file and the translated templates are cached
+    there for later builds. Translated templates are keyed by the path and content of
+    the template, the content of the PO file and *includefuzzy*.
+
+    The *engine* is either "po2html", which runs the translate-toolkit converter on
+    each template, or "fast", which parses each template once into a plan and fills
+    in the translations with hash lookups in the catalog. Both give the same output.
+    The fast engine falls back to po2html for templates which can't be planned, and
+    for all templates if the installed translate-toolkit lacks the internals it
+    needs.
     """
-    with open(po_file_path, "rb") as f:
-        inputstore = po.pofile(f)
+    if engine not in TRANSLATION_ENGINES:
+        raise ValueError("Unknown translation engine: " + engine)
+    catalog_digest = get_po_file_digest(po_file_path)
+    inputstore = None
 
     os.makedirs(destination_dir, exist_ok=True)
 
-    for file in Path(source_dir).glob("*"):
+    for file in iter_template_files(source_dir):
+        destination = Path(destination_dir, file.relative_to(source_dir))
         if file.suffix.lower() in [".html"]:
-            with open(file, "rb") as templatefile:
-                outputstring = po2html().mergestore(
-                    inputstore, templatefile, includefuzzy=False
+            template = file.read_bytes()
+            output = None
+            if cache_dir:
+                cache_path = get_translation_cache_path(
+                    cache_dir, file, template, catalog_digest, includefuzzy, engine
                 )
-            with open(Path(destination_dir, file.name), "wb") as outputfile:
-                outputfile.write(outputstring.encode("utf-8"))
+                try:
+                    output = cache_path.read_bytes()
+                except OSError:
+                    pass
+            if output is None:
+                if inputstore is None:
+                    inputstore = load_catalog(po_file_path, cache_dir)
+                plan = None
+                if engine == "fast" and PLANNER_SUPPORTED:
+                    plan = load_template_plan(file, template, cache_dir)
+                if plan is not None:
+                    outputstring = render_template_plan(plan, inputstore, includefuzzy)
+                else:
+                    # the file name is used to match units by location and context.
+                    templatefile = io.BytesIO(template)
+                    templatefile.name = str(file)
+                    outputstring = po2html().mergestore(
+                        inputstore, templatefile, includefuzzy=includefuzzy
+                    )
+                output = outputstring.encode("utf-8")
+                if cache_dir:
+                    write_cache_file(cache_path, output)
+            write_if_changed(destination, output)
         else:
-            shutil.copy(str(file), str(Path(destination_dir, file.name)))
+            write_if_changed(destination, file.read_bytes())
 
 
 def extract_translation_units(source_dir, pot_file_path):
     """Extract translatable content from files in a specified directory and write to a POT file.
 
-    Currently only HTML files are processed.
+    Currently only HTML files are processed. Subdirectories are processed recursively.
     """
     outputstore = po.pofile()
-    for file in Path(source_dir).glob("*"):
+    for file in iter_template_files(source_dir):
         if file.suffix.lower() in [".html"]:
             with open(file, "rb") as templatefile:
                 htmlparser = html.htmlfile(inputfile=templatefile)
@@ -0,0 +1,342 @@
+"""Watch mode: rebuild a site when its sources change, and serve it for preview."""
+
+from pathlib import Path
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import traceback
+from .templating import generate
+
+# inotify constants, from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+INOTIFY_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# time to wait for more changes before rebuilding, since editors often write a file
+# in several steps.
+SETTLE_TIME = 0.05
+
+
+def get_watched_paths(site_config, extra_paths=()):
+    """Find the directories and files to watch for a site configuration.
+
+    Returns a tuple (directories, files). The directories are the template directory,
+    the directories of the resource files and *extra_paths*, and are watched
+    recursively. The files are the PO files.
+    """
+    directories = set()
+    if "template_dir" in site_config:
+        directories.add(Path(site_config["template_dir"]).resolve())
+    for item in site_config["item_config"].values():
+        if "source" in item:
+            directories.add(Path(item["source"]).resolve().parent)
+    directories.update(Path(path).resolve() for path in extra_paths)
+    # drop directories inside other watched directories.
+    directories = {
+        directory
+        for directory in directories
+        if not any(parent in directories for parent in directory.parents)
+    }
+    files = {
+        Path(translation["po_file_path"]).resolve()
+        for translation in site_config.get("translations", {}).values()
+    }
+    return directories, files
+
+
+def is_ignored(path, ignored):
+    return any(path == ignore or ignore in path.parents for ignore in ignored)
+
+
+class PollingWatcher:
+    """Detect changes by comparing the size and modification time of the files."""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.directories = set()
+        self.files = set()
+        self.ignored = set()
+        self.snapshot = {}
+
+    def update(self, directories, files, ignored=()):
+        """Set the paths to watch. Changes before the call are not reported."""
+        self.directories = set(directories)
+        self.files = set(files)
+        self.ignored = set(ignored)
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for directory in self.directories:
+            for root, dirs, files in os.walk(directory):
+                root = Path(root)
+                dirs[:] = [d for d in dirs if not is_ignored(root / d, self.ignored)]
+                for name in files:
+                    self.add_to_snapshot(snapshot, root / name)
+        for path in self.files:
+            self.add_to_snapshot(snapshot, path)
+        return snapshot
+
+    def add_to_snapshot(self, snapshot, path):
+        try:
+            stat = path.stat()
+        except OSError:
+            return
+        snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+
+    def wait(self, timeout=None):
+        """Wait for changes and return the set of changed paths.
+
+        Returns an empty set if nothing changed within *timeout* seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.scan()
+            changes = {
+                path
+                for path in snapshot.keys() | self.snapshot.keys()
+                if snapshot.get(path) != self.snapshot.get(path)
+            }
+            self.snapshot = snapshot
+            if changes:
+                return changes
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, max(0, deadline - time.monotonic()))
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Detect changes with inotify. Only available on Linux."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify is not available on this platform.")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed.")
+        self.watches = {}
+        self.tree_watches = set()
+        self.files = set()
+        self.ignored = set()
+
+    def update(self, directories, files, ignored=()):
+        """Set the paths to watch. Changes before the call are not reported."""
+        for wd in self.watches:
+            self.libc.inotify_rm_watch(self.fd, wd)
+        self.watches = {}
+        self.tree_watches = set()
+        self.files = set(files)
+        self.ignored = set(ignored)
+        for directory in directories:
+            self.add_tree(Path(directory))
+        # the PO files are watched through their directories, since editors often
+        # replace a file rather than write to it.
+        for path in self.files:
+            self.add_watch(path.parent)
+        self.read_events()
+
+    def add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(str(directory)), INOTIFY_MASK
+        )
+        if wd >= 0:
+            self.watches[wd] = directory
+        return wd
+
+    def add_tree(self, directory):
+        if is_ignored(directory, self.ignored):
+            return
+        self.tree_watches.add(self.add_watch(directory))
+        for root, dirs, _ in os.walk(directory):
+            root = Path(root)
+            dirs[:] = [d for d in dirs if not is_ignored(root / d, self.ignored)]
+            for d in dirs:
+                self.tree_watches.add(self.add_watch(root / d))
+
+    def read_events(self):
+        changes = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changes
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                directory = self.watches.get(wd, None)
+                if directory is None:
+                    continue
+                path = directory / name if name else directory
+                if is_ignored(path, self.ignored):
+                    continue
+                if wd in self.tree_watches:
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        self.add_tree(path)
+                    changes.add(path)
+                elif path in self.files:
+                    # other files next to the PO files are of no interest.
+                    changes.add(path)
+
+    def wait(self, timeout=None):
+        """Wait for changes and return the set of changed paths.
+
+        Returns an empty set if nothing changed within *timeout* seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if not readable:
+                return set()
+            changes = self.read_events()
+            if changes:
+                return changes
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(poll_interval=0.5):
+    """Create an inotify watcher where available, and a polling watcher otherwise."""
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError):
+        return PollingWatcher(poll_interval)
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_preview_server(output_dir, host="localhost", port=8000):
+    """Serve the output directory over HTTP from a background thread.
+
+    Returns the server. Call shutdown() on it to stop it. Pass port 0 to pick a free
+    port, which can then be found in server.server_address.
+    """
+    handler = partial(QuietHTTPRequestHandler, directory=str(output_dir))
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def watch(
+    configure,
+    output_dir,
+    host="localhost",
+    port=8000,
+    watch_paths=(),
+    poll_interval=0.5,
+    stop_event=None,
+    **generate_args,
+):
+    """Build a site, serve it for preview and rebuild it whenever its sources change.
+
+    *configure* is a function which returns the site configuration. It is called
+    before each build, so that added and removed templates are picked up. The builds
+    are incremental and run in this process, which keeps the parsed templates,
+    translation catalogs and translation plans in memory between builds. Additional
+    arguments are passed on to generate(). Avoid *jobs*, since the worker processes
+    don't live from one build to the next.
+
+    The template directory, the directories of the resource files and the PO files
+    are watched, along with any directories in *watch_paths*. Runs until interrupted
+    with Ctrl-C, or until *stop_event* is set.
+    """
+    site_config = configure()
+    output_dir = str(output_dir)
+    # start watching before the first build, so that no changes are missed.
+    watcher = create_watcher(poll_interval)
+    ignored = {Path(output_dir).resolve()}
+    if "temp_dir" in site_config:
+        ignored.add(Path(site_config["temp_dir"]).resolve())
+    watched_paths = get_watched_paths(site_config, watch_paths)
+    watcher.update(*watched_paths, ignored)
+    build(site_config, output_dir, generate_args)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    server = start_preview_server(output_dir, host, port)
+    print("serving %s at http://%s:%d/" % ((output_dir,) + server.server_address[:2]))
+    try:
+        while stop_event is None or not stop_event.is_set():
+            changes = watcher.wait(timeout=0.5)
+            if not changes:
+                continue
+            while changes:
+                changes = watcher.wait(timeout=SETTLE_TIME)
+            try:
+                site_config = configure()
+            except Exception:
+                traceback.print_exc()
+                continue
+            build(site_config, output_dir, generate_args)
+            # changes during the build are reported by the next wait(), unless the
+            # watches have to be set up again.
+            if get_watched_paths(site_config, watch_paths) != watched_paths:
+                watched_paths = get_watched_paths(site_config, watch_paths)
+                watcher.update(*watched_paths, ignored)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        watcher.close()
+
+
+def build(site_config, output_dir, generate_args):
+    start = time.perf_counter()
+    try:
+        # a new file list for each build, as the default list is shared.
+        generate(
+            site_config, output_dir, file_list=[], incremental=True, **generate_args
+        )
+    except Exception:
+        # keep watching: the error is likely fixed in the next edit.
+        traceback.print_exc()
+        return False
+    print("built in %.3f s" % (time.perf_counter() - start))
+    return True
@@ -1,26 +1,39 @@
 from pathlib import Path
-import shutil
+import sys
 from pomosite import (
     create_site_config,
     add_resources,
     add_language,
     generate,
     write_manifest_file,
+    watch,
 )
 
 site_root_path = Path(__file__).parent
 temp_path = site_root_path / "temp"
 output_path = temp_path / "public_html"
 
-site_config = create_site_config(str(site_root_path / "templates"), str(temp_path))
-add_resources(str(site_root_path / "resources"), site_config)
-# add_language("en", str(site_root_path / "translations/en.po"), site_config)
 
-print("%d items" % len(site_config["item_config"]))
+def configure():
+    site_config = create_site_config(str(site_root_path / "templates"), str(temp_path))
+    add_resources(str(site_root_path / "resources"), site_config)
+    # add_language("en", str(site_root_path / "translations/en.po"), site_config)
+    return site_config
+
+
+if "--watch" in sys.argv:
+    # rebuild on changes, and serve the site at http://localhost:8000/
+    watch(configure, str(output_path))
+    sys.exit()
 
-if output_path.exists():
-    shutil.rmtree(str(output_path))
+site_config = configure()
+print("%d items" % len(site_config["item_config"]))
 
 file_list = []
-generate(site_config, str(output_path), file_list)
-write_manifest_file(file_list, str(output_path), output_path / ".site.txt")
+file_digests = {}
+generate(
+    site_config, str(output_path), file_list, file_digests=file_digests, staged=True
+)
+write_manifest_file(
+    file_list, str(output_path), output_path / ".site.txt", file_digests
+)
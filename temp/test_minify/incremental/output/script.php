@@ -0,0 +1,8 @@
+<?php
+
+header('Content-Type: text/plain; charset=utf-8');
+
+if ($_SERVER['REQUEST_METHOD'] !== 'POST')
+	exit("Direct access not supported.");
+
+$redirect = 'om-oss/';
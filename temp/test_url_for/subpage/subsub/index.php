@@ -0,0 +1,11 @@
+<!DOCTYPE html>
+<html>
+    <head>
+        <title>P3</title>
+    </head>
+    <body>
+        <div class="header">page name is P3</div>
+        <p></p>
+        <a href="../../">link to P1</a>
+    </body>
+</html>
\ No newline at end of file
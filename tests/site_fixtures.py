@@ -0,0 +1,59 @@
+"""The multilingual test site, shared by the tests which build it."""
+
+import os
+from pathlib import Path
+import shutil
+
+from pomosite import add_language
+from pomosite.translation import extract_translation_units, generate_dummy_translation
+
+content_path = Path(__file__).parent / "data/test_multilingual"
+
+
+def write_dummy_translation(work_dir, template_dir=content_path / "templates"):
+    """Extract the translation units of the templates and write a dummy translation
+    of them to dummy.po in the work directory."""
+    pot_file_path = str(Path(work_dir) / (Path(work_dir).name + ".pot"))
+    extract_translation_units(str(template_dir), pot_file_path)
+    generate_dummy_translation(pot_file_path, str(Path(work_dir) / "dummy.po"))
+
+
+def prepare_work_dir(work_dir):
+    """Make an empty work directory with a dummy translation of the test site."""
+    if work_dir.exists():
+        shutil.rmtree(str(work_dir))
+    os.makedirs(str(work_dir))
+    write_dummy_translation(work_dir)
+
+
+def create_site_config(
+    work_dir, name=None, language_tags=("en",), template_dir=content_path / "templates"
+):
+    """Create the configuration of the test site, with its temp directory in
+    work_dir/name, or in the work directory if no name is given, and the dummy
+    translation for each language."""
+    site_config = {
+        "item_config": {
+            "START": {
+                "endpoint": "/",
+                "template": "start.html",
+            },
+            "OM-OSS": {
+                "endpoint": "/om-oss/",
+                "template": "om-oss.html",
+            },
+            "SCRIPT": {
+                "endpoint": "/script.php",
+                "template": "script.php",
+            },
+            "lim.jpeg": {
+                "endpoint": "/lim.jpeg",
+                "source": str(content_path / "resources/lim.jpeg"),
+            },
+        },
+        "template_dir": str(template_dir),
+        "temp_dir": str(Path(work_dir, name or "", "temp")),
+    }
+    for language_tag in language_tags:
+        add_language(language_tag, str(Path(work_dir) / "dummy.po"), site_config)
+    return site_config
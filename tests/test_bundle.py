@@ -0,0 +1,77 @@
+import unittest
+from unittest import mock
+from pathlib import Path
+import shutil
+import jinja2
+
+from pomosite import generate, compile_template_bundle, templating
+from pomosite.bundle import BundleLoader
+
+from .site_fixtures import content_path, create_site_config, write_dummy_translation
+
+work_dir = Path("temp/test_bundle")
+template_dir = work_dir / "templates"
+bundle_path = work_dir / "templates.zip"
+
+
+class TestBundle(unittest.TestCase):
+    def setUp(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        shutil.copytree(str(content_path / "templates"), str(template_dir))
+        write_dummy_translation(work_dir, template_dir)
+        self.site_config = create_site_config(work_dir, template_dir=template_dir)
+        compile_template_bundle(self.site_config, bundle_path)
+        self.forget_compiled_templates()
+
+    def forget_compiled_templates(self):
+        templating._jinja_environments.clear()
+        templating._bytecode_caches.clear()
+        shutil.rmtree(str(work_dir / "temp/.cache/jinja"), ignore_errors=True)
+
+    def generate(self, name, **kwargs):
+        output_dir = work_dir / name
+        file_list = []
+        generate(self.site_config, str(output_dir), file_list, **kwargs)
+        return {
+            Path(f).relative_to(output_dir.resolve()): Path(f).read_bytes()
+            for f in file_list
+        }
+
+    def test_should_render_from_the_bundle_without_compiling(self):
+        with mock.patch.object(
+            jinja2.Environment, "compile", side_effect=AssertionError("compiled")
+        ):
+            bundled = self.generate("bundled", template_bundle=bundle_path)
+        self.assertEqual(self.generate("reference"), bundled)
+
+    def test_should_render_from_the_bundle_incrementally(self):
+        self.generate("incremental", template_bundle=bundle_path, incremental=True)
+        base = template_dir / "base.html"
+        base.write_text(base.read_text().replace("</body>", "changed</body>"))
+        output = self.generate(
+            "incremental", template_bundle=bundle_path, incremental=True
+        )
+        self.assertIn(b"changed", output[Path("om-oss/index.html")])
+
+    def test_should_ignore_stale_bundles(self):
+        base = template_dir / "base.html"
+        base.write_text(base.read_text().replace("</body>", "changed</body>"))
+        output = self.generate("stale", template_bundle=bundle_path)
+        self.assertIn(b"changed", output[Path("index.html")])
+        self.assertIn(b"changed", output[Path("en/index.html")])
+
+    def test_should_close_the_bundle_after_rendering(self):
+        bundled = self.generate("closed", template_bundle=bundle_path)
+        loaders = [
+            jinja_env.loader
+            for jinja_env in templating._jinja_environments.values()
+            if isinstance(jinja_env.loader, BundleLoader)
+        ]
+        self.assertTrue(loaders)
+        self.assertEqual([None] * len(loaders), [loader.zip for loader in loaders])
+        # the cached environments open the bundle again for the next build.
+        self.assertEqual(
+            bundled, self.generate("reopened", template_bundle=bundle_path)
+        )
+        self.assertEqual([None] * len(loaders), [loader.zip for loader in loaders])
@@ -0,0 +1,52 @@
+import unittest
+from unittest import mock
+from pathlib import Path
+import jinja2
+
+from pomosite import generate, templating
+
+from .site_fixtures import create_site_config, prepare_work_dir
+
+work_dir = Path("temp/test_bytecode_cache")
+
+
+class TestBytecodeCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        prepare_work_dir(work_dir)
+
+    def setUp(self):
+        templating._jinja_environments.clear()
+        templating._bytecode_caches.clear()
+
+    def get_cache_files(self, name):
+        return list(Path(work_dir, name, "temp/.cache/jinja").glob("*.jinja"))
+
+    def test_should_share_compiled_templates_between_languages(self):
+        generate(
+            create_site_config(work_dir, "one", ["en"]), str(work_dir / "one/output")
+        )
+        generate(
+            create_site_config(work_dir, "two", ["en", "de"]),
+            str(work_dir / "two/output"),
+        )
+        # both languages have the same translation, and thereby the same templates.
+        self.assertEqual(
+            len(self.get_cache_files("one")), len(self.get_cache_files("two"))
+        )
+
+    def test_should_not_compile_templates_again_on_warm_builds(self):
+        site_config = create_site_config(work_dir, "warm", ["en"])
+        generate(site_config, str(work_dir / "warm/output"))
+        expected = (work_dir / "warm/output/en/index.html").read_bytes()
+
+        # a new process starts with empty in-memory caches.
+        templating._jinja_environments.clear()
+        templating._bytecode_caches.clear()
+        with mock.patch.object(
+            jinja2.Environment, "compile", side_effect=AssertionError("compiled")
+        ):
+            generate(site_config, str(work_dir / "warm/output2"))
+        self.assertEqual(
+            expected, (work_dir / "warm/output2/en/index.html").read_bytes()
+        )
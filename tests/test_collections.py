@@ -0,0 +1,168 @@
+import csv
+import json
+import os
+import sqlite3
+import unittest
+from pathlib import Path
+import shutil
+
+from pomosite import (
+    generate,
+    add_collection,
+    BuildProfile,
+    MemorySink,
+)
+
+work_dir = Path("temp/test_collections")
+template_dir = work_dir / "templates"
+
+PRODUCTS = [
+    {"sku": "a1", "name": "Anvil", "price": 10},
+    {"sku": "b2", "name": "Bucket", "price": 20},
+    {"sku": "c3", "name": 'Crowbar, "heavy"\nduty', "price": 30},
+]
+
+
+class TestCollections(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        os.makedirs(str(template_dir))
+        (template_dir / "product.html").write_text(
+            "{{record.name}}: {{record.price}} "
+            '<a href="{{url_for("INDEX")}}">all</a>',
+            encoding="utf-8",
+        )
+        (template_dir / "index.html").write_text(
+            '<a href="{{url_for("product-b2")}}">b2</a>', encoding="utf-8"
+        )
+
+    def create_site_config(self, name):
+        return {
+            "item_config": {
+                "INDEX": {"endpoint": "/", "template": "index.html"},
+            },
+            "template_dir": str(template_dir),
+            "temp_dir": str(work_dir / name / "temp"),
+        }
+
+    def write_jsonl(self, path, records):
+        with open(str(path), "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n\n")
+
+    def build(self, site_config, **generate_args):
+        sink = MemorySink()
+        generate(site_config, sink, **generate_args)
+        return sink.files
+
+    def check_products(self, files):
+        self.assertEqual(b'<a href="products/b2/">b2</a>', files.pop("index.html"))
+        self.assertEqual(
+            {
+                "products/%s/index.html"
+                % product["sku"]: (
+                    '%s: %s <a href="../../">all</a>'
+                    % (product["name"], product["price"])
+                ).encode("utf-8")
+                for product in PRODUCTS
+            },
+            files,
+        )
+
+    def test_should_render_a_jsonl_collection(self):
+        source = work_dir / "products.jsonl"
+        self.write_jsonl(source, PRODUCTS)
+        site_config = self.create_site_config("jsonl")
+        add_collection(
+            "products",
+            str(source),
+            "product.html",
+            "product-{sku}",
+            "/products/{sku}/",
+            site_config,
+        )
+        self.check_products(self.build(site_config))
+
+    def test_should_render_a_csv_collection(self):
+        source = work_dir / "products.csv"
+        with open(str(source), "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, ["sku", "name", "price"])
+            writer.writeheader()
+            writer.writerows(PRODUCTS)
+        site_config = self.create_site_config("csv")
+        add_collection(
+            "products",
+            str(source),
+            "product.html",
+            "product-{sku}",
+            "/products/{sku}/",
+            site_config,
+        )
+        self.check_products(self.build(site_config))
+        self.check_products(self.build(site_config, jobs=2))
+
+    def test_should_render_a_sqlite_collection(self):
+        source = work_dir / "products.db"
+        with sqlite3.connect(str(source)) as connection:
+            connection.execute("CREATE TABLE products (sku, name, price)")
+            connection.executemany(
+                "INSERT INTO products VALUES (:sku, :name, :price)",
+                reversed(PRODUCTS),
+            )
+        connection.close()
+        site_config = self.create_site_config("sqlite")
+        add_collection(
+            "products",
+            str(source),
+            "product.html",
+            "product-{sku}",
+            "/products/{sku}/",
+            site_config,
+            query="SELECT * FROM products ORDER BY sku",
+        )
+        self.check_products(self.build(site_config, jobs=2))
+
+    def test_should_only_render_changed_records_in_incremental_builds(self):
+        source = work_dir / "incremental.jsonl"
+        output_dir = work_dir / "incremental/output"
+
+        def build(products):
+            self.write_jsonl(source, products)
+            site_config = self.create_site_config("incremental")
+            add_collection(
+                "products",
+                str(source),
+                "product.html",
+                "product-{sku}",
+                "/products/{sku}/",
+                site_config,
+            )
+            profile = BuildProfile()
+            generate(site_config, str(output_dir), incremental=True, profile=profile)
+            return profile.summary()["counters"].get("pages_rendered", 0)
+
+        self.assertEqual(4, build(PRODUCTS))
+        self.assertEqual(0, build(PRODUCTS))
+        products = [{"sku": "a0", "name": "Axe", "price": 5}, *PRODUCTS]
+        products[2] = {**products[2], "price": 25}
+        self.assertEqual(2, build(products))
+        self.assertEqual(
+            "Bucket: 25 " '<a href="../../">all</a>',
+            (output_dir / "products/b2/index.html").read_text(encoding="utf-8"),
+        )
+        self.assertTrue((output_dir / "products/a0/index.html").is_file())
+
+    def test_should_reject_records_with_missing_fields(self):
+        source = work_dir / "missing.jsonl"
+        self.write_jsonl(source, [{"sku": "a1"}, {"name": "no sku"}])
+        with self.assertRaises(ValueError):
+            add_collection(
+                "products",
+                str(source),
+                "product.html",
+                "product-{sku}",
+                "/products/{sku}/",
+                self.create_site_config("missing"),
+            )
@@ -0,0 +1,90 @@
+import os
+import unittest
+from pathlib import Path
+import shutil
+from pomosite import generate, create_site_config
+from pomosite.buildstate import file_digest
+from pomosite.templating import ConfigurationError
+
+content_path = Path(__file__).parent / "data/test_templating"
+work_dir = Path("temp/test_copy_strategies")
+source_path = work_dir / "lim.jpeg"
+
+
+class TestCopyStrategies(unittest.TestCase):
+    def setUp(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        os.makedirs(str(work_dir))
+        shutil.copy(str(content_path / "resources/lim.jpeg"), str(source_path))
+        self.site_config = create_site_config(
+            str(content_path / "templates"), str(work_dir / "temp")
+        )
+        self.site_config["item_config"]["lim.jpeg"] = {
+            "endpoint": "/lim.jpeg",
+            "source": str(source_path),
+        }
+
+    def generate(self, name, copy_strategy):
+        output_dir = str(work_dir / name)
+        file_digests = {}
+        generate(
+            self.site_config,
+            output_dir,
+            file_digests=file_digests,
+            copy_strategy=copy_strategy,
+        )
+        output_path = Path(output_dir, "lim.jpeg")
+        self.assertEqual(
+            file_digest(source_path), file_digests[str(output_path.resolve())]
+        )
+        return output_path
+
+    def test_skip_unchanged_should_leave_unchanged_files_alone(self):
+        output_path = self.generate("skip", "skip-unchanged")
+        self.assertEqual(source_path.stat().st_mtime_ns, output_path.stat().st_mtime_ns)
+        output_ino = output_path.stat().st_ino
+        self.generate("skip", "skip-unchanged")
+        self.assertEqual(output_ino, output_path.stat().st_ino)
+
+        source_path.write_bytes(b"changed")
+        self.generate("skip", "skip-unchanged")
+        self.assertEqual(b"changed", output_path.read_bytes())
+
+    def test_hardlink_should_link_to_the_source(self):
+        output_path = self.generate("hardlink", "hardlink")
+        self.assertTrue(os.path.samefile(str(source_path), str(output_path)))
+        self.generate("hardlink", "hardlink")
+        self.assertTrue(os.path.samefile(str(source_path), str(output_path)))
+
+    def test_reflink_should_produce_a_copy(self):
+        output_path = self.generate("reflink", "reflink")
+        self.assertEqual(source_path.read_bytes(), output_path.read_bytes())
+        self.assertFalse(os.path.samefile(str(source_path), str(output_path)))
+
+    def test_should_reject_unknown_copy_strategies(self):
+        with self.assertRaises(ConfigurationError):
+            generate(self.site_config, str(work_dir / "x"), copy_strategy="move")
+
+    def test_should_not_write_through_hard_links_to_the_source(self):
+        source = source_path.read_bytes()
+        output_path = self.generate("relink", "hardlink")
+        self.assertTrue(os.path.samefile(str(source_path), str(output_path)))
+        for copy_strategy in ["copy", "reflink", "hardlink"]:
+            self.generate("relink", copy_strategy)
+        self.assertEqual(source, source_path.read_bytes())
+
+        style_path = work_dir / "style.css"
+        style_path.write_text("a {  }\n", encoding="utf-8")
+        self.site_config["item_config"]["style.css"] = {
+            "endpoint": "/style.css",
+            "source": str(style_path),
+        }
+        self.generate("relink", "hardlink")
+        generate(
+            self.site_config,
+            str(work_dir / "relink"),
+            minify={".css": lambda text: text.strip()},
+        )
+        self.assertEqual("a {  }", (work_dir / "relink/style.css").read_text())
+        self.assertEqual("a {  }\n", style_path.read_text(encoding="utf-8"))
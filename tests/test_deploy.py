@@ -0,0 +1,109 @@
+import io
+import os
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+
+from pomosite import write_manifest_file
+from pomosite.deploy import deploy, diff_manifests, read_manifest, main
+
+work_dir = Path("temp/test_deploy")
+
+
+def build(name, files):
+    """Write a site with the given files and its manifest, as a build would."""
+    output_dir = work_dir / name / "output"
+    if output_dir.exists():
+        shutil.rmtree(str(output_dir))
+    file_list = []
+    for file_name, content in files.items():
+        path = output_dir / file_name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+        file_list.append(str(path.resolve()))
+    manifest_path = work_dir / name / "site.txt"
+    write_manifest_file(file_list, str(output_dir), str(manifest_path))
+    return output_dir, manifest_path
+
+
+class TestDeploy(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        os.makedirs(str(work_dir))
+
+    def test_should_diff_manifests(self):
+        old = {"a.html": "1", "b.html": "2", "c.html": "3"}
+        new = {"a.html": "1", "b.html": "x", "d.html": "4"}
+        diff = diff_manifests(old, new)
+        self.assertEqual(["d.html"], diff.added)
+        self.assertEqual(["b.html"], diff.changed)
+        self.assertEqual(["c.html"], diff.deleted)
+
+    def test_should_read_manifests(self):
+        _, manifest_path = build("read", {"index.html": "x", "en/a.html": "y"})
+        self.assertEqual(
+            {"index.html", "en/a.html"}, read_manifest(manifest_path).keys()
+        )
+        self.assertEqual({}, read_manifest(work_dir / "read/missing.txt"))
+
+    def test_should_deploy_only_the_changes(self):
+        target_dir = work_dir / "delta/target"
+        files = {"index.html": "home", "en/index.html": "en", "old/a.html": "old"}
+        output_dir, manifest_path = build("delta", files)
+        diff = deploy(output_dir, manifest_path, target_dir)
+        self.assertEqual(sorted(files), diff.added)
+        self.assertEqual("en", (target_dir / "en/index.html").read_text())
+
+        os.utime(str(target_dir / "index.html"), ns=(0, 0))
+        files["en/index.html"] = "english"
+        del files["old/a.html"]
+        files["new.html"] = "new"
+        output_dir, manifest_path = build("delta", files)
+        diff = deploy(output_dir, manifest_path, target_dir, dry_run=True)
+        self.assertEqual((["new.html"], ["en/index.html"], ["old/a.html"]), diff)
+        self.assertFalse((target_dir / "new.html").exists())
+
+        deploy(output_dir, manifest_path, target_dir)
+        self.assertEqual(0, (target_dir / "index.html").stat().st_mtime_ns)
+        self.assertEqual("english", (target_dir / "en/index.html").read_text())
+        self.assertTrue((target_dir / "old/a.html").exists())
+
+        # files left in place are deleted by a later deploy with deletes.
+        diff = deploy(output_dir, manifest_path, target_dir, delete=True)
+        self.assertEqual(([], [], ["old/a.html"]), diff)
+        self.assertFalse((target_dir / "old").exists())
+
+    def test_should_delete_removed_files(self):
+        target_dir = work_dir / "delete/target"
+        output_dir, manifest_path = build("delete", {"a.html": "a", "sub/b.html": "b"})
+        deploy(output_dir, manifest_path, target_dir)
+        output_dir, manifest_path = build("delete", {"a.html": "a"})
+        diff = deploy(output_dir, manifest_path, target_dir, delete=True)
+        self.assertEqual(["sub/b.html"], diff.deleted)
+        self.assertFalse((target_dir / "sub").exists())
+        self.assertTrue((target_dir / "a.html").exists())
+
+    def test_command_should_report_the_changes(self):
+        output_dir, manifest_path = build("command", {"a.html": "a"})
+        out = io.StringIO()
+        with redirect_stdout(out):
+            main([str(output_dir), str(manifest_path), str(work_dir / "command/t")])
+        self.assertEqual(
+            "added    /a.html\n1 added, 0 changed, 0 deleted\n", out.getvalue()
+        )
+
+    def test_command_should_run_without_warnings(self):
+        # runpy warns if the package has already imported the module.
+        result = subprocess.run(
+            [sys.executable, "-W", "error::RuntimeWarning", "-m", "pomosite.deploy"]
+            + ["--help"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.assertEqual(b"", result.stderr)
+        self.assertEqual(0, result.returncode)
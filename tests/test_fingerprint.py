@@ -0,0 +1,81 @@
+import os
+import unittest
+from pathlib import Path
+import shutil
+
+from pomosite import generate, write_cache_headers
+from pomosite.fingerprint import fingerprint_endpoint, format_cache_headers
+
+from . import site_fixtures
+from .site_fixtures import content_path
+
+work_dir = Path("temp/test_fingerprint")
+digest = "3f2a9c1b7e" + "0" * 54
+
+
+class TestFingerprint(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        os.makedirs(str(work_dir))
+
+    def create_site_config(self, name):
+        site_config = site_fixtures.create_site_config(work_dir, name, [])
+        site_config["item_config"]["lim.jpeg"]["endpoint"] = "/img/lim.jpeg"
+        site_config["item_config"]["_1"] = {
+            "endpoint": "/.htaccess",
+            "source": str(content_path / "resources/lim.jpeg"),
+        }
+        return site_config
+
+    def test_should_insert_the_fingerprint_before_the_suffix(self):
+        self.assertEqual(
+            "/img/lim.3f2a9c1b7e.jpeg", fingerprint_endpoint("/img/lim.jpeg", digest)
+        )
+        self.assertEqual(
+            "/js/app.min.3f2a9c1b7e.js", fingerprint_endpoint("/js/app.min.js", digest)
+        )
+        self.assertEqual(
+            "/LICENSE.3f2a9c1b7e", fingerprint_endpoint("/LICENSE", digest)
+        )
+
+    def test_url_for_should_return_the_fingerprinted_url(self):
+        output_dir = work_dir / "urls/output"
+        site_config = self.create_site_config("urls")
+        fingerprints = {}
+        generate(
+            site_config,
+            str(output_dir),
+            fingerprint_resources=True,
+            fingerprints=fingerprints,
+        )
+        (fingerprinted,) = list((output_dir / "img").glob("lim.*.jpeg"))
+        self.assertEqual({"lim.jpeg": "/img/" + fingerprinted.name}, fingerprints)
+        self.assertFalse((output_dir / "img/lim.jpeg").exists())
+        self.assertTrue((output_dir / ".htaccess").is_file())
+        self.assertIn(
+            'src="img/%s"' % fingerprinted.name,
+            (output_dir / "index.html").read_text(encoding="utf-8"),
+        )
+        # the caller's configuration is left as it is.
+        self.assertEqual(
+            "/img/lim.jpeg", site_config["item_config"]["lim.jpeg"]["endpoint"]
+        )
+
+    def test_should_write_cache_headers(self):
+        fingerprints = {"a.css": "/css/a.3f2a9c1b7e.css"}
+        self.assertEqual(
+            '<FilesMatch "^(a\\.3f2a9c1b7e\\.css)$">\n'
+            '    Header set Cache-Control "public, max-age=31536000, immutable"\n'
+            "</FilesMatch>\n",
+            format_cache_headers(fingerprints.values(), "apache"),
+        )
+        path = work_dir / "nginx.conf"
+        write_cache_headers(fingerprints, str(path), "nginx")
+        self.assertEqual(
+            "location = /css/a.3f2a9c1b7e.css {\n"
+            '    add_header Cache-Control "public, max-age=31536000, immutable";\n'
+            "}\n",
+            path.read_text(encoding="utf-8"),
+        )
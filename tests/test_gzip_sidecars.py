@@ -0,0 +1,115 @@
+import gzip
+import os
+import unittest
+from pathlib import Path
+
+from pomosite import (
+    generate,
+    write_manifest_file,
+    ConfigurationError,
+    MemorySink,
+)
+
+from .site_fixtures import create_site_config, prepare_work_dir
+
+work_dir = Path("temp/test_gzip_sidecars")
+
+
+class TestGzipSidecars(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        prepare_work_dir(work_dir)
+
+    def test_should_write_sidecars_for_text_outputs(self):
+        output_dir = work_dir / "sidecars/output"
+        file_list = []
+        file_digests = {}
+        generate(
+            create_site_config(work_dir, "sidecars"),
+            str(output_dir),
+            file_list,
+            file_digests=file_digests,
+            gzip_sidecars=True,
+            gzip_min_size=0,
+        )
+        sidecars = sorted(
+            path.relative_to(output_dir).as_posix()
+            for path in output_dir.glob("**/*.gz")
+        )
+        self.assertEqual(
+            [
+                "en/index.html.gz",
+                "en/script.php.gz",
+                "index.html.gz",
+                "om-oss/en/index.html.gz",
+                "om-oss/index.html.gz",
+                "script.php.gz",
+            ],
+            sidecars,
+        )
+        for sidecar in sidecars:
+            self.assertEqual(
+                (output_dir / sidecar[:-3]).read_bytes(),
+                gzip.decompress((output_dir / sidecar).read_bytes()),
+            )
+            self.assertIn(str((output_dir / sidecar).resolve()), file_list)
+
+        manifest_path = work_dir / "sidecars/site.txt"
+        write_manifest_file(
+            file_list, str(output_dir), str(manifest_path), file_digests
+        )
+        self.assertIn("/index.html.gz;", manifest_path.read_text())
+
+    def test_should_skip_small_files(self):
+        output_dir = work_dir / "small/output"
+        generate(
+            create_site_config(work_dir, "small"),
+            str(output_dir),
+            gzip_sidecars=True,
+            gzip_min_size=1 << 20,
+        )
+        self.assertEqual([], list(output_dir.glob("**/*.gz")))
+
+    def test_should_keep_sidecars_of_unchanged_files(self):
+        output_dir = work_dir / "unchanged/output"
+        site_config = create_site_config(work_dir, "unchanged")
+        generate(site_config, str(output_dir), gzip_sidecars=True, gzip_min_size=0)
+        sidecar = output_dir / "index.html.gz"
+        os.utime(str(sidecar), ns=(0, 0))
+        generate(site_config, str(output_dir), gzip_sidecars=True, gzip_min_size=0)
+        self.assertEqual(0, sidecar.stat().st_mtime_ns)
+
+        # a changed page gets a new sidecar.
+        site_config["item_config"]["START"]["template"] = "om-oss.html"
+        generate(site_config, str(output_dir), gzip_sidecars=True, gzip_min_size=0)
+        self.assertNotEqual(0, sidecar.stat().st_mtime_ns)
+
+    def test_incremental_build_should_remove_stale_sidecars(self):
+        output_dir = work_dir / "stale/output"
+        site_config = create_site_config(work_dir, "stale")
+        generate(
+            site_config,
+            str(output_dir),
+            incremental=True,
+            gzip_sidecars=True,
+            gzip_min_size=0,
+        )
+        self.assertTrue((output_dir / "script.php.gz").is_file())
+        del site_config["item_config"]["SCRIPT"]
+        # the base template refers to SCRIPT, so leave the link dangling.
+        site_config["item_config"]["SCRIPT"] = {"endpoint": "/script.php"}
+        generate(
+            site_config,
+            str(output_dir),
+            incremental=True,
+            gzip_sidecars=True,
+            gzip_min_size=0,
+        )
+        self.assertFalse((output_dir / "script.php.gz").exists())
+        self.assertTrue((output_dir / "index.html.gz").is_file())
+
+    def test_should_require_an_output_directory(self):
+        with self.assertRaises(ConfigurationError):
+            generate(
+                create_site_config(work_dir, "memory"), MemorySink(), gzip_sidecars=True
+            )
@@ -0,0 +1,141 @@
+import os
+import unittest
+from unittest import mock
+from pathlib import Path
+import shutil
+
+from pomosite import generate, add_image_derivatives, ConfigurationError
+from pomosite import images
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+content_path = Path(__file__).parent / "data/test_multilingual"
+work_dir = Path("temp/test_images")
+template = (
+    '{# id: "GALLERY", endpoint: "/gallery/" #}\n'
+    "<img src=\"{{ url_for('lim.jpeg') }}\" srcset=\"{{ srcset_for('lim.jpeg') }}\">\n"
+    "<source srcset=\"{{ srcset_for('lim.jpeg', 'webp') }}\" type=\"image/webp\">\n"
+)
+
+
+def fake_resize_image(source, destination, width, format, quality):
+    # the test image is 600x554.
+    if width > 600:
+        return None
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    destination.write_bytes(b"%s %d" % (format.encode(), width))
+    return width, round(554 * width / 600)
+
+
+class TestImages(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        (work_dir / "templates").mkdir(parents=True)
+        (work_dir / "templates/gallery.html").write_text(template)
+        shutil.copy(str(content_path / "resources/lim.jpeg"), str(work_dir))
+
+    def create_site_config(self, name):
+        site_config = {
+            "item_config": {
+                "GALLERY": {
+                    "endpoint": "/gallery/",
+                    "template": "gallery.html",
+                },
+                "lim.jpeg": {
+                    "endpoint": "/img/lim.jpeg",
+                    "source": str(work_dir / "lim.jpeg"),
+                },
+            },
+            "template_dir": str(work_dir / "templates"),
+            "temp_dir": str(work_dir / name / "temp"),
+        }
+        add_image_derivatives(
+            "*.jpeg", [300, 480, 1200], site_config, formats=["jpeg", "webp"]
+        )
+        return site_config
+
+    def generate(self, site_config, output_dir, **generate_args):
+        with mock.patch.object(
+            images, "resize_image", side_effect=fake_resize_image
+        ) as resize_image:
+            generate(site_config, str(output_dir), **generate_args)
+        return resize_image.call_count
+
+    def test_srcset_for_should_list_the_derivatives(self):
+        output_dir = work_dir / "srcset/output"
+        file_list = []
+        self.assertEqual(
+            6,
+            self.generate(
+                self.create_site_config("srcset"), output_dir, file_list=file_list
+            ),
+        )
+        self.assertEqual(
+            '\n<img src="../img/lim.jpeg" '
+            'srcset="../img/lim-300w.jpeg 300w, ../img/lim-480w.jpeg 480w">\n'
+            '<source srcset="../img/lim-300w.webp 300w, ../img/lim-480w.webp 480w" '
+            'type="image/webp">',
+            (output_dir / "gallery/index.html").read_text(),
+        )
+        self.assertEqual(b"webp 480", (output_dir / "img/lim-480w.webp").read_bytes())
+        self.assertFalse((output_dir / "img/lim-1200w.jpeg").exists())
+        self.assertIn(str((output_dir / "img/lim-300w.jpeg").resolve()), file_list)
+
+    def test_should_only_process_new_or_changed_images(self):
+        site_config = self.create_site_config("cache")
+        self.generate(site_config, work_dir / "cache/output")
+        self.assertEqual(0, self.generate(site_config, work_dir / "cache/output"))
+
+        site_config["image_derivatives"][0]["widths"].append(240)
+        self.assertEqual(2, self.generate(site_config, work_dir / "cache/output"))
+
+        source = work_dir / "cache/lim.jpeg"
+        shutil.copy(str(work_dir / "lim.jpeg"), str(source))
+        with source.open("ab") as f:
+            f.write(b"changed")
+        site_config["item_config"]["lim.jpeg"]["source"] = str(source)
+        self.assertEqual(8, self.generate(site_config, work_dir / "cache/output"))
+
+    def test_incremental_build_should_rerender_pages_when_derivatives_change(self):
+        output_dir = work_dir / "incremental/output"
+        site_config = self.create_site_config("incremental")
+        self.generate(site_config, output_dir, incremental=True)
+        page = output_dir / "gallery/index.html"
+        os.utime(str(page), ns=(0, 0))
+        self.generate(site_config, output_dir, incremental=True)
+        self.assertEqual(0, page.stat().st_mtime_ns)
+
+        site_config["image_derivatives"][0]["widths"].append(240)
+        self.generate(site_config, output_dir, incremental=True)
+        self.assertIn("lim-240w.jpeg 240w", page.read_text())
+
+    def test_should_require_a_temp_dir(self):
+        site_config = self.create_site_config("no-temp")
+        del site_config["temp_dir"]
+        with self.assertRaises(ConfigurationError):
+            generate(site_config, str(work_dir / "no-temp/output"))
+
+    @unittest.skipUnless(PIL, "Pillow is not installed")
+    def test_should_resize_images_with_pillow(self):
+        from PIL import Image
+
+        output_dir = work_dir / "pillow/output"
+        generate(self.create_site_config("pillow"), str(output_dir))
+        with Image.open(str(output_dir / "img/lim-300w.jpeg")) as image:
+            self.assertEqual((300, 277), image.size)
+        with Image.open(str(output_dir / "img/lim-480w.webp")) as image:
+            self.assertEqual("WEBP", image.format)
+
+    def test_should_reject_derivatives_with_the_same_endpoint(self):
+        site_config = self.create_site_config("duplicate")
+        site_config["item_config"]["lim-copy.jpeg"] = {
+            "endpoint": "/img/lim.jpg",
+            "source": str(work_dir / "lim.jpeg"),
+        }
+        with self.assertRaises(ConfigurationError):
+            self.generate(site_config, work_dir / "duplicate/output")
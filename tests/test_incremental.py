@@ -0,0 +1,94 @@
+import unittest
+from unittest import mock
+from pathlib import Path
+import shutil
+from pomosite import generate, create_site_config
+from pomosite.buildstate import BuildState
+
+content_path = Path(__file__).parent / "data/test_templating"
+work_dir = Path("temp/test_incremental")
+output_dir = str(work_dir / "output")
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        shutil.copytree(str(content_path / "templates"), str(work_dir / "templates"))
+        self.site_config = create_site_config(
+            str(work_dir / "templates"), str(work_dir / "temp")
+        )
+        self.site_config["item_config"]["lim.jpeg"] = {
+            "endpoint": "/lim.jpeg",
+            "source": str(content_path / "resources/lim.jpeg"),
+        }
+        generate(self.site_config, output_dir, incremental=True)
+
+    def mark(self, name):
+        # overwrite an output file, so that we can tell whether it was regenerated.
+        path = Path(output_dir, name)
+        path.write_text("marker")
+        return path
+
+    def stat(self, name):
+        # a rewritten output is a new file, or at least has a new modification time.
+        stat = Path(output_dir, name).stat()
+        return stat.st_ino, stat.st_mtime_ns
+
+    def test_should_skip_outputs_with_unchanged_inputs(self):
+        stats = [self.stat("index.html"), self.stat("lim.jpeg")]
+        file_list = []
+        generate(self.site_config, output_dir, file_list, incremental=True)
+        self.assertEqual(stats, [self.stat("index.html"), self.stat("lim.jpeg")])
+        self.assertEqual(4, len(file_list))
+
+    def test_should_regenerate_outputs_which_were_changed(self):
+        p1 = self.mark("index.html")
+        image = self.mark("lim.jpeg")
+        generate(self.site_config, output_dir, incremental=True)
+        self.assertNotEqual(p1.read_text(), "marker")
+        self.assertNotEqual(image.read_bytes(), b"marker")
+
+    def test_should_regenerate_outputs_of_a_failed_build(self):
+        header = work_dir / "templates/header.html"
+        original = header.read_text()
+        header.write_text(original + "<p>changed</p>\n")
+        # fail after the outputs are written, before the build state is saved.
+        with mock.patch.object(
+            BuildState, "remove_stale_outputs", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                generate(self.site_config, output_dir, incremental=True)
+        p1 = Path(output_dir, "index.html")
+        self.assertIn("changed", p1.read_text())
+        header.write_text(original)
+        generate(self.site_config, output_dir, incremental=True)
+        self.assertNotIn("changed", p1.read_text())
+
+    def test_should_regenerate_outputs_when_an_included_template_changes(self):
+        p1 = self.mark("index.html")
+        header = work_dir / "templates/header.html"
+        header.write_text(header.read_text() + "<p>changed</p>\n")
+        generate(self.site_config, output_dir, incremental=True)
+        self.assertIn("changed", p1.read_text())
+
+    def test_should_regenerate_outputs_when_a_referenced_item_changes(self):
+        p2 = self.mark("subpage/index.html")
+        p3 = self.mark("subpage/sub-no-trailing-slash")
+        self.site_config["item_config"]["P1"]["endpoint"] = "/start/"
+        generate(self.site_config, output_dir, incremental=True)
+        self.assertIn('href="../start/"', p2.read_text())
+        self.assertIn('href="../start/"', p3.read_text())
+
+    def test_should_delete_outputs_of_removed_items(self):
+        del self.site_config["item_config"]["P3"]
+        generate(self.site_config, output_dir, incremental=True)
+        self.assertFalse(Path(output_dir, "subpage/sub-no-trailing-slash").exists())
+        self.assertTrue(Path(output_dir, "subpage/index.html").exists())
+
+    def test_should_regenerate_everything_on_full_rebuild(self):
+        p1 = self.mark("index.html")
+        image = self.mark("lim.jpeg")
+        generate(self.site_config, output_dir, incremental=True, full_rebuild=True)
+        self.assertNotEqual(p1.read_text(), "marker")
+        self.assertNotEqual(image.read_bytes(), b"marker")
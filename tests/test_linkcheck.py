@@ -0,0 +1,119 @@
+import subprocess
+import sys
+import unittest
+from unittest import mock
+from pathlib import Path
+
+from pomosite import generate, write_manifest_file
+from pomosite import linkcheck
+from pomosite.linkcheck import (
+    BrokenLink,
+    OUTSIDE_SITE,
+    check_links,
+    find_links,
+    resolve_link,
+)
+
+from .site_fixtures import create_site_config, prepare_work_dir
+
+work_dir = Path("temp/test_linkcheck")
+
+
+class TestLinkCheck(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        prepare_work_dir(work_dir)
+
+    def build(self, name):
+        site_config = create_site_config(work_dir, name)
+        output_dir = work_dir / name / "output"
+        file_list = []
+        generate(site_config, str(output_dir), file_list)
+        return output_dir, file_list
+
+    def break_links(self, output_dir):
+        (output_dir / "om-oss/en/index.html").unlink()
+        (output_dir / "extra.html").write_text(
+            '<a href="missing.html">x</a> <a href="om-oss">ok</a>'
+            '<img srcset="lim.jpeg 1x, lim@2x.jpeg 2x"> <a href="../up.html">up</a>'
+            '<a href="https://example.com/">external</a> <a href="#top">top</a>',
+            encoding="utf-8",
+        )
+
+    def test_should_find_no_broken_links_in_a_complete_site(self):
+        output_dir, _ = self.build("complete")
+        self.assertEqual({None: [], "en": []}, check_links(str(output_dir), ["en"]))
+
+    def test_should_report_broken_links_per_language(self):
+        output_dir, _ = self.build("broken")
+        self.break_links(output_dir)
+        expected = {
+            None: [
+                BrokenLink("extra.html", "../up.html", OUTSIDE_SITE),
+                BrokenLink("extra.html", "lim@2x.jpeg", "lim@2x.jpeg"),
+                BrokenLink("extra.html", "missing.html", "missing.html"),
+                BrokenLink("om-oss/index.html", "en/", "om-oss/en/"),
+            ],
+            "en": [
+                BrokenLink("en/index.html", "../om-oss/en/#avsnitt", "om-oss/en/"),
+            ],
+        }
+        report = check_links(str(output_dir), ["en"])
+        self.assertEqual(expected["en"], report["en"])
+        self.assertEqual(expected[None], report[None])
+        self.assertEqual(1, linkcheck.main([str(output_dir), "--languages", "en"]))
+
+    def test_should_cache_the_links_by_content(self):
+        output_dir, file_list = self.build("cache")
+        manifest_path = work_dir / "cache" / "site.txt"
+        write_manifest_file(file_list, str(output_dir), str(manifest_path))
+        cache_dir = work_dir / "cache" / "linkcheck"
+        with mock.patch.object(linkcheck, "PARALLEL_CHECK_THRESHOLD", 0):
+            report = check_links(str(output_dir), ["en"], cache_dir=cache_dir, jobs=2)
+        with mock.patch.object(
+            linkcheck, "find_links_in_file", side_effect=AssertionError
+        ):
+            self.assertEqual(
+                report, check_links(str(output_dir), ["en"], cache_dir=cache_dir)
+            )
+            self.assertEqual(
+                report,
+                check_links(
+                    str(output_dir),
+                    ["en"],
+                    manifest_path=str(manifest_path),
+                    cache_dir=cache_dir,
+                ),
+            )
+        # removing a file breaks the links to it in unchanged files.
+        self.break_links(output_dir)
+        self.assertEqual(
+            check_links(str(output_dir), ["en"]),
+            check_links(str(output_dir), ["en"], cache_dir=cache_dir),
+        )
+
+    def test_should_resolve_relative_and_rooted_links(self):
+        self.assertEqual("", resolve_link("om-oss/en/index.html", "../../"))
+        self.assertEqual("lim.jpeg", resolve_link("om-oss/en/index.html", "/lim.jpeg"))
+        self.assertEqual("a b.html", resolve_link("en/x.html", "../a%20b.html?q=1#f"))
+        self.assertEqual(OUTSIDE_SITE, resolve_link("index.html", "../x.html"))
+        self.assertIsNone(resolve_link("index.html", "mailto:someone@example.com"))
+        self.assertIsNone(resolve_link("index.html", "//cdn.example.com/x.js"))
+        self.assertEqual(
+            ["a.html", "b.png"],
+            find_links(
+                '<?php echo "<a href=\'c.html\'>"; ?><!-- <a href="d"> -->'
+                "<a href=a.html><IMG SRC='b.png'>"
+            ),
+        )
+
+    def test_command_should_run_without_warnings(self):
+        # runpy warns if the package has already imported the module.
+        result = subprocess.run(
+            [sys.executable, "-W", "error::RuntimeWarning", "-m", "pomosite.linkcheck"]
+            + ["--help"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.assertEqual(b"", result.stderr)
+        self.assertEqual(0, result.returncode)
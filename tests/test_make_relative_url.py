@@ -1,5 +1,5 @@
 import unittest
-from pomosite.templating import make_relative_url
+from pomosite.templating import make_relative_url, RelativeUrlCache
 
 
 class TestMakeRelativeUrl(unittest.TestCase):
@@ -26,3 +26,17 @@ class TestMakeRelativeUrl(unittest.TestCase):
     def test_should_map_child_to_sibling(self):
         self.assertEqual(make_relative_url("/x/y", "/x/z"), "z")
         self.assertEqual(make_relative_url("/x/y/", "/x/z/"), "../z/")
+
+
+class TestRelativeUrlCache(unittest.TestCase):
+    def test_should_map_like_make_relative_url(self):
+        cache = RelativeUrlCache(size=2)
+        pairs = [("/x/y/", "/x/z/"), ("/", "/x/y"), ("/x/y/", "/x/z/"), ("/x", "/")]
+        for from_endpoint, to_endpoint in pairs * 2:
+            self.assertEqual(
+                make_relative_url(from_endpoint, to_endpoint),
+                cache.get(from_endpoint, to_endpoint),
+            )
+        self.assertEqual(2, len(cache.urls))
+        self.assertEqual(8, cache.hits + cache.misses)
+        self.assertEqual(3, cache.hits)
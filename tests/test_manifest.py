@@ -0,0 +1,60 @@
+import hashlib
+import unittest
+from pathlib import Path
+import shutil
+from pomosite import generate, create_site_config, write_manifest_file
+
+content_path = Path(__file__).parent / "data/test_templating"
+work_dir = Path("temp/test_manifest")
+output_dir = str(work_dir / "output")
+
+
+class TestManifest(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        self.site_config = create_site_config(
+            str(content_path / "templates"), str(work_dir / "temp")
+        )
+        self.site_config["item_config"]["lim.jpeg"] = {
+            "endpoint": "/lim.jpeg",
+            "source": str(content_path / "resources/lim.jpeg"),
+        }
+        self.file_list = []
+        self.file_digests = {}
+        generate(
+            self.site_config, output_dir, self.file_list, file_digests=self.file_digests
+        )
+
+    def test_should_hash_outputs_while_writing_them(self):
+        self.assertEqual(sorted(self.file_list), sorted(self.file_digests))
+        for file_name, digest in self.file_digests.items():
+            expected = hashlib.sha256(Path(file_name).read_bytes()).hexdigest()
+            self.assertEqual(expected, digest)
+
+    def test_should_write_the_same_manifest_with_and_without_digests(self):
+        with_digests = work_dir / "with-digests.txt"
+        without_digests = work_dir / "without-digests.txt"
+        write_manifest_file(self.file_list, output_dir, with_digests, self.file_digests)
+        write_manifest_file(self.file_list, output_dir, without_digests)
+        self.assertEqual(with_digests.read_text(), without_digests.read_text())
+        index_file = str(Path(output_dir).resolve() / "index.html")
+        self.assertIn(
+            "/index.html;%s\n" % self.file_digests[index_file],
+            with_digests.read_text(),
+        )
+
+    def test_should_record_digests_of_skipped_outputs_in_incremental_builds(self):
+        incremental_dir = str(work_dir / "incremental")
+        generate(self.site_config, incremental_dir, incremental=True)
+        file_digests = {}
+        generate(
+            self.site_config,
+            incremental_dir,
+            incremental=True,
+            file_digests=file_digests,
+        )
+        self.assertEqual(
+            sorted(self.file_digests.values()), sorted(file_digests.values())
+        )
@@ -0,0 +1,114 @@
+import os
+import unittest
+from pathlib import Path
+import shutil
+
+from pomosite import generate
+from pomosite.minify import MinifyCache, minify_css, minify_html, minify_js
+
+from . import site_fixtures
+
+work_dir = Path("temp/test_minify")
+
+
+def shout(text):
+    return text.upper()
+
+
+class TestMinify(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        os.makedirs(str(work_dir))
+        (work_dir / "style.css").write_text("body {\n  margin: 0;\n}\n")
+
+    def create_site_config(self, name):
+        site_config = site_fixtures.create_site_config(work_dir, name, [])
+        site_config["item_config"]["style.css"] = {
+            "endpoint": "/style.css",
+            "source": str(work_dir / "style.css"),
+        }
+        return site_config
+
+    def test_should_minify_html(self):
+        self.assertEqual(
+            '<div class="a  b">\n<p>one two</p>\n</div>\n',
+            minify_html(
+                '  <div class="a  b">\n    <!-- comment -->\n'
+                "    <p>one   two</p>\n  </div>\n\n"
+            ),
+        )
+
+    def test_should_keep_pre_and_php_blocks_intact(self):
+        html = (
+            "<pre>\n  keep   this\n</pre>\n"
+            "<?php  if ($a  >  1) { ?>\n  <p>x   y</p>\n<?php  } ?>\n"
+            "<script>\n  var a  =  1;\n</script>\n"
+        )
+        self.assertEqual(
+            "<pre>\n  keep   this\n</pre>\n"
+            "<?php  if ($a  >  1) { ?>\n<p>x y</p>\n<?php  } ?>\n"
+            "<script>\n  var a  =  1;\n</script>\n",
+            minify_html(html),
+        )
+
+    def test_should_minify_css_and_js(self):
+        self.assertEqual(
+            '/*! license */ a>b,c{content:"  /* x */  ";margin:0 auto}\n',
+            minify_css(
+                "/*! license */\n/* comment */\na > b,\nc {\n"
+                '  content: "  /* x */  ";\n  margin: 0 auto;\n}\n'
+            ),
+        )
+        self.assertEqual(
+            'function f() {\nreturn "a \\\n  b";\n}\n',
+            minify_js('function f() {\n\n    return "a \\\n  b";\n}\n'),
+        )
+
+    def test_should_cache_by_content(self):
+        cache = MinifyCache(work_dir / "cache")
+        self.assertEqual(b"ABC", cache.minify(shout, b"abc"))
+        (cache_file,) = list((work_dir / "cache").glob("*/*"))
+        cache_file.write_bytes(b"cached")
+        self.assertEqual(b"cached", cache.minify(shout, b"abc"))
+        self.assertEqual(b"DEF", cache.minify(shout, b"def"))
+
+    def test_should_minify_pages_and_resources(self):
+        plain_dir = work_dir / "plain/output"
+        generate(self.create_site_config("plain"), str(plain_dir))
+        minified_dir = work_dir / "minified/output"
+        file_digests = {}
+        generate(
+            self.create_site_config("minified"),
+            str(minified_dir),
+            minify={".html": minify_html, ".css": shout},
+            file_digests=file_digests,
+        )
+        plain = (plain_dir / "index.html").read_text(encoding="utf-8")
+        minified = (minified_dir / "index.html").read_text(encoding="utf-8")
+        self.assertLess(len(minified), len(plain))
+        self.assertEqual(minify_html(plain), minified)
+        self.assertEqual(
+            (plain_dir / "script.php").read_bytes(),
+            (minified_dir / "script.php").read_bytes(),
+        )
+        self.assertEqual(
+            "BODY {\n  MARGIN: 0;\n}\n",
+            (minified_dir / "style.css").read_text(),
+        )
+        self.assertEqual(
+            (plain_dir / "lim.jpeg").read_bytes(),
+            (minified_dir / "lim.jpeg").read_bytes(),
+        )
+
+    def test_incremental_build_should_rerender_when_minification_is_turned_on(self):
+        output_dir = work_dir / "incremental/output"
+        site_config = self.create_site_config("incremental")
+        generate(site_config, str(output_dir), incremental=True)
+        plain = (output_dir / "index.html").read_text(encoding="utf-8")
+        generate(site_config, str(output_dir), incremental=True, minify=True)
+        self.assertEqual(
+            minify_html(plain),
+            (output_dir / "index.html").read_text(encoding="utf-8"),
+        )
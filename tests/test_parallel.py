@@ -0,0 +1,71 @@
+import unittest
+from pathlib import Path
+
+from pomosite import generate
+
+from .site_fixtures import create_site_config, prepare_work_dir
+
+work_dir = Path("temp/test_parallel")
+
+
+class TestParallel(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        prepare_work_dir(work_dir)
+
+    def test_should_produce_the_same_output_as_a_serial_build(self):
+        serial_dir = str(work_dir / "serial/output")
+        serial_files = []
+        generate(
+            create_site_config(work_dir, "serial", ["en", "de"]),
+            serial_dir,
+            serial_files,
+        )
+
+        parallel_dir = str(work_dir / "parallel/output")
+        parallel_files = []
+        generate(
+            create_site_config(work_dir, "parallel", ["en", "de"]),
+            parallel_dir,
+            parallel_files,
+            jobs=3,
+        )
+
+        self.assertEqual(
+            [
+                str(Path(f).relative_to(Path(serial_dir).resolve()))
+                for f in serial_files
+            ],
+            [
+                str(Path(f).relative_to(Path(parallel_dir).resolve()))
+                for f in parallel_files
+            ],
+        )
+        for serial_file, parallel_file in zip(serial_files, parallel_files):
+            self.assertEqual(
+                Path(serial_file).read_bytes(), Path(parallel_file).read_bytes()
+            )
+
+    def test_fast_translation_engine_should_produce_the_same_output(self):
+        po2html_dir = str(work_dir / "po2html/output")
+        po2html_files = []
+        generate(
+            create_site_config(work_dir, "po2html", ["en", "de"]),
+            po2html_dir,
+            po2html_files,
+        )
+
+        fast_dir = str(work_dir / "fast/output")
+        fast_files = []
+        generate(
+            create_site_config(work_dir, "fast", ["en", "de"]),
+            fast_dir,
+            fast_files,
+            translation_engine="fast",
+        )
+
+        self.assertTrue(Path(work_dir, "fast/temp/.cache/plans").is_dir())
+        for po2html_file, fast_file in zip(po2html_files, fast_files):
+            self.assertEqual(
+                Path(po2html_file).read_bytes(), Path(fast_file).read_bytes()
+            )
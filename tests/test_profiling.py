@@ -0,0 +1,105 @@
+import json
+import os
+import unittest
+from pathlib import Path
+import tracemalloc
+
+from pomosite import generate, write_manifest_file, BuildProfile
+from pomosite import profiling
+
+from .site_fixtures import content_path, create_site_config, prepare_work_dir
+
+work_dir = Path("temp/test_profiling")
+
+
+class TestProfiling(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        prepare_work_dir(work_dir)
+
+    def build(self, name, **generate_args):
+        output_dir = str(work_dir / name / "output")
+        profile = BuildProfile(trace_memory=True)
+        file_list = []
+        generate(
+            create_site_config(work_dir, name),
+            output_dir,
+            file_list,
+            profile=profile,
+            **generate_args
+        )
+        write_manifest_file(
+            file_list, output_dir, str(work_dir / name / "site.txt"), profile=profile
+        )
+        return profile
+
+    def test_should_summarize_phases_and_templates(self):
+        profile = self.build("serial")
+        summary = profile.summary()
+        self.assertEqual(
+            {
+                "validate_config",
+                "image_derivatives",
+                "copy_resources",
+                "generate_pages",
+                "translate",
+                "render",
+                "save_build_state",
+                "write_manifest_file",
+            },
+            summary["phases"].keys(),
+        )
+        self.assertEqual(
+            {"start.html", "om-oss.html", "script.php"}, summary["templates"].keys()
+        )
+        self.assertEqual(2, summary["templates"]["start.html"]["count"])
+        self.assertEqual(6, summary["counters"]["pages_rendered"])
+        self.assertEqual(1, summary["counters"]["resources_copied"])
+        self.assertEqual(
+            os.path.getsize(str(content_path / "resources/lim.jpeg")),
+            summary["counters"]["resource_bytes_written"],
+        )
+        self.assertGreater(summary["counters"]["url_for_calls"], 0)
+        self.assertGreater(summary["memory_peaks"]["render"], 0)
+
+    def test_should_collect_render_spans_from_worker_processes(self):
+        profile = self.build("parallel", jobs=2)
+        render_spans = [span for span in profile.spans if span["category"] == "render"]
+        self.assertEqual(6, len(render_spans))
+        self.assertNotIn(os.getpid(), {span["pid"] for span in render_spans})
+
+    def test_should_write_a_chrome_trace(self):
+        profile = self.build("trace")
+        trace_path = work_dir / "trace" / "trace.json"
+        profile.write_chrome_trace(str(trace_path))
+        profile.write_summary(str(work_dir / "trace" / "profile.json"))
+        events = json.loads(trace_path.read_text(encoding="utf-8"))["traceEvents"]
+        self.assertEqual(len(profile.spans), len(events))
+        for event in events:
+            self.assertEqual("X", event["ph"])
+            self.assertGreaterEqual(event["ts"], 0)
+            self.assertGreaterEqual(event["dur"], 0)
+        self.assertIn(
+            {"template": "start.html", "language": "en"},
+            [event["args"] for event in events if event["name"] == "START"],
+        )
+
+    def test_should_keep_the_memory_peaks_of_enclosing_phases(self):
+        profile = BuildProfile(trace_memory=True)
+        size = 1 << 24
+        with profile.span("outer"):
+            data = bytearray(size)
+            del data
+            with profile.span("inner"):
+                pass
+        self.assertGreaterEqual(profile.memory_peaks["outer"], size)
+        self.assertLess(profile.memory_peaks["inner"], size)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_should_estimate_memory_peaks_without_reset_peak(self):
+        reset_peak = profiling.RESET_PEAK
+        profiling.RESET_PEAK = False
+        try:
+            self.test_should_keep_the_memory_peaks_of_enclosing_phases()
+        finally:
+            profiling.RESET_PEAK = reset_peak
@@ -0,0 +1,140 @@
+import gzip
+import json
+import os
+import unittest
+from pathlib import Path
+import shutil
+
+from pomosite import (
+    generate,
+    add_search_index,
+    BuildProfile,
+    ConfigurationError,
+    MemorySink,
+    TarSink,
+)
+from pomosite.search import extract_text, get_shard_name, tokenize
+
+from . import site_fixtures
+from .site_fixtures import content_path, write_dummy_translation
+
+work_dir = Path("temp/test_search_index")
+template_dir = work_dir / "templates"
+
+
+class TestSearchIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        shutil.copytree(str(content_path / "templates"), str(template_dir))
+        (template_dir / "search.html").write_text(
+            "<html><head><title>Sök</title></head><body>"
+            "<p>Sök efter lim</p><script>"
+            "var index = \"{{url_for('SEARCH_INDEX')}}\";</script></body></html>",
+            encoding="utf-8",
+        )
+        write_dummy_translation(work_dir, template_dir)
+
+    def create_site_config(self, name):
+        site_config = site_fixtures.create_site_config(
+            work_dir, name, template_dir=template_dir
+        )
+        site_config["item_config"]["SEARCH"] = {
+            "endpoint": "/search/",
+            "template": "search.html",
+            "search": False,
+        }
+        add_search_index(site_config)
+        return site_config
+
+    def read_json(self, path):
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+
+    def test_should_write_a_sharded_index_per_language(self):
+        output_dir = work_dir / "sharded/output"
+        file_list = []
+        generate(self.create_site_config("sharded"), str(output_dir), file_list)
+        manifest = self.read_json(output_dir / "search/index.json")
+        self.assertEqual(2, manifest["prefix_length"])
+        self.assertEqual({"", "en"}, manifest["languages"].keys())
+        self.assertEqual("en/_docs.json", manifest["languages"]["en"]["docs"])
+        docs = self.read_json(output_dir / "search/default/_docs.json")
+        self.assertEqual(
+            [["/", "Mycket lim"], ["/om-oss/", "Om oss - Mycket lim"]],
+            docs,
+        )
+        self.assertEqual(
+            ["/en/", "/om-oss/en/"],
+            [url for url, _ in self.read_json(output_dir / "search/en/_docs.json")],
+        )
+        shard = self.read_json(output_dir / "search/default/he.json")
+        self.assertEqual([[0, 1]], shard["herakles"])
+        for name in manifest["languages"][""]["shards"]:
+            path = output_dir / "search/default" / (name + ".json")
+            self.assertIn(str(path.resolve()), file_list)
+        self.assertIn(
+            'var index = "index.json";',
+            (output_dir / "search/index.html").read_text(encoding="utf-8"),
+        )
+
+    def test_should_write_gzip_sidecars_of_the_index_files(self):
+        output_dir = work_dir / "gzip/output"
+        file_list = []
+        generate(
+            self.create_site_config("gzip"),
+            str(output_dir),
+            file_list,
+            gzip_sidecars=True,
+            gzip_min_size=0,
+        )
+        index_paths = list((output_dir / "search").glob("**/*.json"))
+        self.assertIn(output_dir / "search/index.json", index_paths)
+        for path in index_paths:
+            sidecar_path = path.with_name(path.name + ".gz")
+            self.assertIn(str(sidecar_path.resolve()), file_list)
+            self.assertEqual(
+                path.read_bytes(), gzip.decompress(sidecar_path.read_bytes())
+            )
+
+    def test_should_only_tokenize_changed_pages(self):
+        output_dir = work_dir / "incremental/output"
+
+        def build(site_config):
+            profile = BuildProfile()
+            generate(site_config, str(output_dir), incremental=True, profile=profile)
+            return profile.summary()["counters"].get("search_pages_indexed", 0)
+
+        site_config = self.create_site_config("incremental")
+        self.assertEqual(4, build(site_config))
+        manifest_mtime = os.stat(str(output_dir / "search/index.json")).st_mtime_ns
+        self.assertEqual(0, build(site_config))
+        self.assertEqual(
+            manifest_mtime,
+            os.stat(str(output_dir / "search/index.json")).st_mtime_ns,
+        )
+        site_config = self.create_site_config("incremental")
+        del site_config["item_config"]["SEARCH"]["search"]
+        self.assertEqual(2, build(site_config))
+        docs = self.read_json(output_dir / "search/default/_docs.json")
+        self.assertEqual(["/", "/om-oss/", "/search/"], [url for url, _ in docs])
+
+    def test_should_build_the_index_in_memory(self):
+        sink = MemorySink()
+        generate(self.create_site_config("memory"), sink)
+        self.assertIn("search/default/he.json", sink.files)
+        self.assertIn("search/en/_docs.json", sink.files)
+        with self.assertRaises(ConfigurationError):
+            with TarSink(work_dir / "site.tar.gz") as sink:
+                generate(self.create_site_config("tar"), sink)
+
+    def test_should_extract_the_text_of_a_page(self):
+        title, text = extract_text(
+            "<html><head><title>A &amp; B</title><style>p {}</style></head>"
+            "<body><!-- hidden --><p>Hello <b>wörld</b></p><?php echo 'x'; ?>"
+            "<script>var y;</script></body></html>"
+        )
+        self.assertEqual("A & B", title)
+        self.assertEqual({"hello": 1, "wörld": 1}, tokenize(text))
+        self.assertEqual("wo", get_shard_name("wonder", 2))
+        self.assertEqual("_77c3b6", get_shard_name("wörld", 2))
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import unittest
+from unittest import mock
+from pathlib import Path
+import tarfile
+import zipfile
+import jinja2
+from pomosite import (
+    generate,
+    write_manifest_file,
+    ConfigurationError,
+    MemorySink,
+    TarSink,
+    ZipSink,
+)
+from pomosite.sinks import DirectorySink, STREAM_BUFFER_SIZE
+from pomosite.templating import encode_chunks
+
+from .site_fixtures import create_site_config, prepare_work_dir
+
+work_dir = Path("temp/test_sinks")
+output_dir = work_dir / "output"
+
+
+class TestSinks(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        prepare_work_dir(work_dir)
+
+        # the reference: a build to a directory.
+        file_list = []
+        generate(create_site_config(work_dir), str(output_dir), file_list)
+        self.expected = {
+            str(Path(f).relative_to(output_dir.resolve()).as_posix()): Path(
+                f
+            ).read_bytes()
+            for f in file_list
+        }
+        manifest_path = work_dir / "manifest.txt"
+        write_manifest_file(file_list, str(output_dir), manifest_path)
+        self.expected_manifest = manifest_path.read_bytes()
+
+    def test_should_build_to_memory(self):
+        sink = MemorySink()
+        file_list = []
+        generate(create_site_config(work_dir), sink, file_list)
+        self.assertEqual(self.expected, sink.files)
+        self.assertEqual(sorted(self.expected), sorted(file_list))
+
+    def test_should_build_to_memory_in_parallel(self):
+        sink = MemorySink()
+        generate(create_site_config(work_dir), sink, jobs=2)
+        self.assertEqual(self.expected, sink.files)
+
+    def test_should_stream_to_a_tar_archive(self):
+        archive_path = work_dir / "site.tar.gz"
+        with TarSink(archive_path) as sink:
+            generate(create_site_config(work_dir), sink)
+            sink.write_manifest()
+        with tarfile.open(str(archive_path)) as tar:
+            files = {
+                member.name: tar.extractfile(member).read()
+                for member in tar.getmembers()
+            }
+        self.assertEqual(self.expected_manifest, files.pop(".site.txt"))
+        self.assertEqual(self.expected, files)
+
+    def test_should_stream_to_a_zip_archive(self):
+        archive_path = work_dir / "site.zip"
+        with ZipSink(archive_path) as sink:
+            generate(create_site_config(work_dir), sink)
+            sink.write_manifest()
+        with zipfile.ZipFile(str(archive_path)) as zip:
+            files = {name: zip.read(name) for name in zip.namelist()}
+        self.assertEqual(self.expected_manifest, files.pop(".site.txt"))
+        self.assertEqual(self.expected, files)
+
+    def test_incremental_builds_should_require_an_output_directory(self):
+        with self.assertRaises(ConfigurationError):
+            generate(create_site_config(work_dir), MemorySink(), incremental=True)
+
+    def test_should_stream_large_pages_in_bounded_chunks(self):
+        template_dir = work_dir / "large/templates"
+        template_dir.mkdir(parents=True)
+        (template_dir / "list.html").write_text(
+            "{% for i in range(20000) %}<li>item {{i}} \u00e5\u00e4\u00f6</li>\n"
+            "{% endfor %}",
+            encoding="utf-8",
+        )
+        site_config = {
+            "item_config": {"LIST": {"endpoint": "/", "template": "list.html"}},
+            "template_dir": str(template_dir),
+        }
+        chunk_sizes = []
+        write_stream = DirectorySink.write_stream
+
+        def recording_write_stream(sink, key, chunks):
+            def record(chunks):
+                for chunk in chunks:
+                    chunk_sizes.append(len(chunk))
+                    yield chunk
+
+            return write_stream(sink, key, record(chunks))
+
+        memory_sink = MemorySink()
+        generate(site_config, memory_sink)
+        large_output_dir = work_dir / "large/output"
+        file_digests = {}
+        with mock.patch.object(DirectorySink, "write_stream", recording_write_stream):
+            generate(site_config, str(large_output_dir), file_digests=file_digests)
+        page = (large_output_dir / "index.html").read_bytes()
+        self.assertEqual(memory_sink.files["index.html"], page)
+        self.assertEqual(
+            hashlib.sha256(page).hexdigest(),
+            file_digests[str((large_output_dir / "index.html").resolve())],
+        )
+        self.assertGreater(len(chunk_sizes), 1)
+        self.assertEqual(len(page), sum(chunk_sizes))
+        self.assertLess(max(chunk_sizes), 2 * STREAM_BUFFER_SIZE)
+
+    def test_should_keep_the_previous_page_when_a_render_fails(self):
+        page_template = "{% for i in range(20000) %}<li>item {{i}}</li>\n{% endfor %}"
+        site_config = {
+            "item_config": {"LIST": {"endpoint": "/", "template": "list.html"}}
+        }
+        for name, template in [
+            ("good", page_template),
+            ("bad", page_template + "{{ missing.attribute }}"),
+        ]:
+            template_dir = work_dir / "failed" / name
+            template_dir.mkdir(parents=True)
+            (template_dir / "list.html").write_text(template, encoding="utf-8")
+        failed_output_dir = work_dir / "failed/output"
+        site_config["template_dir"] = str(work_dir / "failed/good")
+        generate(site_config, str(failed_output_dir))
+        page = (failed_output_dir / "index.html").read_bytes()
+        site_config["template_dir"] = str(work_dir / "failed/bad")
+        with self.assertRaises(jinja2.UndefinedError):
+            generate(site_config, str(failed_output_dir))
+        self.assertEqual(page, (failed_output_dir / "index.html").read_bytes())
+        self.assertEqual(["index.html"], sorted(os.listdir(str(failed_output_dir))))
+
+    def test_should_encode_chunks_across_string_boundaries(self):
+        strings = ["\u00e5" * 10, "a", "", "\u00f6" * 3]
+        chunks = list(encode_chunks(strings, buffer_size=4))
+        self.assertEqual(2, len(chunks))
+        self.assertEqual("".join(strings).encode("utf-8"), b"".join(chunks))
+        self.assertEqual([], list(encode_chunks([])))
@@ -0,0 +1,61 @@
+import os
+import unittest
+from pathlib import Path
+import shutil
+from pomosite import create_site_config, generate
+from pomosite.config import get_page_config_cache_path
+
+content_path = Path(__file__).parent / "data/test_templating"
+work_dir = Path("temp/test_site_config")
+template_dir = work_dir / "templates"
+temp_dir = str(work_dir / "temp")
+
+
+class TestSiteConfig(unittest.TestCase):
+    def setUp(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        shutil.copytree(str(content_path / "templates"), str(template_dir))
+
+    def test_should_find_the_same_items_with_and_without_the_cache(self):
+        uncached = create_site_config(str(template_dir), None)
+        cold = create_site_config(str(template_dir), temp_dir)
+        self.assertTrue(get_page_config_cache_path(template_dir, temp_dir).exists())
+        warm = create_site_config(str(template_dir), temp_dir)
+        self.assertEqual(uncached["item_config"], cold["item_config"])
+        self.assertEqual(uncached["item_config"], warm["item_config"])
+        self.assertEqual(3, len(warm["item_config"]))
+
+    def test_should_pick_up_modified_headers(self):
+        create_site_config(str(template_dir), temp_dir)
+        page = template_dir / "p1.html"
+        page.write_text(
+            page.read_text().replace('endpoint: "/"', 'endpoint: "/start/"')
+        )
+        site_config = create_site_config(str(template_dir), temp_dir)
+        self.assertEqual("/start/", site_config["item_config"]["P1"]["endpoint"])
+
+    def test_should_accept_any_line_ending_after_the_header(self):
+        page = template_dir / "crlf.html"
+        page.write_bytes(b'{# id: "CRLF", endpoint: "/crlf/" #}\r\n<p>x</p>\r\n')
+        site_config = create_site_config(str(template_dir), temp_dir)
+        self.assertEqual("/crlf/", site_config["item_config"]["CRLF"]["endpoint"])
+
+    def test_should_find_templates_in_subdirectories_if_recursive(self):
+        os.makedirs(str(template_dir / "blog"))
+        (template_dir / "blog/post.html").write_text(
+            '{# id: "POST", endpoint: "/blog/post/" #}\n'
+            "<a href=\"{{ url_for('P1') }}\">start</a>\n"
+        )
+        self.assertNotIn(
+            "POST", create_site_config(str(template_dir), temp_dir)["item_config"]
+        )
+        site_config = create_site_config(str(template_dir), temp_dir, recursive=True)
+        self.assertEqual(
+            "blog/post.html", site_config["item_config"]["POST"]["template"]
+        )
+        output_dir = work_dir / "output"
+        generate(site_config, str(output_dir))
+        self.assertIn(
+            'href="../../"', (output_dir / "blog/post/index.html").read_text()
+        )
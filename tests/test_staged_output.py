@@ -0,0 +1,96 @@
+import os
+import unittest
+from unittest import mock
+from pathlib import Path
+
+from pomosite import (
+    generate,
+    write_manifest_file,
+    ConfigurationError,
+    MemorySink,
+)
+from pomosite import templating
+
+from .site_fixtures import create_site_config, prepare_work_dir
+
+work_dir = Path("temp/test_staged_output")
+
+
+class TestStagedOutput(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        prepare_work_dir(work_dir)
+
+    def build(self, name, site_config=None, **generate_args):
+        output_dir = work_dir / name / "output"
+        file_list = []
+        generate(
+            site_config or create_site_config(work_dir, name),
+            str(output_dir),
+            file_list,
+            staged=True,
+            **generate_args
+        )
+        write_manifest_file(
+            file_list, str(output_dir), str(work_dir / name / "site.txt")
+        )
+        return output_dir, file_list
+
+    def test_should_swap_in_the_staged_output(self):
+        output_dir, file_list = self.build("swap")
+        stale_path = output_dir / "stale.html"
+        stale_path.write_text("stale", encoding="utf-8")
+        output_dir, file_list = self.build("swap")
+        self.assertFalse(stale_path.exists())
+        self.assertFalse((work_dir / "swap" / "output.staging").exists())
+        self.assertIn(str((output_dir / "index.html").resolve()), file_list)
+        for path in file_list:
+            self.assertTrue(os.path.isfile(path), path)
+
+    def test_should_link_unchanged_outputs(self):
+        output_dir, _ = self.build("link")
+        inodes = {
+            key: os.stat(str(output_dir / key)).st_ino
+            for key in ["index.html", "om-oss/index.html", "lim.jpeg"]
+        }
+        site_config = create_site_config(work_dir, "link")
+        site_config["item_config"]["START"]["template"] = "om-oss.html"
+        self.build("link", site_config)
+        self.assertEqual(
+            inodes["om-oss/index.html"],
+            os.stat(str(output_dir / "om-oss/index.html")).st_ino,
+        )
+        self.assertEqual(
+            inodes["lim.jpeg"], os.stat(str(output_dir / "lim.jpeg")).st_ino
+        )
+        self.assertNotEqual(
+            inodes["index.html"], os.stat(str(output_dir / "index.html")).st_ino
+        )
+
+    def test_should_keep_the_output_if_the_build_fails(self):
+        output_dir, _ = self.build("fail")
+        page = (output_dir / "index.html").read_bytes()
+        with mock.patch.object(
+            templating,
+            "generate_pages_from_templates",
+            side_effect=RuntimeError("failed"),
+        ):
+            with self.assertRaises(RuntimeError):
+                self.build("fail")
+        self.assertEqual(page, (output_dir / "index.html").read_bytes())
+        self.assertFalse((work_dir / "fail" / "output.staging").exists())
+
+    def test_should_support_incremental_builds(self):
+        output_dir, _ = self.build("incremental", incremental=True)
+        inode = os.stat(str(output_dir / "index.html")).st_ino
+        output_dir, file_list = self.build(
+            "incremental", incremental=True, gzip_sidecars=True, gzip_min_size=0
+        )
+        self.assertEqual(inode, os.stat(str(output_dir / "index.html")).st_ino)
+        self.assertTrue((output_dir / "index.html.gz").is_file())
+        for path in file_list:
+            self.assertTrue(os.path.isfile(path), path)
+
+    def test_should_require_an_output_directory(self):
+        with self.assertRaises(ConfigurationError):
+            generate(create_site_config(work_dir, "memory"), MemorySink(), staged=True)
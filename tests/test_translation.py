@@ -0,0 +1,149 @@
+import os
+import unittest
+from unittest import mock
+from pathlib import Path
+import shutil
+from translate.storage import po
+from translate.convert.po2html import po2html
+
+from pomosite import translation
+from pomosite.translation import (
+    extract_translation_units,
+    generate_dummy_translation,
+    load_catalog,
+    plan_template,
+    translate_page_templates,
+)
+
+content_path = Path(__file__).parent / "data/test_multilingual"
+work_dir = Path("temp/test_translation")
+po_file_path = str(work_dir / "dummy.po")
+cache_dir = str(work_dir / "cache")
+
+
+class TestTranslation(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        os.makedirs(str(work_dir))
+        pot_file_path = str(work_dir / "test_translation.pot")
+        extract_translation_units(str(content_path / "templates"), pot_file_path)
+        generate_dummy_translation(pot_file_path, po_file_path)
+
+    def setUp(self):
+        translation._catalogs.clear()
+        translation._template_plans.clear()
+
+    def test_should_load_the_same_catalog_from_the_cache(self):
+        parsed = load_catalog(po_file_path, cache_dir)
+        self.assertEqual(1, len(list(Path(cache_dir, "catalogs").glob("*.pickle"))))
+
+        translation._catalogs.clear()
+        cached = load_catalog(po_file_path, cache_dir)
+        self.assertIsNot(parsed, cached)
+        self.assertEqual(dict(parsed.sourceindex), dict(cached.sourceindex))
+
+    def test_should_reuse_catalogs_within_the_process(self):
+        self.assertIs(load_catalog(po_file_path), load_catalog(po_file_path))
+
+    def test_catalog_should_translate_like_the_po_file(self):
+        with open(po_file_path, "rb") as f:
+            store = po.pofile(f)
+        catalog = load_catalog(po_file_path)
+        for unit in store.units[1:]:
+            (catalog_unit,) = catalog.sourceindex.get(unit.source)
+            self.assertEqual(unit.target, catalog_unit.target)
+            self.assertEqual(unit.istranslated(), catalog_unit.istranslated())
+
+    def test_should_reuse_cached_translations(self):
+        source_dir = str(content_path / "templates")
+        destination_dir = work_dir / "translated"
+        tampered_cache_dir = str(work_dir / "tampered-cache")
+        translate_page_templates(
+            source_dir, po_file_path, destination_dir, tampered_cache_dir
+        )
+        cache_files = list(Path(tampered_cache_dir, "translations").glob("*/*"))
+        self.assertEqual(3, len(cache_files))
+
+        # tamper with the cache to tell whether it is used.
+        for cache_file in cache_files:
+            cache_file.write_bytes(b"cached")
+        (destination_dir / "start.html").unlink()
+        translate_page_templates(
+            source_dir, po_file_path, destination_dir, tampered_cache_dir
+        )
+        self.assertEqual(b"cached", (destination_dir / "start.html").read_bytes())
+
+    def test_should_leave_unchanged_translations_untouched(self):
+        source_dir = str(content_path / "templates")
+        destination_dir = work_dir / "untouched"
+        translate_page_templates(source_dir, po_file_path, destination_dir)
+        output_file = destination_dir / "start.html"
+        os.utime(str(output_file), ns=(0, 0))
+        translate_page_templates(source_dir, po_file_path, destination_dir)
+        self.assertEqual(0, output_file.stat().st_mtime_ns)
+
+    def test_should_translate_like_po2html(self):
+        source_dir = str(content_path / "templates")
+        destination_dir = work_dir / "like-po2html"
+        translate_page_templates(source_dir, po_file_path, destination_dir, cache_dir)
+        with open(po_file_path, "rb") as f:
+            store = po.pofile(f)
+        for file in Path(source_dir).glob("*.html"):
+            with open(file, "rb") as templatefile:
+                expected = po2html().mergestore(store, templatefile, includefuzzy=False)
+            self.assertEqual(
+                expected, (destination_dir / file.name).read_text(encoding="utf-8")
+            )
+
+    def test_fast_engine_should_translate_like_po2html(self):
+        source_dir = str(content_path / "templates")
+        po2html_dir = work_dir / "engine-po2html"
+        fast_dir = work_dir / "engine-fast"
+        translate_page_templates(source_dir, po_file_path, po2html_dir)
+        translate_page_templates(
+            source_dir, po_file_path, fast_dir, cache_dir, engine="fast"
+        )
+        for file in Path(source_dir).glob("*"):
+            self.assertEqual(
+                (po2html_dir / file.name).read_bytes(),
+                (fast_dir / file.name).read_bytes(),
+            )
+        self.assertEqual(3, len(list(Path(cache_dir, "plans").glob("*/*"))))
+
+    def test_fast_engine_should_fall_back_for_templates_it_cannot_plan(self):
+        template = b'<html lang="sv"><head><meta property="og:locale" content="sv_SE"></head></html>'
+        self.assertIsNone(plan_template("og.html", template))
+
+    def test_fast_engine_should_fall_back_without_planner_support(self):
+        self.assertTrue(translation.has_planner_support())
+        source_dir = str(content_path / "templates")
+        po2html_dir = work_dir / "unsupported-po2html"
+        fast_dir = work_dir / "unsupported-fast"
+        unsupported_cache_dir = work_dir / "unsupported-cache"
+        translate_page_templates(source_dir, po_file_path, po2html_dir)
+        with mock.patch.object(translation, "PLANNER_SUPPORTED", False):
+            translate_page_templates(
+                source_dir, po_file_path, fast_dir, unsupported_cache_dir, engine="fast"
+            )
+        for file in Path(source_dir).glob("*"):
+            self.assertEqual(
+                (po2html_dir / file.name).read_bytes(),
+                (fast_dir / file.name).read_bytes(),
+            )
+        self.assertFalse((unsupported_cache_dir / "plans").exists())
+
+    def test_should_translate_templates_in_subdirectories(self):
+        source_dir = work_dir / "nested"
+        shutil.copytree(str(content_path / "templates"), str(source_dir / "sub"))
+        flat_dir = work_dir / "flat"
+        nested_dir = work_dir / "nested-translated"
+        translate_page_templates(
+            str(content_path / "templates"), po_file_path, flat_dir
+        )
+        translate_page_templates(str(source_dir), po_file_path, nested_dir)
+        for file in flat_dir.glob("*"):
+            self.assertEqual(
+                file.read_bytes(), (nested_dir / "sub" / file.name).read_bytes()
+            )
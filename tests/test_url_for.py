@@ -154,3 +154,24 @@ class TestUrlFor(unittest.TestCase):
         hrefs = self.get_hrefs(output_file)
         item_config = site_config["item_config"]
         self.assertEqual(hrefs[0], item_config["PAGE"]["endpoint"])
+
+    def test_should_count_url_for_calls(self):
+        site_config = {
+            "item_config": {
+                "P1": {
+                    "endpoint": "/",
+                    "template": "p1.html",
+                },
+                "P2": {
+                    "endpoint": "/subpage/",
+                    "template": "p1.html",
+                },
+            },
+            "template_dir": content_path + "/templates",
+        }
+        url_stats = {}
+        generate(site_config, output_dir, url_stats=url_stats)
+        self.assertEqual(2, url_stats["url_for_calls"])
+        self.assertEqual(
+            2, url_stats["relative_url_hits"] + url_stats["relative_url_misses"]
+        )
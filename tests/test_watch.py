@@ -0,0 +1,88 @@
+import os
+import unittest
+from pathlib import Path
+import shutil
+import threading
+import time
+import urllib.request
+from pomosite import create_site_config
+from pomosite.watch import (
+    InotifyWatcher,
+    PollingWatcher,
+    get_watched_paths,
+    start_preview_server,
+    watch,
+)
+
+content_path = Path(__file__).parent / "data/test_templating"
+work_dir = Path("temp/test_watch")
+template_dir = work_dir / "templates"
+output_dir = work_dir / "output"
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        if work_dir.exists():
+            shutil.rmtree(str(work_dir))
+        shutil.copytree(str(content_path / "templates"), str(template_dir))
+
+    def configure(self):
+        return create_site_config(str(template_dir), str(work_dir / "temp"))
+
+    def check_watcher(self, watcher):
+        directories, files = get_watched_paths(self.configure())
+        watcher.update(directories, files)
+        self.assertEqual(set(), watcher.wait(timeout=0.1))
+        header = template_dir / "header.html"
+        header.write_text("<p>changed</p>\n")
+        self.assertIn(header.resolve(), watcher.wait(timeout=5))
+        watcher.close()
+
+    def test_polling_watcher_should_report_changed_files(self):
+        self.check_watcher(PollingWatcher(interval=0.02))
+
+    def test_inotify_watcher_should_report_changed_files(self):
+        try:
+            watcher = InotifyWatcher()
+        except (OSError, AttributeError):
+            self.skipTest("inotify is not available")
+        self.check_watcher(watcher)
+
+    def test_should_serve_the_output_directory(self):
+        os.makedirs(str(output_dir))
+        (output_dir / "index.html").write_text("hello")
+        server = start_preview_server(output_dir, port=0)
+        try:
+            url = "http://%s:%d/index.html" % server.server_address[:2]
+            with urllib.request.urlopen(url) as response:
+                self.assertEqual(b"hello", response.read())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_should_rebuild_when_a_template_changes(self):
+        stop_event = threading.Event()
+        thread = threading.Thread(
+            target=watch,
+            args=(self.configure, output_dir),
+            kwargs={"port": 0, "poll_interval": 0.02, "stop_event": stop_event},
+        )
+        thread.start()
+        try:
+            page = output_dir / "index.html"
+            self.assertTrue(wait_for(page.exists))
+            header = template_dir / "header.html"
+            header.write_text(header.read_text() + "<p>changed</p>\n")
+            self.assertTrue(wait_for(lambda: "changed" in page.read_text()))
+        finally:
+            stop_event.set()
+            thread.join()